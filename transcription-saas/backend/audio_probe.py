@@ -0,0 +1,283 @@
+import os
+import struct
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+# How far into the file to look for the first MP3 frame, and how much of
+# the tail to search for the last Ogg page
+MP3_SYNC_SEARCH_BYTES = 64 * 1024
+OGG_TAIL_BYTES = 64 * 1024
+
+class AudioProbeError(ValueError):
+    """Raised when a file is not a supported audio container or its headers are corrupt"""
+
+class AudioInfo:
+    """Container-level facts about an audio file, read without decoding it"""
+
+    def __init__(self, format: str, duration: float, sample_rate: int, channels: int):
+        self.format = format
+        self.duration = duration  # in seconds
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+def probe_audio(file_path: str) -> AudioInfo:
+    """Read duration, sample rate and channel count from the container
+    headers of a WAV, MP3, M4A/MP4, Ogg (Vorbis/Opus) or FLAC file.
+
+    Only headers are read (plus the last Ogg page), so the cost does not
+    grow with the length of the recording.
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, "rb") as f:
+        head = f.read(12)
+        f.seek(0)
+        try:
+            if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+                info = _probe_wav(f, file_size)
+            elif head[4:8] == b"ftyp":
+                info = _probe_mp4(f, file_size)
+            elif head[:4] == b"OggS":
+                info = _probe_ogg(f, file_size)
+            else:
+                start = _skip_id3v2(f)
+                f.seek(start)
+                magic = f.read(4)
+                if magic == b"fLaC":
+                    info = _probe_flac(f)
+                else:
+                    info = _probe_mp3(f, file_size, start)
+        except (struct.error, IndexError):
+            raise AudioProbeError("truncated audio header")
+
+    if info.duration <= 0 or info.sample_rate <= 0 or info.channels <= 0:
+        raise AudioProbeError("file contains no audio")
+    return info
+
+def _probe_wav(f: BinaryIO, file_size: int) -> AudioInfo:
+    f.seek(12)
+    fmt = None
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            raise AudioProbeError("WAV file has no data chunk")
+        chunk_id, size = struct.unpack("<4sI", header)
+        if chunk_id == b"fmt ":
+            body = f.read(size)
+            _, channels, sample_rate, byte_rate = struct.unpack("<HHII", body[:12])
+            if byte_rate == 0:
+                raise AudioProbeError("WAV header has a zero byte rate")
+            fmt = (channels, sample_rate, byte_rate)
+            f.seek(size & 1, 1)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise AudioProbeError("WAV data chunk precedes its format chunk")
+            # Streaming writers leave the size at 0 or 0xFFFFFFFF; trust the file
+            size = min(size, file_size - f.tell()) if size else file_size - f.tell()
+            channels, sample_rate, byte_rate = fmt
+            return AudioInfo("wav", size / byte_rate, sample_rate, channels)
+        else:
+            f.seek(size + (size & 1), 1)
+
+def _skip_id3v2(f: BinaryIO) -> int:
+    """Offset of the first byte after any leading ID3v2 tags"""
+    offset = 0
+    while True:
+        f.seek(offset)
+        header = f.read(10)
+        if len(header) < 10 or header[:3] != b"ID3":
+            return offset
+        size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+        footer = 10 if header[5] & 0x10 else 0
+        offset += 10 + size + footer
+
+def _probe_flac(f: BinaryIO) -> AudioInfo:
+    block_header = f.read(4)
+    if len(block_header) < 4 or block_header[0] & 0x7F != 0:
+        raise AudioProbeError("FLAC stream has no STREAMINFO block")
+    streaminfo = f.read(34)
+    bits, = struct.unpack(">Q", streaminfo[10:18])
+    sample_rate = bits >> 44
+    channels = ((bits >> 41) & 0x7) + 1
+    total_samples = bits & 0xFFFFFFFFF
+    if not sample_rate or not total_samples:
+        raise AudioProbeError("FLAC stream length is unknown")
+    return AudioInfo("flac", total_samples / sample_rate, sample_rate, channels)
+
+def _probe_ogg(f: BinaryIO, file_size: int) -> AudioInfo:
+    page = f.read(4096)
+    if len(page) < 27:
+        raise AudioProbeError("truncated Ogg page")
+    segments = page[26]
+    packet = page[27 + segments:]
+    if packet[:7] == b"\x01vorbis":
+        channels = packet[11]
+        sample_rate, = struct.unpack("<I", packet[12:16])
+        granule_rate, pre_skip, codec = sample_rate, 0, "vorbis"
+    elif packet[:8] == b"OpusHead":
+        channels = packet[9]
+        pre_skip, sample_rate = struct.unpack("<HI", packet[10:16])
+        # Opus granule positions always count 48kHz samples
+        granule_rate, codec = 48000, "opus"
+    else:
+        raise AudioProbeError("unsupported Ogg codec")
+
+    f.seek(max(0, file_size - OGG_TAIL_BYTES))
+    tail = f.read()
+    end = len(tail)
+    while True:
+        i = tail.rfind(b"OggS", 0, end)
+        if i < 0 or i + 14 > len(tail):
+            raise AudioProbeError("Ogg stream has no final page")
+        granule, = struct.unpack("<q", tail[i + 6:i + 14])
+        if granule >= 0:
+            break
+        end = i
+    return AudioInfo(f"ogg/{codec}", (granule - pre_skip) / granule_rate, sample_rate or granule_rate, channels)
+
+def _mp4_boxes(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """Yield (type, body_start, body_end) for the boxes between two offsets"""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, box_type = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size, = struct.unpack(">Q", f.read(8))
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            raise AudioProbeError("MP4 box overruns its container")
+        yield box_type, offset + header, offset + size
+        offset += size
+
+def _read_timescale(f: BinaryIO, body_start: int) -> Tuple[int, int]:
+    """(timescale, duration) from an mvhd or mdhd box"""
+    f.seek(body_start)
+    full_box = f.read(4)
+    if len(full_box) < 4:
+        raise AudioProbeError("truncated MP4 time header")
+    version = full_box[0]
+    if version == 1:
+        _, _, timescale, duration = struct.unpack(">QQIQ", f.read(28))
+    else:
+        _, _, timescale, duration = struct.unpack(">IIII", f.read(16))
+    return timescale, duration
+
+def _probe_mp4(f: BinaryIO, file_size: int) -> AudioInfo:
+    moov = next(((s, e) for t, s, e in _mp4_boxes(f, 0, file_size) if t == b"moov"), None)
+    if moov is None:
+        raise AudioProbeError("MP4 file has no moov box")
+
+    movie: Optional[Tuple[int, int]] = None
+    for box_type, start, end in _mp4_boxes(f, *moov):
+        if box_type == b"mvhd":
+            movie = _read_timescale(f, start)
+        elif box_type == b"trak":
+            track = _probe_mp4_track(f, start, end)
+            if track:
+                timescale, duration, sample_rate, channels = track
+                if timescale:
+                    return AudioInfo("mp4", duration / timescale, sample_rate, channels)
+    raise AudioProbeError("MP4 file has no audio track" if movie else "MP4 file has no movie header")
+
+def _probe_mp4_track(f: BinaryIO, start: int, end: int):
+    """(timescale, duration, sample_rate, channels) of a sound track, else None"""
+    mdia = next(((s, e) for t, s, e in _mp4_boxes(f, start, end) if t == b"mdia"), None)
+    if mdia is None:
+        return None
+    timescale = duration = None
+    is_sound = False
+    stbl = None
+    for box_type, s, e in _mp4_boxes(f, *mdia):
+        if box_type == b"mdhd":
+            timescale, duration = _read_timescale(f, s)
+        elif box_type == b"hdlr":
+            f.seek(s + 8)
+            is_sound = f.read(4) == b"soun"
+        elif box_type == b"minf":
+            stbl = next(((bs, be) for t, bs, be in _mp4_boxes(f, s, e) if t == b"stbl"), None)
+    if not is_sound or stbl is None or timescale is None:
+        return None
+
+    stsd = next(((s, e) for t, s, e in _mp4_boxes(f, *stbl) if t == b"stsd"), None)
+    if stsd is None:
+        return None
+    # Full box header and entry count, then the first AudioSampleEntry:
+    # size, format, 8 bytes reserved/data-ref, 8 reserved, channels, sample size,
+    # 4 reserved, 16.16 sample rate
+    f.seek(stsd[0] + 8)
+    entry = f.read(36)
+    channels, = struct.unpack(">H", entry[24:26])
+    sample_rate = struct.unpack(">I", entry[32:36])[0] >> 16
+    return timescale, duration, sample_rate, channels
+
+# MPEG audio header tables, indexed by [version][layer]
+_MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 2.5: [11025, 12000, 8000]}
+
+def _parse_mp3_header(b: bytes):
+    """(version, layer, bitrate kbps, sample rate, channels, frame bytes) or None"""
+    if len(b) < 4 or b[0] != 0xFF or b[1] & 0xE0 != 0xE0:
+        return None
+    version = {0: 2.5, 2: 2, 3: 1}.get((b[1] >> 3) & 0x3)
+    layer = {1: 3, 2: 2, 3: 1}.get((b[1] >> 1) & 0x3)
+    bitrate_index, rate_index = b[2] >> 4, (b[2] >> 2) & 0x3
+    if version is None or layer is None or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = _MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index]
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    padding = (b[2] >> 1) & 0x1
+    channels = 1 if b[3] >> 6 == 3 else 2
+    if layer == 1:
+        frame_bytes = (12 * bitrate * 1000 // sample_rate + padding) * 4
+    else:
+        frame_bytes = _mp3_samples_per_frame(version, layer) // 8 * bitrate * 1000 // sample_rate + padding
+    return version, layer, bitrate, sample_rate, channels, frame_bytes
+
+def _mp3_samples_per_frame(version, layer) -> int:
+    if layer == 1:
+        return 384
+    if layer == 3 and version != 1:
+        return 576
+    return 1152
+
+def _probe_mp3(f: BinaryIO, file_size: int, start: int) -> AudioInfo:
+    f.seek(start)
+    buf = f.read(MP3_SYNC_SEARCH_BYTES)
+    for i in range(len(buf) - 3):
+        header = _parse_mp3_header(buf[i:i + 4])
+        # A real frame is followed by another; this rejects stray sync bytes
+        if header and _parse_mp3_header(buf[i + header[5]:i + header[5] + 4]):
+            break
+    else:
+        raise AudioProbeError("unsupported audio format")
+
+    version, layer, bitrate, sample_rate, channels, _ = header
+    samples_per_frame = _mp3_samples_per_frame(version, layer)
+
+    # VBR files carry a frame count in a Xing/Info or VBRI header
+    side_info = (17 if channels == 1 else 32) if version == 1 else (9 if channels == 1 else 17)
+    xing = buf[i + 4 + side_info:i + 4 + side_info + 12]
+    if xing[:4] in (b"Xing", b"Info"):
+        flags, frames = struct.unpack(">II", xing[4:12])
+        if flags & 0x1 and frames:
+            return AudioInfo("mp3", frames * samples_per_frame / sample_rate, sample_rate, channels)
+    vbri = buf[i + 36:i + 36 + 18]
+    if vbri[:4] == b"VBRI":
+        frames, = struct.unpack(">I", vbri[14:18])
+        if frames:
+            return AudioInfo("mp3", frames * samples_per_frame / sample_rate, sample_rate, channels)
+
+    # Constant bitrate: audio bytes over byte rate, less any ID3v1 tag
+    audio_bytes = file_size - (start + i)
+    f.seek(max(0, file_size - 128))
+    if f.read(3) == b"TAG":
+        audio_bytes -= 128
+    return AudioInfo("mp3", audio_bytes * 8 / (bitrate * 1000), sample_rate, channels)
@@ -1,23 +1,127 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import secrets
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, Optional, TypeVar
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import HTTPException, status
+from fastapi import Depends, HTTPException, status
+from fastapi.security import APIKeyHeader, HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from decouple import config
 
+from cache import LRUCache
+from database import get_db, AsyncSessionLocal
+from metrics import counter
+from models import APIKey, User
+
+logger = logging.getLogger(__name__)
+
 # Configuration
 SECRET_KEY = config("JWT_SECRET_KEY", default="your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+AUTH_CACHE_TTL = config("AUTH_CACHE_TTL", default=60, cast=float)  # seconds
+AUTH_CACHE_MAX_ENTRIES = config("AUTH_CACHE_MAX_ENTRIES", default=10000, cast=int)
+API_KEY_CACHE_TTL = config("API_KEY_CACHE_TTL", default=60, cast=float)  # seconds
+API_KEY_REFRESH_INTERVAL = config("API_KEY_REFRESH_INTERVAL", default=5, cast=float)  # seconds
+# Prefixes of keys that don't exist, remembered so bad keys don't hit the DB
+API_KEY_UNKNOWN_CACHE_TTL = config("API_KEY_UNKNOWN_CACHE_TTL", default=5, cast=float)  # seconds
+API_KEY_UNKNOWN_CACHE_MAX_ENTRIES = config("API_KEY_UNKNOWN_CACHE_MAX_ENTRIES", default=1000, cast=int)
+# Cached prefixes checked per query when refreshing
+API_KEY_REFRESH_BATCH_SIZE = 500
+API_KEY_PREFIX_LENGTH = 16  # "tsk_" plus 12 hex chars
+# bcrypt runs on its own threads (it releases the GIL); 0 runs it on the
+# event loop, which is only useful for comparison in benchmarks
+PASSWORD_HASH_WORKERS = config("PASSWORD_HASH_WORKERS", default=2, cast=int)
+# Hashes queued or running per process; beyond this, logins get 503
+PASSWORD_HASH_MAX_PENDING = config("PASSWORD_HASH_MAX_PENDING", default=16, cast=int)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
+
+password_hash_rejections_total = counter(
+    "password_hash_rejections_total", "Password checks refused because the hashing pool was full"
+)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+T = TypeVar("T")
+
+class PasswordHasher:
+    """Runs bcrypt off the event loop, on a small pool of its own.
+
+    Each hash costs a few hundred milliseconds of CPU; run inline it would
+    stall every other request on the worker. The pool is separate from the
+    default executor so a login burst can't starve uploads and probes, and
+    at most ``max_pending`` hashes may wait or run: the rest are refused
+    with 503 straight away rather than queued behind them. A hash counts
+    until its thread is done with it, even if the request that asked for
+    it has gone.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def _run(self, fn: Callable[..., T], *args) -> T:
+        if self.workers <= 0:
+            return fn(*args)
+        if self.pending >= self.max_pending:
+            password_hash_rejections_total.inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many sign-ins in progress, try again shortly",
+                headers={"Retry-After": "1"}
+            )
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        with self._lock:
+            self.pending += 1
+        # Released from the executor future, not here: a cancelled request
+        # stops waiting, but its hash keeps the thread busy until it ends
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            with self._lock:
+                self.pending -= 1
+            raise
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, future: Future):
+        with self._lock:
+            self.pending -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -28,7 +132,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str) -> str:
+def decode_token(token: str) -> dict:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -36,9 +140,188 @@ def verify_token(token: str) -> str:
     )
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+        if payload.get("sub") is None:
             raise credentials_exception
-        return email
+        return payload
     except JWTError:
-        raise credentials_exception
\ No newline at end of file
+        raise credentials_exception
+
+def verify_token(token: str) -> str:
+    return decode_token(token)["sub"]
+
+class CurrentUser:
+    """Identity of the authenticated caller, detached from any DB session so
+    it can be cached across requests"""
+
+    def __init__(self, id: int, email: str, full_name: Optional[str], is_active: bool,
+                 api_key_id: Optional[int] = None):
+        self.id = id
+        self.email = email
+        self.full_name = full_name
+        self.is_active = is_active
+        self.api_key_id = api_key_id  # set when authenticated with an API key
+
+    @classmethod
+    def from_user(cls, user: User, api_key_id: Optional[int] = None) -> "CurrentUser":
+        return cls(user.id, user.email, user.full_name, user.is_active, api_key_id)
+
+# Bearer token -> CurrentUser, so repeat requests skip both the JWT decode
+# and the users lookup
+auth_cache = LRUCache(max_entries=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_CACHE_TTL)
+
+# API key prefix -> (key digest, owner). refresh_api_key_cache re-reads the
+# cached keys and drops revoked ones every API_KEY_REFRESH_INTERVAL; the TTL
+# is a backstop if refreshing stops.
+api_key_cache = LRUCache(max_entries=AUTH_CACHE_MAX_ENTRIES, ttl=API_KEY_CACHE_TTL)
+
+# Prefixes known not to exist. Kept apart and small so a stream of bad keys
+# can't evict the valid ones above.
+unknown_api_key_cache = LRUCache(max_entries=API_KEY_UNKNOWN_CACHE_MAX_ENTRIES, ttl=API_KEY_UNKNOWN_CACHE_TTL)
+
+def invalidate_user(user_id: int):
+    """Forget cached identities of a user, e.g. after deactivation"""
+    auth_cache.delete_where(lambda token, identity: identity.id == user_id)
+    api_key_cache.delete_where(lambda prefix, entry: entry[1].id == user_id)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_changed(mapper, connection, target):
+    invalidate_user(target.id)
+
+@event.listens_for(APIKey, "after_update")
+@event.listens_for(APIKey, "after_delete")
+def _api_key_changed(mapper, connection, target):
+    api_key_cache.delete(target.prefix)
+
+@event.listens_for(APIKey, "after_insert")
+def _api_key_created(mapper, connection, target):
+    unknown_api_key_cache.delete(target.prefix)
+
+def generate_api_key() -> str:
+    return f"tsk_{secrets.token_hex(24)}"
+
+def hash_api_key(key: str) -> str:
+    # Keys carry 192 random bits, so a fast digest is enough; no bcrypt needed
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def api_key_prefix(key: str) -> str:
+    return key[:API_KEY_PREFIX_LENGTH]
+
+async def _load_api_key(db: AsyncSession, prefix: str):
+    result = await db.execute(
+        select(APIKey, User).join(User, APIKey.user_id == User.id).where(
+            APIKey.prefix == prefix,
+            APIKey.is_active == True
+        )
+    )
+    row = result.first()
+    if not row:
+        return None
+    api_key, user = row
+    return api_key.key_hash, CurrentUser.from_user(user, api_key_id=api_key.id)
+
+async def refresh_api_key_cache(db: AsyncSession) -> int:
+    """Re-read the cached keys and drop those that are no longer active.
+
+    Run periodically so revocations and deactivations made by other worker
+    processes take effect within API_KEY_REFRESH_INTERVAL. Only keys in use
+    here are read, a batch of prefixes per indexed query, however many the
+    table holds. Returns the number still active.
+    """
+    prefixes = api_key_cache.keys()
+    active = 0
+    for start in range(0, len(prefixes), API_KEY_REFRESH_BATCH_SIZE):
+        batch = prefixes[start:start + API_KEY_REFRESH_BATCH_SIZE]
+        result = await db.execute(
+            select(APIKey, User).join(User, APIKey.user_id == User.id).where(
+                APIKey.prefix.in_(batch),
+                APIKey.is_active == True
+            )
+        )
+        found = set()
+        for api_key, user in result.all():
+            found.add(api_key.prefix)
+            api_key_cache.set(api_key.prefix, (api_key.key_hash, CurrentUser.from_user(user, api_key_id=api_key.id)))
+        for prefix in batch:
+            if prefix not in found:
+                api_key_cache.delete(prefix)
+        active += len(found)
+    return active
+
+async def run_api_key_refresher():
+    """Background task: refresh the API key cache every API_KEY_REFRESH_INTERVAL"""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await refresh_api_key_cache(db)
+        except Exception:
+            logger.exception("API key cache refresh failed")
+        await asyncio.sleep(API_KEY_REFRESH_INTERVAL)
+
+async def resolve_api_key(key: str, db: AsyncSession) -> CurrentUser:
+    """Resolve an X-API-Key value to its owner in O(1): one cache lookup or
+    one indexed prefix query, then a constant-time digest comparison"""
+    prefix = api_key_prefix(key)
+    entry = api_key_cache.get(prefix)
+    if entry is None and not unknown_api_key_cache.get(prefix):
+        entry = await _load_api_key(db, prefix)
+        if entry:
+            api_key_cache.set(prefix, entry)
+        else:
+            unknown_api_key_cache.set(prefix, True)
+
+    if entry is None or not hmac.compare_digest(entry[0], hash_api_key(key)):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid API key"
+        )
+    return entry[1]
+
+async def resolve_token(token: str, db: AsyncSession) -> CurrentUser:
+    """Resolve a bearer token to its user, through the auth cache"""
+    identity = auth_cache.get(token)
+    if identity is None:
+        payload = decode_token(token)
+        user = await db.scalar(select(User).where(User.email == payload["sub"]))
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid authentication credentials"
+            )
+        identity = CurrentUser.from_user(user)
+        # Never cache a token past its own expiry
+        ttl = min(AUTH_CACHE_TTL, payload.get("exp", 0) - time.time())
+        if ttl > 0:
+            auth_cache.set(token, identity, ttl=ttl)
+    return identity
+
+def _require_active(identity: CurrentUser) -> CurrentUser:
+    if not identity.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Inactive user"
+        )
+    return identity
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+) -> CurrentUser:
+    """Resolve the bearer token to the calling user"""
+    return _require_active(await resolve_token(credentials.credentials, db))
+
+async def get_api_caller(
+    api_key: Optional[str] = Depends(api_key_header),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: AsyncSession = Depends(get_db)
+) -> CurrentUser:
+    """Accept either an X-API-Key header or a bearer token"""
+    if api_key:
+        return _require_active(await resolve_api_key(api_key, db))
+    if credentials:
+        return _require_active(await resolve_token(credentials.credentials, db))
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Not authenticated",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
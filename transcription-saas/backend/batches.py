@@ -0,0 +1,176 @@
+import logging
+import os
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from decouple import config
+from sqlalchemy import and_, or_, select
+
+from database import SessionLocal
+from dedup import transcript_cache, transcript_cache_key
+from jobs import (
+    JobQueue, JOB_COMPLETED, JOB_FAILED, JOB_PROCESSING, JOB_QUEUED, JOB_STALE_AFTER,
+    transcribe_job_audio
+)
+from metering import billable_minutes, current_period, release_usage, settle_usage_many
+from metrics import stage
+from models import TranscriptionBatch, TranscriptionJob, insert_transcriptions
+from progress import job_events
+
+logger = logging.getLogger(__name__)
+
+def parse_plan_values(spec: str) -> Dict[str, int]:
+    """Parse "plan=value,..." into {plan: value}"""
+    values = {}
+    for item in spec.split(","):
+        if "=" in item:
+            plan, value = item.split("=", 1)
+            values[plan.strip()] = int(value)
+    return values
+
+# Configuration
+BATCH_MAX_FILES = config("BATCH_MAX_FILES", default=500, cast=int)  # per request, archive members included
+BATCH_WORKERS = config("BATCH_WORKERS", default=2, cast=int)  # batches processed at once per process
+BATCH_QUEUE_SIZE = config("BATCH_QUEUE_SIZE", default=20, cast=int)
+# Finished items are written this many at a time: one INSERT and one commit per group
+BATCH_WRITE_SIZE = config("BATCH_WRITE_SIZE", default=50, cast=int)
+# Items of one batch transcribed at once, per plan
+BATCH_CONCURRENCY = parse_plan_values(config(
+    "BATCH_CONCURRENCY",
+    default="starter=2,professional=4,enterprise=8"
+))
+
+def batch_concurrency(plan: str) -> int:
+    return BATCH_CONCURRENCY.get(plan) or min(BATCH_CONCURRENCY.values(), default=1)
+
+def run_transcription_batch(batch_id: str) -> None:
+    """Process every unfinished item of a batch. Blocking; runs on a batch
+    worker thread.
+
+    Items are transcribed ``batch.concurrency`` at a time and written back
+    in groups of BATCH_WRITE_SIZE as they finish, so a batch of short clips
+    costs a handful of commits instead of one per clip.
+    """
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        # Claim the batch atomically, as run_transcription_job does for jobs;
+        # a stale claim belongs to a process that died mid-batch
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=JOB_STALE_AFTER)
+        claimed = db.query(TranscriptionBatch).filter(
+            TranscriptionBatch.id == batch_id,
+            or_(
+                TranscriptionBatch.status == JOB_QUEUED,
+                and_(TranscriptionBatch.status == JOB_PROCESSING, TranscriptionBatch.started_at < stale_before)
+            )
+        ).update({"status": JOB_PROCESSING, "started_at": now}, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            return
+        batch = db.get(TranscriptionBatch, batch_id)
+
+        jobs = db.query(TranscriptionJob).filter(
+            TranscriptionJob.batch_id == batch_id,
+            TranscriptionJob.status.in_((JOB_QUEUED, JOB_PROCESSING))
+        ).all()
+        for job in jobs:
+            job.status = JOB_PROCESSING
+            job.started_at = now
+        db.commit()
+        for job in jobs:
+            job_events.publish(job.id, {"event": JOB_PROCESSING})
+
+        finished: List[Tuple[TranscriptionJob, Future]] = []
+        with ThreadPoolExecutor(max_workers=max(1, batch.concurrency), thread_name_prefix="batch-item") as pool:
+            futures = {pool.submit(transcribe_job_audio, job.id, job.file_path): job for job in jobs}
+            for future in as_completed(futures):
+                finished.append((futures[future], future))
+                if len(finished) >= BATCH_WRITE_SIZE:
+                    _write_results(db, finished)
+                    finished = []
+        _write_results(db, finished)
+
+        batch.status = JOB_COMPLETED
+        batch.finished_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+
+def _write_results(db, finished: List[Tuple[TranscriptionJob, Future]]):
+    """Record a group of finished items in one transaction: a multi-row
+    INSERT for the transcriptions, one usage settlement for the completed
+    items and one release for the failed ones"""
+    if not finished:
+        return
+    completed: List[Tuple[TranscriptionJob, str]] = []
+    failed: List[TranscriptionJob] = []
+    for job, future in finished:
+        error = future.exception()
+        if error is None:
+            completed.append((job, future.result()))
+        else:
+            logger.error("Transcription job %s in batch %s failed", job.id, job.batch_id, exc_info=error)
+            job.status = JOB_FAILED
+            job.error = f"Transcription failed: {str(error)}"
+            failed.append(job)
+
+    # One batch is one user, billed in the period it was reserved in
+    user_id = finished[0][0].user_id
+    period = finished[0][0].billing_period or current_period()
+    ids = insert_transcriptions(db, [
+        dict(user_id=job.user_id, filename=job.filename, transcription_text=text,
+             file_size=job.file_size, duration=job.duration)
+        for job, text in completed
+    ])
+    settled = []
+    for (job, _), transcription_id in zip(completed, ids):
+        job.transcription_id = transcription_id
+        job.status = JOB_COMPLETED
+        settled.append((transcription_id, job.reserved_minutes or 0, billable_minutes(job.duration)))
+    settle_usage_many(db, user_id, period, settled)
+    reserved = sum(job.reserved_minutes or 0 for job in failed)
+    if reserved:
+        release_usage(db, user_id, reserved, period)
+
+    now = datetime.utcnow()
+    for job, _ in finished:
+        job.finished_at = now
+    with stage("worker_db_commit"):
+        db.commit()
+
+    for job, text in completed:
+        if job.content_hash:
+            transcript_cache.set(transcript_cache_key(job.content_hash), text)
+        job_events.publish(job.id, {"event": JOB_COMPLETED, "transcription_id": job.transcription_id})
+    for job in failed:
+        job_events.publish(job.id, {"event": JOB_FAILED, "error": job.error})
+
+    with stage("cleanup"):
+        for job, _ in finished:
+            if os.path.exists(job.file_path):
+                os.remove(job.file_path)
+
+def recover_batches(limit: int, stale_only: bool = False) -> List[str]:
+    """Batches left unfinished by a previous run, or with ``stale_only``
+    just those whose worker died; as with recover_jobs. Their finished
+    items are kept and the rest run again."""
+    db = SessionLocal()
+    try:
+        stale_before = datetime.utcnow() - timedelta(seconds=JOB_STALE_AFTER)
+        stale = and_(TranscriptionBatch.status == JOB_PROCESSING, TranscriptionBatch.started_at < stale_before)
+        return db.scalars(
+            select(TranscriptionBatch.id)
+            .where(stale if stale_only else or_(TranscriptionBatch.status == JOB_QUEUED, stale))
+            .order_by(TranscriptionBatch.created_at).limit(limit)
+        ).all()
+    finally:
+        db.close()
+
+batch_queue = JobQueue(
+    run_transcription_batch,
+    concurrency=BATCH_WORKERS,
+    maxsize=BATCH_QUEUE_SIZE,
+    recover=recover_batches,
+    name="batch",
+)
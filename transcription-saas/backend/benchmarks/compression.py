@@ -0,0 +1,100 @@
+"""Benchmark: transcript storage size and /transcriptions bytes on the wire.
+
+Writes the same transcripts into two throwaway SQLite databases, one with
+compressed storage and one without, and compares file sizes. Then renders
+a full /transcriptions page and reports its size raw, gzipped and brotli
+compressed at the configured levels. Run from backend/:
+
+    python benchmarks/compression.py [--rows 500] [--text-chars 40000] [--items 100]
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import brotli
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+
+import compression
+from compression import RESPONSE_BROTLI_QUALITY, RESPONSE_GZIP_LEVEL, register_sqlite_functions
+from models import Transcription
+import subscription_models  # noqa: F401  (registers the models User refers to)
+from schemas import TranscriptionPage, TranscriptionResponse
+from serialization import TrustedResponse, trusted
+
+def make_texts(rows: int, text_chars: int):
+    # Spoken language repeats a small vocabulary; random words over a few
+    # thousand entries compress about as well as real transcripts
+    words = ["".join(random.choices(string.ascii_lowercase, k=random.randint(2, 9))) for _ in range(3000)]
+    return [" ".join(random.choices(words, k=text_chars // 5))[:text_chars] for _ in range(rows)]
+
+def database_size(texts, compress: bool) -> int:
+    compression.TRANSCRIPT_COMPRESSION = compress
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        engine = create_engine(f"sqlite:///{path}")
+        event.listen(engine, "connect", lambda conn, record: register_sqlite_functions(conn))
+        Transcription.__table__.create(engine)
+        created = datetime(2024, 1, 1, 12, 0, 0)
+        with Session(engine) as db:
+            for i, body in enumerate(texts):
+                db.add(Transcription(
+                    user_id=1, filename=f"meeting-{i}.wav", transcription_text=body,
+                    file_size=10 ** 6, duration=600.0, created_at=created - timedelta(seconds=i)
+                ))
+            db.commit()
+            # Reading back must give the original text either way
+            assert db.get(Transcription, 1).transcription_text == texts[0]
+        with engine.connect() as conn:
+            conn.execute(text("VACUUM"))
+        engine.dispose()
+        return os.path.getsize(path)
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--text-chars", type=int, default=40000)
+    parser.add_argument("--items", type=int, default=100)
+    args = parser.parse_args()
+
+    random.seed(1)
+    texts = make_texts(args.rows, args.text_chars)
+
+    plain = database_size(texts, compress=False)
+    packed = database_size(texts, compress=True)
+    print(f"database: {args.rows} transcripts of {args.text_chars} chars")
+    print(f"  uncompressed  {plain / 2 ** 20:8.1f} MiB")
+    print(f"  compressed    {packed / 2 ** 20:8.1f} MiB   ({packed / plain:.0%})")
+
+    created = datetime(2024, 1, 1, 12, 0, 0)
+    items = [
+        trusted(TranscriptionResponse, Transcription(
+            id=i + 1, filename=f"meeting-{i}.wav", transcription_text=texts[i % len(texts)],
+            file_size=10 ** 6, duration=600.0, created_at=created - timedelta(seconds=i)
+        ))
+        for i in range(args.items)
+    ]
+    body = TrustedResponse(TranscriptionPage.model_construct(items=items, next_cursor="cursor")).body
+
+    gzipped, gzip_time = timed(lambda: zlib.compress(body, RESPONSE_GZIP_LEVEL))
+    brotlied, brotli_time = timed(lambda: brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY))
+    print(f"response: /transcriptions page of {args.items} items")
+    print(f"  identity      {len(body) / 1024:8.0f} KiB")
+    print(f"  gzip -{RESPONSE_GZIP_LEVEL}       {len(gzipped) / 1024:8.0f} KiB   ({len(gzipped) / len(body):.0%}, {gzip_time * 1000:.1f} ms)")
+    print(f"  br q{RESPONSE_BROTLI_QUALITY}         {len(brotlied) / 1024:8.0f} KiB   ({len(brotlied) / len(body):.0%}, {brotli_time * 1000:.1f} ms)")
+
+if __name__ == "__main__":
+    main()
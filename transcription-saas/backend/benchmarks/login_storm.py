@@ -0,0 +1,118 @@
+"""Benchmark: latency of other endpoints during a login storm.
+
+Starts one uvicorn worker on a throwaway SQLite database, then measures
+GET /transcriptions latency on its own and while ``--logins`` clients log
+in back to back. The run is repeated with bcrypt on the event loop
+(PASSWORD_HASH_WORKERS=0, the old behaviour) and on the hashing pool.
+Run from backend/:
+
+    python benchmarks/login_storm.py [--logins 50] [--seconds 10] [--port 8766]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EMAIL = "storm@example.com"
+PASSWORD = "correct horse battery staple"
+
+def start_server(port: int, env: dict, timeout: float = 60.0) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1):
+                return server
+        except (urllib.error.URLError, ConnectionError):
+            if server.poll() is not None:
+                raise RuntimeError("uvicorn exited before serving")
+            time.sleep(0.05)
+    server.terminate()
+    raise RuntimeError(f"no response within {timeout:.0f}s")
+
+async def probe(client: httpx.AsyncClient, headers: dict, seconds: float) -> list:
+    """GET /transcriptions one after another; returns latencies"""
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.get("/transcriptions", headers=headers)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+    return latencies
+
+async def log_in(client: httpx.AsyncClient, seconds: float, counts: dict):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        response = await client.post("/auth/login", params={"email": EMAIL, "password": PASSWORD})
+        counts[response.status_code] = counts.get(response.status_code, 0) + 1
+        if response.status_code == 503:
+            await asyncio.sleep(float(response.headers.get("retry-after", "1")))
+
+async def storm(port: int, logins: int, seconds: float) -> dict:
+    limits = httpx.Limits(max_connections=logins + 10)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=120) as client:
+        await client.post("/auth/register", json={"email": EMAIL, "password": PASSWORD})
+        token = (await client.post("/auth/login", params={"email": EMAIL, "password": PASSWORD})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        quiet = await probe(client, headers, seconds / 2)
+        counts: dict = {}
+        results = await asyncio.gather(
+            probe(client, headers, seconds),
+            *(log_in(client, seconds, counts) for _ in range(logins))
+        )
+        return {"quiet": quiet, "storm": results[0], "logins": counts}
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def report(label: str, result: dict, seconds: float):
+    print(f"  {label}")
+    for phase in ("quiet", "storm"):
+        latencies = result[phase]
+        print(
+            f"    /transcriptions {phase:<5}  p50 {percentile(latencies, 0.5) * 1000:8.1f} ms"
+            f"   p99 {percentile(latencies, 0.99) * 1000:8.1f} ms   ({len(latencies)} requests)"
+        )
+    ok = result["logins"].get(200, 0)
+    rejected = result["logins"].get(503, 0)
+    print(f"    logins  {ok / seconds:6.1f}/s ok   {rejected} refused with 503")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=50, help="concurrent login clients")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    print(f"{args.logins} clients logging in for {args.seconds:.0f}s, one server process")
+    for label, workers in (("bcrypt on the event loop", "0"), ("bcrypt on the hashing pool", None)):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp}/storm.db", UPLOAD_DIR=tmp)
+            if workers is not None:
+                env["PASSWORD_HASH_WORKERS"] = workers
+            subprocess.run([sys.executable, "migrate.py"], cwd=BACKEND_DIR, env=env, check=True, capture_output=True)
+            server = start_server(args.port, env)
+            try:
+                report(label, asyncio.run(storm(args.port, args.logins, args.seconds)), args.seconds)
+            finally:
+                server.terminate()
+                server.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Micro-benchmark: rendering a /transcriptions page.
+
+Compares the old path (copy ORM attributes into the schema, then FastAPI
+validates against response_model, runs jsonable_encoder and json.dumps)
+with the trusted path (model_construct + orjson). Run from backend/:
+
+    python benchmarks/serialization.py [--items 100] [--text-chars 20000] [--rounds 50]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import string
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from models import Transcription
+import subscription_models  # noqa: F401  (registers the models User refers to)
+from schemas import TranscriptionPage, TranscriptionResponse, TranscriptionSummary
+from serialization import TrustedResponse, trusted
+
+def make_rows(items: int, text_chars: int):
+    words = ["".join(random.choices(string.ascii_lowercase, k=random.randint(2, 9))) for _ in range(2000)]
+    created = datetime(2024, 1, 1, 12, 0, 0)
+    rows = []
+    for i in range(items):
+        text = " ".join(random.choices(words, k=text_chars // 6))[:text_chars]
+        rows.append(Transcription(
+            id=i + 1,
+            user_id=1,
+            filename=f"meeting-{i}.wav",
+            transcription_text=text,
+            file_size=random.randint(10 ** 5, 10 ** 8),
+            duration=random.uniform(30, 3600),
+            created_at=created - timedelta(seconds=i, microseconds=i * 7)
+        ))
+    return rows
+
+def old_path(rows, field) -> bytes:
+    page = TranscriptionPage(
+        items=[
+            TranscriptionResponse(
+                id=t.id,
+                filename=t.filename,
+                transcription_text=t.transcription_text,
+                file_size=t.file_size,
+                duration=t.duration,
+                created_at=t.created_at
+            )
+            for t in rows
+        ],
+        next_cursor="cursor"
+    )
+    content = asyncio.run(serialize_response(field=field, response_content=page))
+    return JSONResponse(content).body
+
+def new_path(rows) -> bytes:
+    page = TranscriptionPage.model_construct(
+        items=[trusted(TranscriptionResponse, t) for t in rows],
+        next_cursor="cursor"
+    )
+    return TrustedResponse(page).body
+
+def old_summary(rows, field) -> bytes:
+    page = TranscriptionPage(
+        items=[
+            TranscriptionSummary(
+                id=t.id,
+                filename=t.filename,
+                text_preview=t.text_preview,
+                file_size=t.file_size,
+                duration=t.duration,
+                created_at=t.created_at
+            )
+            for t in rows
+        ]
+    )
+    content = asyncio.run(serialize_response(field=field, response_content=page))
+    return JSONResponse(content).body
+
+def new_summary(rows) -> bytes:
+    page = TranscriptionPage.model_construct(items=[trusted(TranscriptionSummary, t) for t in rows], next_cursor=None)
+    return TrustedResponse(page).body
+
+def bench(label: str, fn, rounds: int) -> float:
+    fn()  # warm up
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    median = timings[len(timings) // 2]
+    print(f"  {label:<8} median {median * 1000:8.2f} ms   min {timings[0] * 1000:8.2f} ms")
+    return median
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--text-chars", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    random.seed(1)
+    rows = make_rows(args.items, args.text_chars)
+    for row in rows:
+        row.text_preview = row.transcription_text[:200]
+    field = create_response_field(name="response", type_=TranscriptionPage)
+
+    for view, old, new in (
+        ("full", lambda: old_path(rows, field), lambda: new_path(rows)),
+        ("summary", lambda: old_summary(rows, field), lambda: new_summary(rows)),
+    ):
+        # Both paths must produce the same document
+        assert json.loads(old()) == json.loads(new()), f"{view}: outputs differ"
+        size = len(new())
+        print(f"view={view}: {args.items} items, {size / 1024:.0f} KiB per page")
+        before = bench("old", old, args.rounds)
+        after = bench("trusted", new, args.rounds)
+        print(f"  speedup  {before / after:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Benchmark: cold start of one backend worker.
+
+Measures, in fresh interpreters, how long ``import main`` takes and how
+long a uvicorn worker takes from spawn until it answers ``GET /``. The
+database must already be migrated (python migrate.py). Run from backend/:
+
+    python benchmarks/startup.py [--runs 5] [--port 8765]
+
+For a breakdown by module, run ``python -X importtime -c "import main"``.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+def import_time() -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=BACKEND_DIR, check=True, capture_output=True, text=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+def serve_time(port: int, timeout: float = 60.0) -> float:
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1):
+                    return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                if server.poll() is not None:
+                    raise RuntimeError("uvicorn exited before serving")
+                time.sleep(0.01)
+        raise RuntimeError(f"no response within {timeout:.0f}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+def report(label: str, timings):
+    timings = sorted(timings)
+    median = timings[len(timings) // 2]
+    print(f"  {label:<16} median {median * 1000:8.1f} ms   min {timings[0] * 1000:8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    import_time()  # warm the OS file cache and .pyc files
+    print(f"cold start over {args.runs} runs")
+    report("import main", [import_time() for _ in range(args.runs)])
+    report("first response", [serve_time(args.port) for _ in range(args.runs)])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import zlib
+from typing import Optional
+
+import brotli
+from decouple import config
+from sqlalchemy import Text
+from sqlalchemy.types import TypeDecorator
+
+# Configuration
+TRANSCRIPT_COMPRESSION = config("TRANSCRIPT_COMPRESSION", default=True, cast=bool)
+TRANSCRIPT_COMPRESSION_MIN_BYTES = config("TRANSCRIPT_COMPRESSION_MIN_BYTES", default=4096, cast=int)
+TRANSCRIPT_COMPRESSION_LEVEL = config("TRANSCRIPT_COMPRESSION_LEVEL", default=6, cast=int)
+RESPONSE_COMPRESSION = config("RESPONSE_COMPRESSION", default=True, cast=bool)
+RESPONSE_COMPRESSION_MIN_BYTES = config("RESPONSE_COMPRESSION_MIN_BYTES", default=1024, cast=int)
+RESPONSE_GZIP_LEVEL = config("RESPONSE_GZIP_LEVEL", default=6, cast=int)
+RESPONSE_BROTLI_QUALITY = config("RESPONSE_BROTLI_QUALITY", default=4, cast=int)
+
+# Stored transcripts: short text is kept as TEXT; longer text becomes a BLOB
+# of this header followed by a zlib stream. SQLite keeps whatever storage
+# class it is given, so both kinds share the column without a migration
+ZLIB_HEADER = b"Z1"
+
+def compress_utf8(data: bytes) -> bytes:
+    """Stored form of text already encoded as UTF-8"""
+    return ZLIB_HEADER + zlib.compress(data, TRANSCRIPT_COMPRESSION_LEVEL)
+
+def decompress_text(value):
+    """Plain text for a stored value, whichever form it was stored in"""
+    if isinstance(value, (bytes, memoryview)):
+        data = bytes(value)
+        if data.startswith(ZLIB_HEADER):
+            return zlib.decompress(data[len(ZLIB_HEADER):]).decode("utf-8")
+        return data.decode("utf-8")
+    return value
+
+def text_head(value, chars: int) -> Optional[str]:
+    """The first ``chars`` characters, inflating no more than needed"""
+    if isinstance(value, (bytes, memoryview)):
+        data = bytes(value)
+        if data.startswith(ZLIB_HEADER):
+            # UTF-8 is at most 4 bytes per character
+            head = zlib.decompressobj().decompress(data[len(ZLIB_HEADER):], chars * 4)
+            return head.decode("utf-8", errors="ignore")[:chars]
+        return data.decode("utf-8")[:chars]
+    return value[:chars] if value is not None else None
+
+class CompressedText(TypeDecorator):
+    """Text column compressed on write above a size threshold (SQLite only).
+
+    PostgreSQL already compresses large values in TOAST, and its full-text
+    index needs the column as text, so other dialects store it unchanged.
+    Reads always return ``str``.
+    """
+
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and TRANSCRIPT_COMPRESSION and dialect.name == "sqlite":
+            # The threshold is in stored bytes, which for non-ASCII text
+            # outnumber the characters
+            data = value.encode("utf-8")
+            if len(data) >= TRANSCRIPT_COMPRESSION_MIN_BYTES:
+                return compress_utf8(data)
+        return value
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
+
+def register_sqlite_functions(dbapi_connection):
+    """SQL access to compressed transcripts, for the search index and previews"""
+    dbapi_connection.create_function("transcript_text", 1, decompress_text, deterministic=True)
+    dbapi_connection.create_function("transcript_head", 2, text_head, deterministic=True)
+
+# Responses
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+def _accepted_encoding(header: str) -> Optional[str]:
+    """Pick br or gzip from an Accept-Encoding header, honouring q=0"""
+    accepted = {}
+    for part in header.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    for encoding in ("br", "gzip"):
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=RESPONSE_BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(RESPONSE_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data)
+        return self._zlib.compress(data)
+
+    def flush(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+class CompressionMiddleware:
+    """ASGI middleware compressing large JSON and text responses.
+
+    Brotli is preferred when the client accepts it, otherwise gzip.
+    Responses below ``minimum_size``, already encoded, or of other content
+    types (audio, event streams) are passed through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = RESPONSE_COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RESPONSE_COMPRESSION:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        encoding = _accepted_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                response_headers = {k.lower(): v for k, v in message.get("headers", [])}
+                content_type = response_headers.get(b"content-type", b"").decode("latin-1")
+                passthrough = (
+                    b"content-encoding" in response_headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or content_type.startswith("text/event-stream")
+                )
+                if passthrough:
+                    await send(start)
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                response_headers = [
+                    (k, v) for k, v in start.get("headers", [])
+                    if k.lower() not in (b"content-length", b"content-encoding")
+                ]
+                response_headers.append((b"content-encoding", encoding.encode("latin-1")))
+                response_headers.append((b"vary", b"Accept-Encoding"))
+                data = compressor.compress(body)
+                if not more_body:
+                    data += compressor.flush()
+                    response_headers.append((b"content-length", str(len(data)).encode("latin-1")))
+                await send({**start, "headers": response_headers})
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+                return
+
+            data = compressor.compress(body)
+            if not more_body:
+                data += compressor.flush()
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,23 +1,86 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, DateTime
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from decouple import config
 
+from compression import register_sqlite_functions
+
 # Database configuration
 DATABASE_URL = config("DATABASE_URL", default="sqlite:///./transcription_saas.db")
+DB_POOL_SIZE = config("DB_POOL_SIZE", default=5, cast=int)
+DB_MAX_OVERFLOW = config("DB_MAX_OVERFLOW", default=10, cast=int)
+DB_POOL_RECYCLE = config("DB_POOL_RECYCLE", default=1800, cast=int)  # seconds
+DB_POOL_TIMEOUT = config("DB_POOL_TIMEOUT", default=30, cast=int)  # seconds
+SQLITE_BUSY_TIMEOUT = config("SQLITE_BUSY_TIMEOUT", default=5000, cast=int)  # milliseconds
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-)
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# Async drivers for the request path; the sync URL stays in use for DDL and
+# for the worker threads
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+def async_database_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    driver = ASYNC_DRIVERS.get(scheme.split("+")[0])
+    return f"{driver}://{rest}" if driver and "+" not in scheme else url
+
+def _pool_options() -> dict:
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": True,
+    }
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers proceed while a writer commits; NORMAL sync is safe
+    # under WAL and avoids an fsync per transaction
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+    register_sqlite_functions(dbapi_connection)
+
+if IS_SQLITE:
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        **_pool_options()
+    )
+    async_engine = create_async_engine(
+        async_database_url(DATABASE_URL),
+        poolclass=AsyncAdaptedQueuePool,
+        **_pool_options()
+    )
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+else:
+    engine = create_engine(DATABASE_URL, **_pool_options())
+    async_engine = create_async_engine(async_database_url(DATABASE_URL), **_pool_options())
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+# DateTime that SQLite stores in the same format as CURRENT_TIMESTAMP, so
+# server-set values compare correctly against bound parameters (keyset cursors)
+Timestamp = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite"
+)
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -0,0 +1,36 @@
+import hashlib
+from typing import Optional
+
+from decouple import config
+
+from cache import LRUCache
+from normalize import NORMALIZE_AUDIO, NORMALIZE_SAMPLE_RATE, TRIM_SILENCE
+from pipeline import SEGMENT_SECONDS, SEGMENT_OVERLAP_SECONDS
+from speech import SpeechBackend, get_speech_backend
+
+# Configuration
+TRANSCRIPT_CACHE_MAX_ENTRIES = config("TRANSCRIPT_CACHE_MAX_ENTRIES", default=1000, cast=int)
+TRANSCRIPT_CACHE_MAX_BYTES = config("TRANSCRIPT_CACHE_MAX_BYTES", default=64 * 1024 * 1024, cast=int)
+TRANSCRIPT_CACHE_TTL = config("TRANSCRIPT_CACHE_TTL", default=24 * 3600, cast=float)  # seconds
+
+# Completed transcripts keyed by audio content plus everything that shapes the text
+transcript_cache = LRUCache(
+    max_entries=TRANSCRIPT_CACHE_MAX_ENTRIES,
+    ttl=TRANSCRIPT_CACHE_TTL,
+    max_bytes=TRANSCRIPT_CACHE_MAX_BYTES,
+    sizeof=lambda text: len(text.encode("utf-8")),
+)
+
+def transcript_cache_key(content_hash: str, backend: Optional[SpeechBackend] = None) -> str:
+    """Cache key for a file's SHA-256 under the current backend, model and options"""
+    backend = backend or get_speech_backend()
+    options = "|".join([
+        content_hash,
+        backend.name,
+        getattr(backend, "model", ""),
+        f"segment={SEGMENT_SECONDS}",
+        f"overlap={SEGMENT_OVERLAP_SECONDS}",
+        f"normalize={NORMALIZE_AUDIO and NORMALIZE_SAMPLE_RATE}",
+        f"trim={TRIM_SILENCE}",
+    ])
+    return hashlib.sha256(options.encode("utf-8")).hexdigest()
@@ -0,0 +1,48 @@
+"""Production server: gunicorn supervising uvicorn worker processes.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+Each worker is a full copy of the app with its own job queue, thread pools
+and caches, so TRANSCRIPTION_WORKERS applies per worker. Use
+RATE_LIMIT_BACKEND=database so upload limits hold across them, and
+SPEECH_CONCURRENCY_BACKEND=database so SPEECH_MAX_CONCURRENCY does.
+"""
+import multiprocessing
+
+from decouple import config
+
+from pipeline import remove_temp_files
+
+# Read directly rather than importing the app into the master process
+UPLOAD_DIR = config("UPLOAD_DIR", default="/tmp/uploads")
+JOB_DRAIN_TIMEOUT = config("JOB_DRAIN_TIMEOUT", default=120.0, cast=float)  # seconds
+
+bind = config("BIND", default="0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = config("WEB_CONCURRENCY", default=multiprocessing.cpu_count(), cast=int)
+
+# Longer than nginx's upstream keepalive, so idle connections are closed
+# by the proxy and never by us mid-reuse
+keepalive = config("KEEPALIVE_TIMEOUT", default=75, cast=int)  # seconds
+
+# Recycle workers now and then to bound slow leaks; jitter keeps them from
+# restarting together
+max_requests = config("MAX_REQUESTS", default=1000, cast=int)
+max_requests_jitter = config("MAX_REQUESTS_JITTER", default=100, cast=int)
+
+# A worker blocked this long is killed and replaced
+timeout = config("WORKER_TIMEOUT", default=120, cast=int)  # seconds
+
+# Stopping a worker waits for in-flight requests, then drains its jobs
+graceful_timeout = config("GRACEFUL_TIMEOUT", default=int(JOB_DRAIN_TIMEOUT) + 30, cast=int)  # seconds
+
+accesslog = "-"
+
+def on_starting(server):
+    # No workers yet, so whatever scratch files are left came from a crash
+    removed = remove_temp_files(UPLOAD_DIR)
+    if removed:
+        server.log.info("Removed %d stale temp files from %s", removed, UPLOAD_DIR)
+
+def on_exit(server):
+    remove_temp_files(UPLOAD_DIR)
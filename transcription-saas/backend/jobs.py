@@ -0,0 +1,332 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Set
+
+from decouple import config
+from sqlalchemy import and_, or_
+
+from database import SessionLocal
+from dedup import transcript_cache, transcript_cache_key
+from metering import billable_minutes, current_period, release_usage, settle_usage
+from metrics import stage, transcribe_stage_seconds
+from models import Transcription, TranscriptionJob
+from normalize import prepare_audio
+from pipeline import transcribe_audio_file
+from progress import job_events
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+TRANSCRIPTION_WORKERS = config("TRANSCRIPTION_WORKERS", default=4, cast=int)
+TRANSCRIPTION_QUEUE_SIZE = config("TRANSCRIPTION_QUEUE_SIZE", default=100, cast=int)
+JOB_DRAIN_TIMEOUT = config("JOB_DRAIN_TIMEOUT", default=120.0, cast=float)  # seconds
+# A job still "processing" this long after it started is assumed to belong
+# to a worker that died, and is queued again
+JOB_STALE_AFTER = config("JOB_STALE_AFTER", default=1800.0, cast=float)  # seconds
+# How often running servers look for such jobs, besides at start
+JOB_SWEEP_INTERVAL = config("JOB_SWEEP_INTERVAL", default=300.0, cast=float)  # seconds
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_PROCESSING = "processing"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room for another job"""
+
+def transcribe_job_audio(job_id: str, file_path: str) -> str:
+    """Normalize and transcribe one job's upload, publishing each segment's
+    text as it finishes. The normalized copy is removed before returning."""
+    def on_segment(index: int, total: int, text: str):
+        job_events.publish(job_id, {"event": "segment", "index": index, "total": total, "text": text})
+
+    normalized = None
+    try:
+        # Shrink the payload (16kHz mono) before any backend call
+        with stage("normalize"):
+            normalized = prepare_audio(file_path)
+        if normalized:
+            logger.info(
+                "Job %s normalized audio %d -> %d bytes in %.3fs",
+                job_id, normalized.bytes_before, normalized.bytes_after, normalized.seconds
+            )
+        with stage("transcribe"):
+            return transcribe_audio_file(normalized.path if normalized else file_path, on_segment=on_segment)
+    finally:
+        if normalized and os.path.exists(normalized.path):
+            os.remove(normalized.path)
+
+def run_transcription_job(job_id: str) -> None:
+    """Process a single job. Blocking; runs on a worker thread."""
+    db = SessionLocal()
+    try:
+        # Claim the job atomically; with several server processes the same
+        # job can be recovered by more than one of them. A stale claim
+        # belongs to a worker that died mid-job.
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=JOB_STALE_AFTER)
+        claimed = db.query(TranscriptionJob).filter(
+            TranscriptionJob.id == job_id,
+            or_(
+                TranscriptionJob.status == JOB_QUEUED,
+                and_(TranscriptionJob.status == JOB_PROCESSING, TranscriptionJob.started_at < stale_before)
+            )
+        ).update({"status": JOB_PROCESSING, "started_at": now}, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            return
+        job = db.query(TranscriptionJob).filter(TranscriptionJob.id == job_id).first()
+        job_events.publish(job_id, {"event": JOB_PROCESSING})
+
+        try:
+            text = transcribe_job_audio(job_id, job.file_path)
+
+            db_transcription = Transcription(
+                user_id=job.user_id,
+                filename=job.filename,
+                transcription_text=text,
+                file_size=job.file_size,
+                duration=job.duration
+            )
+            db.add(db_transcription)
+            db.flush()
+
+            job.transcription_id = db_transcription.id
+            job.status = JOB_COMPLETED
+            settle_usage(
+                db, job.user_id, db_transcription.id,
+                reserved=job.reserved_minutes or 0,
+                minutes=billable_minutes(job.duration),
+                period=job.billing_period or current_period()
+            )
+
+            if job.content_hash:
+                transcript_cache.set(transcript_cache_key(job.content_hash), text)
+        except Exception as e:
+            db.rollback()
+            job = db.query(TranscriptionJob).filter(TranscriptionJob.id == job_id).first()
+            job.status = JOB_FAILED
+            job.error = f"Transcription failed: {str(e)}"
+            if job.reserved_minutes:
+                release_usage(db, job.user_id, job.reserved_minutes, job.billing_period or current_period())
+            logger.exception("Transcription job %s failed", job_id)
+
+        job.finished_at = datetime.utcnow()
+        with stage("worker_db_commit"):
+            db.commit()
+        
+        if job.status == JOB_COMPLETED:
+            job_events.publish(job_id, {"event": JOB_COMPLETED, "transcription_id": job.transcription_id})
+        else:
+            job_events.publish(job_id, {"event": JOB_FAILED, "error": job.error})
+
+        # Clean up the uploaded file
+        with stage("cleanup"):
+            if os.path.exists(job.file_path):
+                os.remove(job.file_path)
+    finally:
+        db.close()
+
+def complete_from_cache(db, job: TranscriptionJob, text: str) -> Transcription:
+    """Finish a new job with a previously computed transcript, without
+    calling the speech backend. Works with sync and async sessions; the
+    caller commits."""
+    db_transcription = Transcription(
+        user_id=job.user_id,
+        filename=job.filename,
+        transcription_text=text,
+        file_size=job.file_size,
+        duration=job.duration
+    )
+
+    now = datetime.utcnow()
+    job.transcription = db_transcription
+    job.status = JOB_COMPLETED
+    job.started_at = now
+    job.finished_at = now
+    db.add(job)
+    return db_transcription
+
+def recover_jobs(limit: int, stale_only: bool = False) -> List[str]:
+    """Single jobs to re-queue: those left queued by a previous run and
+    those whose worker went stale, or only the latter with ``stale_only``
+    (queued ones may be waiting in a running sibling's queue). Batch items
+    are recovered with their batch."""
+    db = SessionLocal()
+    try:
+        # Running jobs may belong to a sibling process; only take over
+        # those that have gone stale
+        stale_before = datetime.utcnow() - timedelta(seconds=JOB_STALE_AFTER)
+        stale = and_(TranscriptionJob.status == JOB_PROCESSING, TranscriptionJob.started_at < stale_before)
+        jobs = db.query(TranscriptionJob).filter(
+            TranscriptionJob.batch_id.is_(None),
+            stale if stale_only else or_(TranscriptionJob.status == JOB_QUEUED, stale)
+        ).order_by(TranscriptionJob.created_at).limit(limit).all()
+
+        recovered = []
+        for job in jobs:
+            if os.path.exists(job.file_path):
+                # Left as it is; run_transcription_job claims stale jobs too
+                recovered.append(job.id)
+            else:
+                job.status = JOB_FAILED
+                job.error = "Uploaded file was lost before processing"
+                job.finished_at = datetime.utcnow()
+                if job.reserved_minutes:
+                    release_usage(db, job.user_id, job.reserved_minutes, job.billing_period or current_period())
+        db.commit()
+        return recovered
+    finally:
+        db.close()
+
+class JobQueue:
+    """Bounded in-process queue drained by a fixed pool of workers.
+
+    Jobs are persisted in ``transcription_jobs`` before they are queued, so
+    the queue itself only carries job ids (with the time they were queued).
+    The blocking handler runs on a dedicated thread pool sized to the worker
+    count, keeping the event loop free.
+    ``recover(limit, stale_only)`` returns the ids left over from a previous
+    run, at most ``limit``; with ``stale_only`` just those whose worker
+    died, which ``sweep`` looks for while the queue runs.
+    """
+
+    def __init__(self, handler: Callable[[str], None], concurrency: int, maxsize: int,
+                 recover: Optional[Callable[[int, bool], List[str]]] = None, name: str = "transcribe"):
+        self.handler = handler
+        self.recover = recover or recover_jobs
+        self.name = name
+        self.concurrency = concurrency
+        self.maxsize = maxsize
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._held_ids: Set[str] = set()  # queued or running here; not swept again
+        self.active = 0
+        self.draining = False
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers) and not self.draining
+
+    async def start(self):
+        """Start the workers and re-queue jobs left over from a previous run"""
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self.draining = False
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix=self.name
+        )
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.concurrency)
+        ]
+        self._held_ids = set()
+        for job_id in self.recover(self.maxsize, False):
+            self._put(job_id)
+
+    async def sweep(self) -> int:
+        """Queue jobs whose worker died (in this process or another), as
+        many as there is room for; the rest wait for the next sweep.
+        Returns the number queued."""
+        if not self.running or self.pending >= self.maxsize:
+            return 0
+        loop = asyncio.get_running_loop()
+        job_ids = await loop.run_in_executor(None, self.recover, self.maxsize - self.pending, True)
+        queued = 0
+        for job_id in job_ids:
+            if job_id in self._held_ids or not self.running:
+                continue
+            try:
+                self._put(job_id)
+            except asyncio.QueueFull:
+                break
+            queued += 1
+        return queued
+
+    async def stop(self, drain_timeout: float = 0):
+        """Stop the workers. New jobs are refused at once; queued and running
+        ones get up to ``drain_timeout`` seconds to finish. Jobs still queued
+        after that stay persisted for the next start. One still running is
+        not waited for here: its thread carries on, and the interpreter
+        waits for it at exit. If the process is killed first, the job stays
+        "processing" until a sweep elsewhere takes it over once
+        JOB_STALE_AFTER has passed."""
+        self.draining = True
+        if drain_timeout > 0 and self._queue is not None and (self.pending or self.active):
+            logger.info("Draining %d queued and %d running jobs", self.pending, self.active)
+            try:
+                await asyncio.wait_for(self._queue.join(), drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Drain timed out after %.0fs; %d jobs stay queued", drain_timeout, self.pending)
+        if self.active:
+            logger.warning(
+                "%d %s jobs still running; they finish before the process exits, or if it is "
+                "killed first are re-queued %.0fs after they started",
+                self.active, self.name, JOB_STALE_AFTER
+            )
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._executor:
+            # Waiting here would block the event loop for as long as the
+            # slowest running job, whatever drain_timeout says
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, job_id: str):
+        """Queue a persisted job for processing"""
+        if self._queue is None:
+            raise RuntimeError("Job queue is not running")
+        if self.draining:
+            raise QueueFullError("Server is shutting down")
+        try:
+            self._put(job_id)
+        except asyncio.QueueFull:
+            raise QueueFullError("Transcription queue is full")
+
+    def _put(self, job_id: str):
+        self._queue.put_nowait((job_id, time.monotonic()))
+        self._held_ids.add(job_id)
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job_id, enqueued_at = await self._queue.get()
+            transcribe_stage_seconds.observe(time.monotonic() - enqueued_at, stage="queue_wait")
+            self.active += 1
+            try:
+                await loop.run_in_executor(self._executor, self.handler, job_id)
+            except Exception:
+                logger.exception("%s worker crashed while running %s", self.name, job_id)
+            finally:
+                self._held_ids.discard(job_id)
+                self.active -= 1
+                self._queue.task_done()
+
+job_queue = JobQueue(
+    run_transcription_job,
+    concurrency=TRANSCRIPTION_WORKERS,
+    maxsize=TRANSCRIPTION_QUEUE_SIZE,
+)
+
+async def run_job_sweeper(*queues: JobQueue):
+    """Background task: every JOB_SWEEP_INTERVAL, re-queue jobs on
+    ``queues`` whose worker died. Each queue already recovered at start."""
+    while True:
+        await asyncio.sleep(JOB_SWEEP_INTERVAL)
+        for queue in queues:
+            try:
+                swept = await queue.sweep()
+                if swept:
+                    logger.info("Re-queued %d stale %s jobs", swept, queue.name)
+            except Exception:
+                logger.exception("%s job sweep failed", queue.name)
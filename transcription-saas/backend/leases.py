@@ -0,0 +1,50 @@
+import os
+import socket
+import time
+import uuid
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Lease
+
+def lease_holder() -> str:
+    """A holder id unique to this process"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def take_lease(db: Session, name: str, holder: str, ttl: float) -> bool:
+    """Take the lease ``name`` for ``holder`` if it is free or has expired,
+    or extend it if ``holder`` already has it; commits either way. Returns
+    whether ``holder`` now holds it.
+
+    Takes a sync session; async callers go through ``db.run_sync``.
+    """
+    now = time.time()
+    taken = db.execute(update(Lease).where(
+        Lease.name == name,
+        or_(Lease.holder == holder, Lease.expires_at < now)
+    ).values(holder=holder, expires_at=now + ttl).execution_options(synchronize_session=False))
+    if taken.rowcount:
+        db.commit()
+        return True
+    if db.get(Lease, name) is not None:
+        db.rollback()
+        return False
+    db.add(Lease(name=name, holder=holder, expires_at=now + ttl))
+    try:
+        db.commit()
+        return True
+    except IntegrityError:
+        # Another process created it first
+        db.rollback()
+        return False
+
+def release_lease(db: Session, name: str, holder: str):
+    """Give up ``name`` if ``holder`` still has it, so the next taker
+    needn't wait for it to expire"""
+    db.execute(update(Lease).where(
+        Lease.name == name,
+        Lease.holder == holder
+    ).values(expires_at=0).execution_options(synchronize_session=False))
+    db.commit()
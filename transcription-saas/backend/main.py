@@ -1,34 +1,107 @@
-from fastapi import FastAPI, File, UploadFile, Depends, HTTPException, status, Request
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Query, Response, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-import openai
+from fastapi.responses import ORJSONResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import and_, delete, func, or_, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import logging
 import os
-from typing import List, Optional
 import uuid
-import aiofiles
-from datetime import datetime, timedelta
-import stripe
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Optional, Union
 from decouple import config
 
-from database import get_db, engine, Base
-from models import User, Transcription, APIKey
-from subscription_models import Subscription, Usage
+from database import get_db, engine, async_engine, IS_SQLITE
+from models import (
+    User, Transcription, APIKey, TranscriptionJob, TranscriptionStats, TranscriptionBatch,
+    UploadSession, insert_transcriptions
+)
+from subscription_models import Subscription, Usage, UsagePeriod
 from schemas import (
     UserCreate, UserResponse, TranscriptionResponse, 
     TranscriptionCreate, APIKeyCreate, APIKeyResponse,
-    SubscriptionCreate, SubscriptionResponse
+    SubscriptionCreate, SubscriptionResponse, UsagePeriodResponse, JobResponse,
+    TranscriptionSummary, TranscriptionPage,
+    TranscriptionSearchHit, TranscriptionSearchPage, StatsPeriod, StatsResponse,
+    BatchItem, BatchResponse, UploadCreate, UploadSessionResponse
+)
+from auth import (
+    create_access_token, password_hasher,
+    get_current_user, get_api_caller, CurrentUser, run_api_key_refresher,
+    generate_api_key, hash_api_key, api_key_prefix, auth_cache, api_key_cache, unknown_api_key_cache
+)
+from payment import get_payment_service, close_payment_service
+from webhooks import record_webhook_event, webhook_consumer
+from jobs import (
+    job_queue, complete_from_cache, run_job_sweeper, QueueFullError,
+    JOB_QUEUED, JOB_COMPLETED, JOB_FAILED, JOB_DRAIN_TIMEOUT
+)
+from batches import batch_queue, batch_concurrency, BATCH_MAX_FILES
+from dedup import transcript_cache, transcript_cache_key
+from uploads import (
+    receive_audio_uploads, extract_archive, new_upload_path, SavedUpload,
+    AUDIO_UPLOAD_OPENAPI, BATCH_UPLOAD_OPENAPI, MAX_UPLOAD_SIZE, UPLOAD_DIR
+)
+from resumable import (
+    append_chunk, hash_file, parse_checksum, preallocate, remove_upload_file,
+    run_upload_sweeper, upload_expiry, UPLOAD_FINALIZING, UPLOAD_UPLOADING
+)
+from pipeline import remove_temp_files
+from progress import job_events, JobEventResponse, TooManySubscribersError
+from audio_probe import probe_audio, AudioInfo, AudioProbeError
+from pagination import encode_cursor, decode_cursor
+from serialization import TrustedResponse, trusted
+from search import search_transcriptions
+from ratelimit import transcribe_rate_limit, batch_rate_limit, plan_for_user
+from compression import CompressionMiddleware
+from metrics import METRICS_ENABLED, REGISTRY, MetricsMiddleware, counter, gauge, stage
+from metering import (
+    billable_minutes, current_period, create_default_subscription,
+    reserve_minutes, release_usage
 )
-from auth import create_access_token, verify_token, get_password_hash, verify_password
-from payment import payment_service
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+# The schema is managed by Alembic migrations (python migrate.py), run once
+# per deploy; nothing here touches the database at import
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    job_events.bind(asyncio.get_running_loop())
+    await job_queue.start()
+    await batch_queue.start()
+    app.state.api_key_refresher = asyncio.create_task(run_api_key_refresher())
+    app.state.upload_sweeper = asyncio.create_task(run_upload_sweeper())
+    app.state.job_sweeper = asyncio.create_task(run_job_sweeper(job_queue, batch_queue))
+    webhook_consumer.start()
+    try:
+        yield
+    finally:
+        # The server has stopped taking requests by now; let this process's
+        # transcriptions finish before it exits
+        await webhook_consumer.stop()
+        app.state.api_key_refresher.cancel()
+        app.state.upload_sweeper.cancel()
+        app.state.job_sweeper.cancel()
+        # Both queues drain at once, within the same time budget
+        await asyncio.gather(
+            job_queue.stop(drain_timeout=JOB_DRAIN_TIMEOUT),
+            batch_queue.stop(drain_timeout=JOB_DRAIN_TIMEOUT)
+        )
+        await close_payment_service()
+        password_hasher.shutdown()
+        removed = remove_temp_files(UPLOAD_DIR, pid=os.getpid())
+        if removed:
+            logger.info("Removed %d temp files from %s", removed, UPLOAD_DIR)
 
 app = FastAPI(
     title="AI Voice Transcription SaaS",
     description="A powerful AI-powered voice transcription service",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -40,44 +113,115 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# br/gzip for large JSON bodies, negotiated from Accept-Encoding
+app.add_middleware(CompressionMiddleware)
+
+# Request counts and latency per route, served on /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Runtime state read at scrape time; getters so nothing is built before use
+CACHES = {
+    "transcript": lambda: transcript_cache,
+    "auth": lambda: auth_cache,
+    "api_key": lambda: api_key_cache,
+    "api_key_unknown": lambda: unknown_api_key_cache,
+    "stripe_customer": lambda: get_payment_service().customer_cache,
+}
+DB_ENGINES = {"sync": engine, "async": async_engine.sync_engine}
+
+def _cache_stat(field):
+    return lambda: [({"cache": name}, cache().stats()[field]) for name, cache in CACHES.items()]
+
+def _pool_stats():
+    for name, db_engine in DB_ENGINES.items():
+        pool = db_engine.pool
+        if hasattr(pool, "checkedout"):
+            yield {"engine": name, "state": "checked_out"}, pool.checkedout()
+            yield {"engine": name, "state": "idle"}, pool.checkedin()
+            yield {"engine": name, "state": "overflow"}, max(0, pool.overflow())
+
+gauge("transcription_jobs_queued", "Jobs waiting for a worker", collect=lambda: [({}, job_queue.pending)])
+gauge("transcription_jobs_running", "Jobs being processed by a worker", collect=lambda: [({}, job_queue.active)])
+gauge("transcription_batches_queued", "Batches waiting for a worker", collect=lambda: [({}, batch_queue.pending)])
+gauge("transcription_batches_running", "Batches being processed by a worker", collect=lambda: [({}, batch_queue.active)])
+gauge("password_hashes_pending", "Password hashes queued or running", collect=lambda: [({}, password_hasher.pending)])
+gauge("job_event_streams", "Open job event streams", collect=lambda: [({}, job_events.subscriber_count)])
+gauge("db_pool_connections", "Database pool connections by state", ("engine", "state"), collect=_pool_stats)
+gauge("cache_entries", "Entries held per cache", ("cache",), collect=_cache_stat("entries"))
+gauge("cache_bytes", "Bytes held per cache (where sized)", ("cache",), collect=_cache_stat("bytes"))
+counter("cache_hits_total", "Cache hits", ("cache",), collect=_cache_stat("hits"))
+counter("cache_misses_total", "Cache misses", ("cache",), collect=_cache_stat("misses"))
+counter("cache_evictions_total", "Entries evicted for space", ("cache",), collect=_cache_stat("evictions"))
+
 # Configuration
-OPENAI_API_KEY = config("OPENAI_API_KEY", default="")
-STRIPE_SECRET_KEY = config("STRIPE_SECRET_KEY", default="")
-JWT_SECRET_KEY = config("JWT_SECRET_KEY", default="your-secret-key-here")
+TEXT_PREVIEW_LENGTH = config("TEXT_PREVIEW_LENGTH", default=200, cast=int)
 
-openai.api_key = OPENAI_API_KEY
-stripe.api_key = STRIPE_SECRET_KEY
+def job_to_response(job: TranscriptionJob, t: Optional[Transcription] = None) -> JobResponse:
+    transcription = trusted(TranscriptionResponse, t) if t is not None else None
+    return trusted(JobResponse, job, transcription=transcription)
 
-security = HTTPBearer()
+def upload_to_response(upload: UploadSession) -> UploadSessionResponse:
+    return trusted(UploadSessionResponse, upload, offset=upload.bytes_received)
 
-# Upload directory
-UPLOAD_DIR = "/tmp/uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+def batch_to_response(batch: TranscriptionBatch, jobs: List[TranscriptionJob]) -> BatchResponse:
+    return trusted(
+        BatchResponse, batch,
+        items=[trusted(BatchItem, job) for job in jobs],
+        completed=sum(job.status == JOB_COMPLETED for job in jobs),
+        failed=sum(job.status == JOB_FAILED for job in jobs)
+    )
 
 @app.get("/")
 async def root():
     return {"message": "AI Voice Transcription SaaS API", "version": "1.0.0"}
 
+@app.get("/health", include_in_schema=False)
+async def health():
+    """Liveness: the process is up and serving"""
+    return {"status": "ok"}
+
+@app.get("/ready", include_in_schema=False)
+async def ready(db: AsyncSession = Depends(get_db)):
+    """Readiness: the database answers and this process still takes jobs"""
+    try:
+        await db.execute(text("SELECT 1"))
+    except Exception:
+        logger.exception("Readiness check failed")
+        return ORJSONResponse({"status": "unavailable", "reason": "database"}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    if not job_queue.running:
+        return ORJSONResponse({"status": "unavailable", "reason": "draining"}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return {"status": "ok"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.post("/auth/register", response_model=UserResponse)
-async def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     # Check if user already exists
-    existing_user = db.query(User).filter(User.email == user.email).first()
+    existing_user = await db.scalar(select(User).where(User.email == user.email))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
+    # Hand the connection back while bcrypt runs; a login burst would
+    # otherwise hold the whole pool
+    await db.close()
     
     # Create new user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await password_hasher.hash(user.password)
     db_user = User(
         email=user.email,
         hashed_password=hashed_password,
         full_name=user.full_name
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     return UserResponse(
         id=db_user.id,
@@ -88,9 +232,11 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
     )
 
 @app.post("/auth/login")
-async def login(email: str, password: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == email).first()
-    if not user or not verify_password(password, user.hashed_password):
+async def login(email: str, password: str, db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(User).where(User.email == email))
+    # Hand the connection back while bcrypt runs (see register)
+    await db.close()
+    if not user or not await password_hasher.verify(password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
@@ -99,131 +245,609 @@ async def login(email: str, password: str, db: Session = Depends(get_db)):
     access_token = create_access_token(data={"sub": user.email})
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.post("/transcribe", response_model=TranscriptionResponse)
+@app.post(
+    "/transcribe",
+    response_model=JobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    openapi_extra=AUDIO_UPLOAD_OPENAPI
+)
 async def transcribe_audio(
-    file: UploadFile = File(...),
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    request: Request,
+    user: CurrentUser = Depends(transcribe_rate_limit),
+    db: AsyncSession = Depends(get_db)
 ):
-    # Verify token and get user
-    user_email = verify_token(credentials.credentials)
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
+    # Stream the upload to disk; type and size are checked while reading
+    with stage("upload"):
+        upload = (await receive_audio_uploads(request))[0]
+    return await queue_transcription(db, user, upload)
+
+# Quota or queue full: the upload itself was fine and may be retried
+REFUSAL_STATUSES = (status.HTTP_402_PAYMENT_REQUIRED, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+async def queue_transcription(
+    db: AsyncSession,
+    user: CurrentUser,
+    upload: SavedUpload,
+    keep_on_refusal: bool = False
+) -> TrustedResponse:
+    """Turn an upload that is on disk into a job: probe it, answer it from
+    the cache or reserve quota and queue it. Whatever goes wrong, the file
+    is removed, except that with ``keep_on_refusal`` it stays in place when
+    the quota or the queue is full, so the caller can try again without
+    sending it a second time."""
+    try:
+        return await _queue_transcription(db, user, upload)
+    except HTTPException as e:
+        if not (keep_on_refusal and e.status_code in REFUSAL_STATUSES):
+            upload.discard()
+        raise
+    except BaseException:
+        upload.discard()
+        raise
+
+async def _queue_transcription(db: AsyncSession, user: CurrentUser, upload: SavedUpload) -> TrustedResponse:
+    # Read duration from the container headers; reject anything we can't
+    # parse before it costs a backend call
+    try:
+        with stage("probe"):
+            audio = await run_in_threadpool(probe_audio, upload.file_path)
+    except AudioProbeError as e:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported or corrupt audio file: {e}"
         )
     
-    # Check file type
-    if not file.content_type.startswith('audio/'):
+    db_job = TranscriptionJob(
+        id=upload.file_id,
+        user_id=user.id,
+        filename=upload.filename,
+        file_path=upload.file_path,
+        file_size=upload.file_size,
+        duration=audio.duration,
+        content_hash=upload.content_hash,
+        status=JOB_QUEUED
+    )
+    
+    # Identical audio already transcribed: answer from the cache. No backend
+    # call is made, so no quota is taken
+    cached_text = transcript_cache.get(transcript_cache_key(upload.content_hash))
+    if cached_text is not None:
+        db_transcription = complete_from_cache(db, db_job, cached_text)
+        await db.commit()
+        await db.refresh(db_job)
+        await db.refresh(db_transcription)
+        upload.discard()
+        return TrustedResponse(job_to_response(db_job, db_transcription), status_code=status.HTTP_202_ACCEPTED)
+    
+    # Hold quota for the job; settled when it finishes
+    db_job.reserved_minutes = billable_minutes(audio.duration)
+    db_job.billing_period = current_period()
+    if not await reserve_minutes(db, user.id, db_job.reserved_minutes, db_job.billing_period):
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail="Monthly transcription limit reached"
+        )
+    
+    # Persist the job together with its reservation, then hand it to the worker pool
+    db.add(db_job)
+    with stage("db_commit"):
+        await db.commit()
+    await db.refresh(db_job)
+    
+    try:
+        job_queue.submit(db_job.id)
+    except QueueFullError as e:
+        await release_usage(db, user.id, db_job.reserved_minutes, db_job.billing_period)
+        await db.delete(db_job)
+        await db.commit()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "30"}
+        )
+    
+    return TrustedResponse(job_to_response(db_job), status_code=status.HTTP_202_ACCEPTED)
+
+@app.post(
+    "/transcribe/batch",
+    response_model=BatchResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    openapi_extra=BATCH_UPLOAD_OPENAPI
+)
+async def transcribe_batch(
+    request: Request,
+    user: CurrentUser = Depends(batch_rate_limit),
+    db: AsyncSession = Depends(get_db)
+):
+    """Queue many recordings in one request: repeated ``files`` parts, a zip
+    ``archive`` of them, or both. Each item gets its own job and status;
+    all of them are persisted in one commit and transcribed together, up to
+    the plan's batch concurrency at a time. Poll GET /batches/{id}."""
+    with stage("upload"):
+        uploads = await receive_audio_uploads(
+            request, field_name="files", max_files=BATCH_MAX_FILES, archive_field="archive"
+        )
+    
+    files = [upload for upload in uploads if not upload.is_archive]
+    try:
+        for archive in (upload for upload in uploads if upload.is_archive):
+            files += await run_in_threadpool(extract_archive, archive, BATCH_MAX_FILES)
+        if len(files) > BATCH_MAX_FILES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"At most {BATCH_MAX_FILES} file(s) may be uploaded per request"
+            )
+        if not files:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No audio files found in the request"
+            )
+        # Probe every file at once; one that can't be parsed fails on its own
+        with stage("probe"):
+            probes = await asyncio.gather(
+                *(run_in_threadpool(probe_audio, upload.file_path) for upload in files),
+                return_exceptions=True
+            )
+        for probe in probes:
+            if isinstance(probe, BaseException) and not isinstance(probe, AudioProbeError):
+                raise probe
+    except BaseException:
+        for upload in uploads + files:
+            upload.discard()
+        raise
+    
+    try:
+        return await _queue_batch(db, user, files, probes)
+    except BaseException:
+        for upload in files:
+            upload.discard()
+        raise
+
+async def _queue_batch(
+    db: AsyncSession,
+    user: CurrentUser,
+    files: List[SavedUpload],
+    probes: List[Union[AudioInfo, AudioProbeError]]
+) -> TrustedResponse:
+    now = datetime.utcnow()
+    period = current_period()
+    batch = TranscriptionBatch(
+        id=uuid.uuid4().hex,
+        user_id=user.id,
+        status=JOB_QUEUED,
+        item_count=len(files),
+        concurrency=batch_concurrency(await plan_for_user(db, user.id))
+    )
+    jobs, cached, queued = [], [], []
+    for upload, audio in zip(files, probes):
+        job = TranscriptionJob(
+            id=upload.file_id,
+            user_id=user.id,
+            batch_id=batch.id,
+            filename=upload.filename,
+            file_path=upload.file_path,
+            file_size=upload.file_size,
+            content_hash=upload.content_hash,
+            status=JOB_QUEUED,
+            reserved_minutes=0,
+            billing_period=period
+        )
+        jobs.append(job)
+        if isinstance(audio, AudioProbeError):
+            job.status = JOB_FAILED
+            job.error = f"Unsupported or corrupt audio file: {audio}"
+            job.finished_at = now
+            upload.discard()
+            continue
+        job.duration = audio.duration
+        cached_text = transcript_cache.get(transcript_cache_key(upload.content_hash))
+        if cached_text is not None:
+            # No backend call, so no quota taken
+            cached.append((job, cached_text))
+            upload.discard()
+        else:
+            job.reserved_minutes = billable_minutes(audio.duration)
+            queued.append(job)
+    
+    # One reservation for the whole batch; settled per item as they finish
+    reserved = sum(job.reserved_minutes for job in queued)
+    if reserved and not await reserve_minutes(db, user.id, reserved, period):
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail="Monthly transcription limit reached"
+        )
+    
+    # The batch, the cached transcripts (one multi-row INSERT) and every job
+    # go in with the reservation in a single commit
+    db.add(batch)
+    await db.flush()
+    ids = await db.run_sync(insert_transcriptions, [
+        dict(user_id=user.id, filename=job.filename, transcription_text=text,
+             file_size=job.file_size, duration=job.duration)
+        for job, text in cached
+    ])
+    for (job, _), transcription_id in zip(cached, ids):
+        job.transcription_id = transcription_id
+        job.status = JOB_COMPLETED
+        job.started_at = job.finished_at = now
+    if not queued:
+        batch.status = JOB_COMPLETED
+        batch.started_at = batch.finished_at = now
+    db.add_all(jobs)
+    with stage("db_commit"):
+        await db.commit()
+    await db.refresh(batch)
+    
+    if queued:
+        try:
+            batch_queue.submit(batch.id)
+        except QueueFullError as e:
+            await release_usage(db, user.id, reserved, period)
+            for job in queued:
+                job.status = JOB_FAILED
+                job.error = str(e)
+                job.finished_at = now
+            batch.status = JOB_COMPLETED
+            batch.finished_at = now
+            await db.commit()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e),
+                headers={"Retry-After": "30"}
+            )
+    
+    jobs.sort(key=lambda job: (job.filename, job.id))
+    return TrustedResponse(batch_to_response(batch, jobs), status_code=status.HTTP_202_ACCEPTED)
+
+@app.get("/batches/{batch_id}", response_model=BatchResponse)
+async def get_batch(
+    batch_id: str,
+    user: CurrentUser = Depends(get_api_caller),
+    db: AsyncSession = Depends(get_db)
+):
+    batch = await db.scalar(select(TranscriptionBatch).where(
+        TranscriptionBatch.id == batch_id,
+        TranscriptionBatch.user_id == user.id
+    ))
+    if not batch:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Batch not found"
+        )
+    
+    jobs = (await db.scalars(
+        select(TranscriptionJob)
+        .where(TranscriptionJob.batch_id == batch.id)
+        .order_by(TranscriptionJob.filename, TranscriptionJob.id)
+    )).all()
+    return TrustedResponse(batch_to_response(batch, jobs))
+
+# Resumable uploads: create, PATCH chunks at the current offset (resuming
+# from GET after a dropped connection), then finalize into a job
+
+async def _get_upload(db: AsyncSession, upload_id: str, user: CurrentUser) -> UploadSession:
+    upload = await db.scalar(select(UploadSession).where(
+        UploadSession.id == upload_id,
+        UploadSession.user_id == user.id,
+        UploadSession.expires_at >= datetime.utcnow()
+    ))
+    if not upload:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload not found"
+        )
+    return upload
+
+@app.post("/uploads", response_model=UploadSessionResponse, status_code=status.HTTP_201_CREATED)
+async def create_upload(
+    body: UploadCreate,
+    user: CurrentUser = Depends(transcribe_rate_limit),
+    db: AsyncSession = Depends(get_db)
+):
+    """Start a resumable upload. The whole file is reserved on disk up
+    front; chunks are then written into it in place."""
+    if not body.content_type.startswith('audio/'):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="File must be an audio file"
         )
+    if body.size <= 0 or body.size > MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File must be smaller than {MAX_UPLOAD_SIZE // (1024 * 1024)}MB"
+        )
     
-    # Save uploaded file
-    file_id = str(uuid.uuid4())
-    file_extension = file.filename.split('.')[-1] if '.' in file.filename else 'wav'
-    file_path = f"{UPLOAD_DIR}/{file_id}.{file_extension}"
+    file_id, file_path = new_upload_path(body.filename)
+    try:
+        await run_in_threadpool(preallocate, file_path, body.size)
+    except OSError:
+        logger.exception("Could not preallocate %d bytes for upload %s", body.size, file_id)
+        raise HTTPException(
+            status_code=status.HTTP_507_INSUFFICIENT_STORAGE,
+            detail="Not enough space for this upload"
+        )
     
-    async with aiofiles.open(file_path, 'wb') as f:
-        content = await file.read()
-        await f.write(content)
+    upload = UploadSession(
+        id=file_id,
+        user_id=user.id,
+        filename=body.filename,
+        content_type=body.content_type,
+        file_path=file_path,
+        size=body.size,
+        bytes_received=0,
+        status=UPLOAD_UPLOADING,
+        expires_at=upload_expiry()
+    )
+    db.add(upload)
+    await db.commit()
+    return TrustedResponse(
+        upload_to_response(upload),
+        status_code=status.HTTP_201_CREATED,
+        headers={"Location": f"/uploads/{file_id}", "Upload-Offset": "0"}
+    )
+
+@app.get("/uploads/{upload_id}", response_model=UploadSessionResponse)
+async def get_upload(
+    upload_id: str,
+    user: CurrentUser = Depends(get_api_caller),
+    db: AsyncSession = Depends(get_db)
+):
+    upload = await _get_upload(db, upload_id, user)
+    return TrustedResponse(
+        upload_to_response(upload),
+        headers={"Upload-Offset": str(upload.bytes_received), "Cache-Control": "no-store"}
+    )
+
+@app.patch("/uploads/{upload_id}", response_model=UploadSessionResponse)
+async def append_upload_chunk(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., description="Must equal the upload's current offset"),
+    upload_checksum: Optional[str] = Header(None, description="sha256 <base64 digest of this chunk>"),
+    user: CurrentUser = Depends(get_api_caller),
+    db: AsyncSession = Depends(get_db)
+):
+    """Append the raw request body (not multipart) at Upload-Offset"""
+    upload = await _get_upload(db, upload_id, user)
+    upload = await append_chunk(db, request, upload, upload_offset, parse_checksum(upload_checksum))
+    return TrustedResponse(upload_to_response(upload), headers={"Upload-Offset": str(upload.bytes_received)})
+
+@app.post(
+    "/uploads/{upload_id}/finalize",
+    response_model=JobResponse,
+    status_code=status.HTTP_202_ACCEPTED
+)
+async def finalize_upload(
+    upload_id: str,
+    user: CurrentUser = Depends(get_api_caller),
+    db: AsyncSession = Depends(get_db)
+):
+    """Queue a completely received upload for transcription, as /transcribe
+    does. The job takes over the file where it lies. When the quota or the
+    queue is full the upload is kept and finalize can be retried."""
+    upload = await _get_upload(db, upload_id, user)
+    claimed = await db.execute(update(UploadSession).where(
+        UploadSession.id == upload.id,
+        UploadSession.status == UPLOAD_UPLOADING,
+        UploadSession.bytes_received == UploadSession.size
+    ).values(status=UPLOAD_FINALIZING, expires_at=upload_expiry()).execution_options(synchronize_session=False))
+    await db.commit()
+    if not claimed.rowcount:
+        if upload.status == UPLOAD_FINALIZING:
+            detail = "Upload is already being finalized"
+        else:
+            detail = f"Upload is incomplete: {upload.bytes_received} of {upload.size} bytes received"
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=detail,
+            headers={"Upload-Offset": str(upload.bytes_received)}
+        )
     
+    # The chunks were checked one by one; the whole-file hash is what the
+    # transcript cache is keyed on
+    content_hash = await run_in_threadpool(hash_file, upload.file_path)
+    saved = SavedUpload(upload.id, upload.filename, upload.content_type, upload.file_path, upload.size, content_hash)
     try:
-        # Transcribe using OpenAI Whisper
-        with open(file_path, 'rb') as audio_file:
-            transcript = openai.Audio.transcribe("whisper-1", audio_file)
-        
-        # Save transcription to database
-        db_transcription = Transcription(
-            user_id=user.id,
-            filename=file.filename,
-            transcription_text=transcript.text,
-            file_size=len(content),
-            duration=0  # We could extract this from audio metadata
+        response = await queue_transcription(db, user, saved, keep_on_refusal=True)
+    except HTTPException as e:
+        if e.status_code in (status.HTTP_402_PAYMENT_REQUIRED, status.HTTP_503_SERVICE_UNAVAILABLE):
+            await db.execute(update(UploadSession).where(
+                UploadSession.id == upload.id
+            ).values(status=UPLOAD_UPLOADING).execution_options(synchronize_session=False))
+        else:
+            await db.execute(delete(UploadSession).where(UploadSession.id == upload.id))
+        await db.commit()
+        raise
+    
+    await db.execute(delete(UploadSession).where(UploadSession.id == upload.id))
+    await db.commit()
+    return response
+
+@app.delete("/uploads/{upload_id}")
+async def cancel_upload(
+    upload_id: str,
+    user: CurrentUser = Depends(get_api_caller),
+    db: AsyncSession = Depends(get_db)
+):
+    upload = await _get_upload(db, upload_id, user)
+    deleted = await db.execute(delete(UploadSession).where(
+        UploadSession.id == upload.id,
+        UploadSession.status == UPLOAD_UPLOADING
+    ))
+    await db.commit()
+    if not deleted.rowcount:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Upload is being finalized"
         )
-        db.add(db_transcription)
-        db.commit()
-        db.refresh(db_transcription)
-        
-        # Clean up uploaded file
-        os.remove(file_path)
-        
-        return TranscriptionResponse(
-            id=db_transcription.id,
-            filename=db_transcription.filename,
-            transcription_text=db_transcription.transcription_text,
-            file_size=db_transcription.file_size,
-            duration=db_transcription.duration,
-            created_at=db_transcription.created_at
+    await run_in_threadpool(remove_upload_file, upload.file_path)
+    return {"message": "Upload cancelled"}
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str,
+    user: CurrentUser = Depends(get_api_caller),
+    db: AsyncSession = Depends(get_db)
+):
+    job = await db.scalar(select(TranscriptionJob).where(
+        TranscriptionJob.id == job_id,
+        TranscriptionJob.user_id == user.id
+    ))
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    transcription = None
+    if job.transcription_id is not None:
+        transcription = await db.get(Transcription, job.transcription_id)
+    
+    return TrustedResponse(job_to_response(job, transcription))
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(
+    job_id: str,
+    user: CurrentUser = Depends(get_api_caller),
+    db: AsyncSession = Depends(get_db)
+):
+    """Server-Sent Events with the job's state changes and, for long
+    recordings, each segment's text as it is transcribed"""
+    job = await db.scalar(select(TranscriptionJob).where(
+        TranscriptionJob.id == job_id,
+        TranscriptionJob.user_id == user.id
+    ))
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
         )
     
-    except Exception as e:
-        # Clean up uploaded file in case of error
-        if os.path.exists(file_path):
-            os.remove(file_path)
+    try:
+        subscription = job_events.subscribe(job.id)
+    except TooManySubscribersError as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Transcription failed: {str(e)}"
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "5"}
         )
+    
+    return JobEventResponse(
+        job, subscription,
+        # X-Accel-Buffering stops nginx from holding events back
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-@app.get("/transcriptions", response_model=List[TranscriptionResponse])
+@app.get("/transcriptions", response_model=TranscriptionPage)
 async def get_transcriptions(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db),
-    skip: int = 0,
-    limit: int = 100
+    user: CurrentUser = Depends(get_api_caller),
+    db: AsyncSession = Depends(get_db),
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=100),
+    view: str = Query("full", pattern="^(full|summary)$")
 ):
-    user_email = verify_token(credentials.credentials)
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials"
+    # Newest first; the cursor resumes after the last row of the previous page
+    if view == "summary":
+        # Long transcripts may be stored compressed on SQLite; transcript_head
+        # inflates only the start of each one
+        if IS_SQLITE:
+            preview = func.transcript_head(Transcription.transcription_text, TEXT_PREVIEW_LENGTH)
+        else:
+            preview = func.substr(Transcription.transcription_text, 1, TEXT_PREVIEW_LENGTH)
+        query = select(
+            Transcription.id,
+            Transcription.filename,
+            preview.label("text_preview"),
+            Transcription.file_size,
+            Transcription.duration,
+            Transcription.created_at
         )
+    else:
+        query = select(Transcription)
     
-    transcriptions = db.query(Transcription).filter(
-        Transcription.user_id == user.id
-    ).offset(skip).limit(limit).all()
+    query = query.where(Transcription.user_id == user.id)
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        query = query.where(or_(
+            Transcription.created_at < cursor_created_at,
+            and_(Transcription.created_at == cursor_created_at, Transcription.id < cursor_id)
+        ))
+    result = await db.execute(query.order_by(
+        Transcription.created_at.desc(), Transcription.id.desc()
+    ).limit(limit + 1))
+    rows = result.all() if view == "summary" else result.scalars().all()
     
-    return [
-        TranscriptionResponse(
-            id=t.id,
-            filename=t.filename,
-            transcription_text=t.transcription_text,
-            file_size=t.file_size,
-            duration=t.duration,
-            created_at=t.created_at
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    
+    # Rows come straight from our own tables, so skip revalidating them
+    schema = TranscriptionSummary if view == "summary" else TranscriptionResponse
+    items = [trusted(schema, t) for t in rows]
+    
+    return TrustedResponse(TranscriptionPage.model_construct(items=items, next_cursor=next_cursor))
+
+@app.get("/transcriptions/search", response_model=TranscriptionSearchPage)
+async def search_transcriptions_endpoint(
+    q: str = Query(..., min_length=1, max_length=200),
+    user: CurrentUser = Depends(get_api_caller),
+    db: AsyncSession = Depends(get_db),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000)
+):
+    hits = await search_transcriptions(db, user.id, q, limit + 1, offset)
+    
+    next_offset = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        next_offset = offset + limit
+    
+    return TrustedResponse(TranscriptionSearchPage.model_construct(
+        items=[trusted(TranscriptionSearchHit, h) for h in hits],
+        next_offset=next_offset
+    ))
+
+@app.get("/transcriptions/{transcription_id}", response_model=TranscriptionResponse)
+async def get_transcription(
+    transcription_id: int,
+    user: CurrentUser = Depends(get_api_caller),
+    db: AsyncSession = Depends(get_db)
+):
+    transcription = await db.scalar(select(Transcription).where(
+        Transcription.id == transcription_id,
+        Transcription.user_id == user.id
+    ))
+    if not transcription:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Transcription not found"
         )
-        for t in transcriptions
-    ]
+    
+    return TrustedResponse(trusted(TranscriptionResponse, transcription))
 
 @app.post("/api-keys", response_model=APIKeyResponse)
 async def create_api_key(
     api_key_data: APIKeyCreate,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    user_email = verify_token(credentials.credentials)
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials"
-        )
-    
-    # Generate API key
-    api_key = f"tsk_{uuid.uuid4().hex}"
+    # Generate API key; only its prefix and digest are stored
+    api_key = generate_api_key()
+    while await db.scalar(select(APIKey.id).where(APIKey.prefix == api_key_prefix(api_key))):
+        api_key = generate_api_key()
     
     db_api_key = APIKey(
         user_id=user.id,
-        key=api_key,
+        prefix=api_key_prefix(api_key),
+        key_hash=hash_api_key(api_key),
         name=api_key_data.name
     )
     db.add(db_api_key)
-    db.commit()
-    db.refresh(db_api_key)
+    await db.commit()
+    await db.refresh(db_api_key)
     
     return APIKeyResponse(
         id=db_api_key.id,
@@ -234,71 +858,61 @@ async def create_api_key(
 
 @app.get("/api-keys", response_model=List[APIKeyResponse])
 async def get_api_keys(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    user_email = verify_token(credentials.credentials)
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials"
-        )
-    
-    api_keys = db.query(APIKey).filter(APIKey.user_id == user.id).all()
+    result = await db.execute(select(APIKey).where(
+        APIKey.user_id == user.id,
+        APIKey.is_active == True
+    ))
+    api_keys = result.scalars().all()
     
     return [
         APIKeyResponse(
             id=key.id,
             name=key.name,
-            key=key.key[:8] + "..." + key.key[-4:],  # Mask the key
+            key=key.prefix + "...",  # Only the prefix is known after creation
             created_at=key.created_at
         )
         for key in api_keys
     ]
 
-@app.post("/subscriptions/create-checkout", response_model=dict)
-async def create_checkout_session(
-    subscription_data: SubscriptionCreate,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+@app.delete("/api-keys/{key_id}")
+async def revoke_api_key(
+    key_id: int,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    user_email = verify_token(credentials.credentials)
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
+    api_key = await db.scalar(select(APIKey).where(
+        APIKey.id == key_id,
+        APIKey.user_id == user.id
+    ))
+    if not api_key:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="API key not found"
         )
     
-    # Check if user already has a customer ID
-    subscription = db.query(Subscription).filter(Subscription.user_id == user.id).first()
-    
-    if not subscription or not subscription.stripe_customer_id:
-        # Create Stripe customer
-        customer_id = await payment_service.create_customer(user)
-        
-        if not subscription:
-            # Create subscription record
-            subscription = Subscription(
-                user_id=user.id,
-                stripe_customer_id=customer_id,
-                plan_name=subscription_data.plan_name,
-                status="incomplete"
-            )
-            db.add(subscription)
-            db.commit()
-            db.refresh(subscription)
-        else:
-            subscription.stripe_customer_id = customer_id
-            db.commit()
+    api_key.is_active = False
+    await db.commit()
+    
+    return {"message": "API key revoked successfully"}
+
+@app.post("/subscriptions/create-checkout", response_model=dict)
+async def create_checkout_session(
+    subscription_data: SubscriptionCreate,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Cached after the first checkout; created (with a local record) if missing
+    customer_id = await get_payment_service().get_customer_id(user, db, subscription_data.plan_name)
     
     # Create checkout session
     success_url = "http://localhost:3000/dashboard?success=true"
     cancel_url = "http://localhost:3000/dashboard?canceled=true"
     
-    checkout_url = await payment_service.create_checkout_session(
-        subscription.stripe_customer_id,
+    checkout_url = await get_payment_service().create_checkout_session(
+        customer_id,
         subscription_data.price_id,
         success_url,
         cancel_url
@@ -308,31 +922,21 @@ async def create_checkout_session(
 
 @app.get("/subscriptions/current", response_model=SubscriptionResponse)
 async def get_current_subscription(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    user_email = verify_token(credentials.credentials)
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials"
-        )
-    
-    subscription = db.query(Subscription).filter(Subscription.user_id == user.id).first()
+    subscription = await db.scalar(select(Subscription).where(Subscription.user_id == user.id))
     
     if not subscription:
-        # Create default free subscription
-        subscription = Subscription(
-            user_id=user.id,
-            plan_name="starter",
-            status="active",
-            monthly_transcription_limit=60,
-            monthly_transcription_used=0
-        )
-        db.add(subscription)
-        db.commit()
-        db.refresh(subscription)
+        # Create default free subscription; a concurrent request may beat us to it
+        await create_default_subscription(db, user.id)
+        await db.commit()
+        subscription = await db.scalar(select(Subscription).where(Subscription.user_id == user.id))
+    
+    # The counter only carries over within its own billing period
+    used = subscription.monthly_transcription_used
+    if subscription.usage_period != current_period():
+        used = 0
     
     return SubscriptionResponse(
         id=subscription.id,
@@ -342,24 +946,67 @@ async def get_current_subscription(
         current_period_end=subscription.current_period_end,
         cancel_at_period_end=subscription.cancel_at_period_end,
         monthly_transcription_limit=subscription.monthly_transcription_limit,
-        monthly_transcription_used=subscription.monthly_transcription_used,
+        monthly_transcription_used=used,
         created_at=subscription.created_at
     )
 
-@app.post("/subscriptions/cancel")
-async def cancel_subscription(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+@app.get("/usage", response_model=List[UsagePeriodResponse])
+async def get_usage(
+    limit: int = Query(12, ge=1, le=120),
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    user_email = verify_token(credentials.credentials)
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials"
+    """Billed minutes and transcription counts per billing period, newest first"""
+    result = await db.scalars(
+        select(UsagePeriod)
+        .where(UsagePeriod.user_id == user.id)
+        .order_by(UsagePeriod.period.desc())
+        .limit(limit)
+    )
+    return result.all()
+
+@app.get("/stats", response_model=StatsResponse)
+async def get_stats(
+    months: int = Query(12, ge=1, le=120),
+    user: CurrentUser = Depends(get_api_caller),
+    db: AsyncSession = Depends(get_db)
+):
+    """Totals and per-month figures from the rollup rows (one per month)
+    kept current as transcriptions are written"""
+    result = await db.scalars(
+        select(TranscriptionStats)
+        .where(TranscriptionStats.user_id == user.id)
+        .order_by(TranscriptionStats.period.desc())
+    )
+    periods = [
+        StatsPeriod(
+            period=row.period,
+            transcription_count=row.transcription_count,
+            minutes=row.duration_seconds / 60,
+            total_bytes=row.total_bytes
         )
+        for row in result.all()
+    ]
     
-    subscription = db.query(Subscription).filter(Subscription.user_id == user.id).first()
+    period = current_period()
+    this_month = next(
+        (p for p in periods if p.period == period),
+        StatsPeriod(period=period, transcription_count=0, minutes=0, total_bytes=0)
+    )
+    return StatsResponse(
+        transcription_count=sum(p.transcription_count for p in periods),
+        minutes=sum(p.minutes for p in periods),
+        total_bytes=sum(p.total_bytes for p in periods),
+        this_month=this_month,
+        months=periods[:months]
+    )
+
+@app.post("/subscriptions/cancel")
+async def cancel_subscription(
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    subscription = await db.scalar(select(Subscription).where(Subscription.user_id == user.id))
     
     if not subscription or not subscription.stripe_subscription_id:
         raise HTTPException(
@@ -368,41 +1015,28 @@ async def cancel_subscription(
         )
     
     # Cancel subscription in Stripe
-    result = await payment_service.cancel_subscription(subscription.stripe_subscription_id)
+    result = await get_payment_service().cancel_subscription(subscription.stripe_subscription_id)
     
     # Update local subscription
     subscription.status = "canceled"
     subscription.cancel_at_period_end = True
-    db.commit()
+    await db.commit()
     
     return {"message": "Subscription canceled successfully", "status": result["status"]}
 
 @app.post("/webhooks/stripe")
-async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
+async def stripe_webhook(request: Request, db: AsyncSession = Depends(get_db)):
     payload = await request.body()
     sig_header = request.headers.get("stripe-signature")
     
-    try:
-        event_data = await payment_service.handle_webhook(payload.decode(), sig_header)
-        
-        # Handle different event types
-        if event_data["type"] == "subscription_created":
-            subscription_data = event_data["subscription"]
-            # Update local subscription record
-            # Implementation depends on your needs
-            
-        elif event_data["type"] == "subscription_updated":
-            subscription_data = event_data["subscription"]
-            # Update local subscription record
-            
-        elif event_data["type"] == "subscription_deleted":
-            subscription_data = event_data["subscription"]
-            # Mark subscription as canceled
-            
-        return {"status": "success"}
-        
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    event = get_payment_service().verify_webhook(payload, sig_header)
+    
+    # Persist and acknowledge at once; the consumer applies events in the
+    # background. Redelivered events are acknowledged without a second copy
+    if await record_webhook_event(db, event):
+        webhook_consumer.notify()
+    
+    return {"status": "success"}
 
 if __name__ == "__main__":
     import uvicorn
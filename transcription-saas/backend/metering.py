@@ -0,0 +1,152 @@
+import math
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import case, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from subscription_models import Subscription, Usage, UsagePeriod
+
+# Monthly minutes per plan; None is unlimited
+PLAN_LIMITS = {
+    "starter": 60,
+    "professional": 500,
+    "enterprise": None,
+}
+
+# Starter plan granted to users without a subscription row
+DEFAULT_PLAN_NAME = "starter"
+DEFAULT_MONTHLY_LIMIT = PLAN_LIMITS[DEFAULT_PLAN_NAME]
+
+def current_period(now: Optional[datetime] = None) -> str:
+    """Billing period label, one per calendar month (UTC)"""
+    return (now or datetime.utcnow()).strftime("%Y-%m")
+
+def billable_minutes(duration_seconds: Optional[float]) -> int:
+    """Minutes charged for a recording: rounded up, at least one"""
+    return max(1, math.ceil((duration_seconds or 0) / 60))
+
+def new_default_subscription(user_id: int) -> Subscription:
+    return Subscription(
+        user_id=user_id,
+        plan_name=DEFAULT_PLAN_NAME,
+        status="active",
+        monthly_transcription_limit=DEFAULT_MONTHLY_LIMIT,
+        monthly_transcription_used=0,
+        usage_period=current_period()
+    )
+
+def _used_in(period: str):
+    # The counter belongs to usage_period; a new period starts from zero
+    return case(
+        (Subscription.usage_period == period, Subscription.monthly_transcription_used),
+        else_=0
+    )
+
+def reserve_statement(user_id: int, minutes: int, period: str):
+    """Single UPDATE that takes ``minutes`` of quota only if it fits.
+
+    The check and the increment happen in one statement, so concurrent
+    uploads can't both pass the check and overrun the limit. A NULL limit
+    means unlimited.
+    """
+    used = _used_in(period)
+    return update(Subscription).where(
+        Subscription.user_id == user_id,
+        or_(
+            Subscription.monthly_transcription_limit.is_(None),
+            used + minutes <= Subscription.monthly_transcription_limit
+        )
+    ).values(
+        monthly_transcription_used=used + minutes,
+        usage_period=period
+    ).execution_options(synchronize_session=False)
+
+def adjust_statement(user_id: int, delta: int, period: str):
+    """Move the counter by ``delta`` without a limit check (settling and
+    releasing reservations), never below zero. Only while the counter
+    still belongs to ``period``: once a new month has started, a
+    reservation from the old one has nothing left to correct."""
+    used = Subscription.monthly_transcription_used
+    return update(Subscription).where(
+        Subscription.user_id == user_id,
+        Subscription.usage_period == period
+    ).values(
+        monthly_transcription_used=case((used + delta < 0, 0), else_=used + delta)
+    ).execution_options(synchronize_session=False)
+
+async def create_default_subscription(db: AsyncSession, user_id: int) -> Optional[Subscription]:
+    """Give a user without a subscription row the default plan, in the
+    caller's transaction. Returns None if they already have one, including
+    one a concurrent request just created (user_id is unique)."""
+    if await db.scalar(select(Subscription.id).where(Subscription.user_id == user_id)):
+        return None
+    subscription = new_default_subscription(user_id)
+    try:
+        async with db.begin_nested():
+            db.add(subscription)
+    except IntegrityError:
+        return None
+    return subscription
+
+async def reserve_minutes(db: AsyncSession, user_id: int, minutes: int, period: str) -> bool:
+    """Reserve quota before work is queued. Returns False when the user's
+    plan has no room left this period; the caller commits the reservation
+    together with the job that holds it."""
+    result = await db.execute(reserve_statement(user_id, minutes, period))
+    if result.rowcount == 0:
+        # No room, or no subscription row yet: create the default one (or
+        # find that another request has) and try once more
+        await create_default_subscription(db, user_id)
+        result = await db.execute(reserve_statement(user_id, minutes, period))
+    return result.rowcount == 1
+
+def _add_to_rollup(db: Session, user_id: int, period: str, minutes: float, count: int = 1):
+    values = dict(
+        minutes_used=UsagePeriod.minutes_used + minutes,
+        transcription_count=UsagePeriod.transcription_count + count
+    )
+    rollup = update(UsagePeriod).where(
+        UsagePeriod.user_id == user_id,
+        UsagePeriod.period == period
+    ).values(**values).execution_options(synchronize_session=False)
+    if db.execute(rollup).rowcount:
+        return
+    try:
+        with db.begin_nested():
+            db.add(UsagePeriod(user_id=user_id, period=period, minutes_used=minutes, transcription_count=count))
+    except IntegrityError:
+        # Another worker created the row first
+        db.execute(rollup)
+
+def settle_usage(db: Session, user_id: int, transcription_id: int, reserved: int, minutes: int, period: str):
+    """Record a finished transcription: correct the reservation to the
+    billed minutes, log a Usage row and bump the per-period rollup.
+    Runs in the caller's transaction."""
+    if minutes != reserved:
+        db.execute(adjust_statement(user_id, minutes - reserved, period))
+    db.add(Usage(user_id=user_id, transcription_id=transcription_id, duration_minutes=minutes))
+    _add_to_rollup(db, user_id, period, minutes)
+
+def settle_usage_many(db: Session, user_id: int, period: str, settled: List[Tuple[int, int, int]]):
+    """settle_usage for many of one user's transcriptions at once, given as
+    (transcription_id, reserved, minutes): one counter correction, one
+    multi-row Usage INSERT and one rollup update whatever their number."""
+    if not settled:
+        return
+    delta = sum(minutes - reserved for _, reserved, minutes in settled)
+    if delta:
+        db.execute(adjust_statement(user_id, delta, period))
+    db.execute(insert(Usage), [
+        {"user_id": user_id, "transcription_id": transcription_id, "duration_minutes": minutes}
+        for transcription_id, _, minutes in settled
+    ])
+    _add_to_rollup(db, user_id, period, sum(minutes for _, _, minutes in settled), count=len(settled))
+
+def release_usage(db, user_id: int, reserved: int, period: str):
+    """Give back a reservation for work that failed or was never queued.
+    Returns the statement result (awaitable on async sessions); runs in the
+    caller's transaction."""
+    return db.execute(adjust_statement(user_id, -reserved, period))
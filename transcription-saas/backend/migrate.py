@@ -0,0 +1,31 @@
+"""Bring the database schema up to date.
+
+Run once per deploy, before any app worker starts, so workers never race
+on DDL. Run from backend/:
+
+    python migrate.py
+"""
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+
+from database import engine
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+
+# Schema that main.py used to create on import with create_all
+BASELINE_REVISION = "0001"
+
+def main():
+    alembic_config = Config(ALEMBIC_INI)
+    tables = set(inspect(engine).get_table_names())
+    if "users" in tables and "alembic_version" not in tables:
+        # Created by create_all before migrations existed; adopt it rather
+        # than creating the tables again
+        command.stamp(alembic_config, BASELINE_REVISION)
+    command.upgrade(alembic_config, "head")
+
+if __name__ == "__main__":
+    main()
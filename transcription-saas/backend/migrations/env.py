@@ -0,0 +1,42 @@
+from logging.config import fileConfig
+
+from alembic import context
+
+from database import Base, IS_SQLITE, engine
+import models  # noqa: F401  (registers the tables on Base.metadata)
+import subscription_models  # noqa: F401
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+def run_migrations_offline():
+    """Emit the SQL instead of running it (``alembic upgrade head --sql``)"""
+    context.configure(
+        url=str(engine.url),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        render_as_batch=IS_SQLITE,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online():
+    # The application's engine, so SQLite connections get the same pragmas
+    # and SQL functions (transcript_text) as the app
+    with engine.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            # SQLite can't ALTER most things in place; batch mode copies the table
+            render_as_batch=IS_SQLITE,
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
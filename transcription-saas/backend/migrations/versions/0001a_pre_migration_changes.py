@@ -0,0 +1,144 @@
+"""Schema changes made before migrations existed
+
+Until 0001 was written, main.py ran create_all on every start. That
+creates missing tables but never alters existing ones, so a database from
+that time has the original tables as first created plus whichever newer
+tables existed when it last started. This revision brings any such
+database, and a new one, to the schema 0002 onwards build on: missing
+tables are created, missing columns and indexes added, and plaintext API
+keys replaced by a prefix and a SHA-256 digest.
+
+Revision ID: 0001a
+Revises: 0001
+Create Date: 2026-10-16
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001a"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+# Leading characters of a key kept in the clear to look it up by; matches
+# auth.API_KEY_PREFIX_LENGTH
+API_KEY_PREFIX_LENGTH = 16
+
+def _tables():
+    """Tables (or columns of tables) added after the original schema. Built
+    fresh on each call since a Column belongs to one table only."""
+    return {
+        "transcription_jobs": [
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("filename", sa.String(), nullable=False),
+            sa.Column("file_path", sa.String(), nullable=False),
+            sa.Column("file_size", sa.Integer(), nullable=False),
+            sa.Column("duration", sa.Float(), nullable=True),
+            sa.Column("content_hash", sa.String(64), nullable=True),
+            sa.Column("status", sa.String(), nullable=False),
+            sa.Column("error", sa.Text(), nullable=True),
+            sa.Column("transcription_id", sa.Integer(), sa.ForeignKey("transcriptions.id"), nullable=True),
+            sa.Column("reserved_minutes", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("billing_period", sa.String(7), nullable=True),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+            sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        ],
+        "rate_limit_buckets": [
+            sa.Column("key", sa.String(), primary_key=True),
+            sa.Column("tokens", sa.Float(), nullable=False),
+            sa.Column("updated_at", sa.Float(), nullable=False),
+        ],
+        "subscriptions": [
+            sa.Column("usage_period", sa.String(7), nullable=True),
+            sa.Column("stripe_event_created", sa.Integer(), nullable=True),
+        ],
+        "usage_periods": [
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("period", sa.String(7), nullable=False),
+            sa.Column("minutes_used", sa.Float(), nullable=False, server_default="0"),
+            sa.Column("transcription_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.UniqueConstraint("user_id", "period", name="uq_usage_periods_user_period"),
+        ],
+        "webhook_events": [
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("type", sa.String(), nullable=False),
+            sa.Column("object_id", sa.String(), nullable=True),
+            sa.Column("payload", sa.Text(), nullable=False),
+            sa.Column("stripe_created", sa.Integer(), nullable=False),
+            sa.Column("status", sa.String(), nullable=False),
+            sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("error", sa.Text(), nullable=True),
+            sa.Column("received_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("processed_at", sa.DateTime(timezone=True), nullable=True),
+        ],
+    }
+
+INDEXES = [
+    ("ix_transcriptions_user_created_id", "transcriptions", ["user_id", "created_at", "id"], False),
+    ("ix_transcription_jobs_id", "transcription_jobs", ["id"], False),
+    ("ix_transcription_jobs_user_id", "transcription_jobs", ["user_id"], False),
+    ("ix_transcription_jobs_content_hash", "transcription_jobs", ["content_hash"], False),
+    ("ix_transcription_jobs_status", "transcription_jobs", ["status"], False),
+    ("ix_usage_periods_id", "usage_periods", ["id"], False),
+    ("ix_webhook_events_status_created", "webhook_events", ["status", "stripe_created"], False),
+]
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    existing = set(inspector.get_table_names())
+
+    for table, columns in _tables().items():
+        if table not in existing:
+            op.create_table(table, *columns)
+            continue
+        present = {column["name"] for column in inspector.get_columns(table)}
+        missing = [c for c in columns if isinstance(c, sa.Column) and c.name not in present]
+        if missing:
+            with op.batch_alter_table(table) as batch_op:
+                for column in missing:
+                    batch_op.add_column(column)
+
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns, unique in INDEXES:
+        if name not in {index["name"] for index in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns, unique=unique)
+
+    _hash_api_keys(inspector)
+
+def _hash_api_keys(inspector):
+    """Replace api_keys.key (the key in the clear) by prefix and key_hash"""
+    present = {column["name"] for column in inspector.get_columns("api_keys")}
+    if "key" not in present:
+        return
+    with op.batch_alter_table("api_keys") as batch_op:
+        if "prefix" not in present:
+            batch_op.add_column(sa.Column("prefix", sa.String(16), nullable=True))
+        if "key_hash" not in present:
+            batch_op.add_column(sa.Column("key_hash", sa.String(64), nullable=True))
+
+    bind = op.get_bind()
+    api_keys = sa.table("api_keys", sa.column("id"), sa.column("key"), sa.column("prefix"), sa.column("key_hash"))
+    for key_id, key in bind.execute(sa.select(api_keys.c.id, api_keys.c.key)).all():
+        bind.execute(api_keys.update().where(api_keys.c.id == key_id).values(
+            prefix=key[:API_KEY_PREFIX_LENGTH],
+            key_hash=hashlib.sha256(key.encode("utf-8")).hexdigest()
+        ))
+
+    indexes = {index["name"] for index in inspector.get_indexes("api_keys")}
+    with op.batch_alter_table("api_keys") as batch_op:
+        if "ix_api_keys_key" in indexes:
+            batch_op.drop_index("ix_api_keys_key")
+        batch_op.drop_column("key")
+        batch_op.alter_column("prefix", existing_type=sa.String(16), nullable=False)
+        batch_op.alter_column("key_hash", existing_type=sa.String(64), nullable=False)
+        if "ix_api_keys_prefix" not in indexes:
+            batch_op.create_index("ix_api_keys_prefix", ["prefix"], unique=True)
+
+def downgrade():
+    # The keys themselves were never kept, only their digests
+    raise RuntimeError("Cannot downgrade past 0001a: API keys are stored hashed")
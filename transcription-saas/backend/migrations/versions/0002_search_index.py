@@ -0,0 +1,35 @@
+"""Full-text search index over transcriptions
+
+Safe to run on databases that already have an index: missing pieces are
+created, and a SQLite index over the raw column is rebuilt over the
+decompressing view.
+
+Revision ID: 0002
+Revises: 0001a
+Create Date: 2026-10-16
+"""
+from alembic import op
+
+from search import ensure_search_index
+
+revision = "0002"
+down_revision = "0001a"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    ensure_search_index(op.get_bind())
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == "sqlite":
+        for statement in (
+            "DROP TRIGGER IF EXISTS transcriptions_fts_insert",
+            "DROP TRIGGER IF EXISTS transcriptions_fts_delete",
+            "DROP TRIGGER IF EXISTS transcriptions_fts_update",
+            "DROP TABLE IF EXISTS transcriptions_fts",
+            "DROP VIEW IF EXISTS transcriptions_fts_content",
+        ):
+            op.execute(statement)
+    elif bind.dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_transcriptions_fts")
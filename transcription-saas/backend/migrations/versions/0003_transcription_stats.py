@@ -0,0 +1,45 @@
+"""Per-user monthly transcription rollups for GET /stats
+
+Backfilled from the existing transcriptions; kept current afterwards by
+the Transcription insert/delete hooks in models.py.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+MONTH_EXPRESSIONS = {
+    "sqlite": "strftime('%Y-%m', created_at)",
+    "postgresql": "to_char(created_at AT TIME ZONE 'UTC', 'YYYY-MM')",
+    "mysql": "DATE_FORMAT(created_at, '%Y-%m')",
+}
+
+def upgrade():
+    op.create_table(
+        "transcription_stats",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("period", sa.String(7), nullable=False),
+        sa.Column("transcription_count", sa.Integer(), nullable=False),
+        sa.Column("duration_seconds", sa.Float(), nullable=False),
+        sa.Column("total_bytes", sa.BigInteger(), nullable=False),
+        sa.UniqueConstraint("user_id", "period", name="uq_transcription_stats_user_period"),
+    )
+
+    month = MONTH_EXPRESSIONS[op.get_bind().dialect.name]
+    op.execute(f"""
+        INSERT INTO transcription_stats (user_id, period, transcription_count, duration_seconds, total_bytes)
+        SELECT user_id, {month}, COUNT(*), COALESCE(SUM(duration), 0), COALESCE(SUM(file_size), 0)
+        FROM transcriptions
+        GROUP BY user_id, {month}
+    """)
+
+def downgrade():
+    op.drop_table("transcription_stats")
@@ -0,0 +1,41 @@
+"""Transcription batches for POST /transcribe/batch
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "transcription_batches",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("item_count", sa.Integer(), nullable=False),
+        sa.Column("concurrency", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_transcription_batches_user_id", "transcription_batches", ["user_id"])
+
+    with op.batch_alter_table("transcription_jobs") as batch_op:
+        batch_op.add_column(sa.Column("batch_id", sa.String(), nullable=True))
+        batch_op.create_index("ix_transcription_jobs_batch_id", ["batch_id"])
+        batch_op.create_foreign_key(
+            "fk_transcription_jobs_batch_id", "transcription_batches", ["batch_id"], ["id"]
+        )
+
+def downgrade():
+    with op.batch_alter_table("transcription_jobs") as batch_op:
+        batch_op.drop_constraint("fk_transcription_jobs_batch_id", type_="foreignkey")
+        batch_op.drop_index("ix_transcription_jobs_batch_id")
+        batch_op.drop_column("batch_id")
+    op.drop_table("transcription_batches")
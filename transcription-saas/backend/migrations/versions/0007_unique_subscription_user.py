@@ -0,0 +1,52 @@
+"""One subscription row per user
+
+Concurrent first uploads could each create a default subscription. The
+duplicates are merged into the row worth keeping (the one Stripe knows
+about, else the oldest), carrying over the highest usage counter for the
+current period, and user_id becomes unique.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    bind = op.get_bind()
+    subscriptions = sa.table(
+        "subscriptions",
+        sa.column("id"), sa.column("user_id"), sa.column("stripe_customer_id"),
+        sa.column("stripe_subscription_id"), sa.column("monthly_transcription_used"),
+        sa.column("usage_period"),
+    )
+    duplicated = bind.execute(
+        sa.select(subscriptions.c.user_id)
+        .group_by(subscriptions.c.user_id)
+        .having(sa.func.count() > 1)
+    ).scalars().all()
+    for user_id in duplicated:
+        rows = bind.execute(
+            sa.select(subscriptions).where(subscriptions.c.user_id == user_id)
+        ).all()
+        keep = min(rows, key=lambda r: (r.stripe_subscription_id is None, r.stripe_customer_id is None, r.id))
+        period = max((r.usage_period for r in rows if r.usage_period), default=None)
+        used = max((r.monthly_transcription_used or 0 for r in rows if r.usage_period == period), default=0)
+        bind.execute(subscriptions.update().where(subscriptions.c.id == keep.id).values(
+            usage_period=period, monthly_transcription_used=used
+        ))
+        bind.execute(subscriptions.delete().where(
+            subscriptions.c.user_id == user_id, subscriptions.c.id != keep.id
+        ))
+
+    with op.batch_alter_table("subscriptions") as batch_op:
+        batch_op.create_unique_constraint("uq_subscriptions_user_id", ["user_id"])
+
+def downgrade():
+    with op.batch_alter_table("subscriptions") as batch_op:
+        batch_op.drop_constraint("uq_subscriptions_user_id", type_="unique")
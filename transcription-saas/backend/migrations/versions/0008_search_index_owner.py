@@ -0,0 +1,26 @@
+"""Index each transcription's owner in the SQLite search index
+
+Searches then match only the caller's entries inside the index rather
+than every user's, filtered afterwards. The index is rebuilt from the
+transcriptions table; PostgreSQL is unaffected.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-16
+"""
+from alembic import op
+
+from search import ensure_search_index
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    ensure_search_index(op.get_bind())
+
+def downgrade():
+    # 0002's index still answers every query the older code makes; the
+    # owner column is simply ignored
+    pass
@@ -1,7 +1,11 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Float
-from sqlalchemy.relationship import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Text, Boolean, ForeignKey, Float, Index, UniqueConstraint, event, insert, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from database import Base
+from database import Base, Timestamp
+from compression import CompressedText
+from metering import current_period
 
 class User(Base):
     __tablename__ = "users"
@@ -24,13 +28,68 @@ class Transcription(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     filename = Column(String, nullable=False)
-    transcription_text = Column(Text, nullable=False)
+    transcription_text = Column(CompressedText, nullable=False)  # zlib above a size threshold on SQLite
     file_size = Column(Integer, nullable=False)  # in bytes
     duration = Column(Float, nullable=True)  # in seconds
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
     
     # Relationships
     user = relationship("User", back_populates="transcriptions")
+    
+    __table_args__ = (
+        # Keyset pagination of a user's history, newest first
+        Index("ix_transcriptions_user_created_id", "user_id", "created_at", "id"),
+    )
+
+class TranscriptionJob(Base):
+    __tablename__ = "transcription_jobs"
+    
+    id = Column(String, primary_key=True, index=True)  # uuid4 hex
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    filename = Column(String, nullable=False)
+    file_path = Column(String, nullable=False)
+    file_size = Column(Integer, nullable=False)  # in bytes
+    duration = Column(Float, nullable=True)  # in seconds, from the container headers
+    content_hash = Column(String(64), nullable=True, index=True)  # SHA-256 of the upload
+    status = Column(String, nullable=False, default="queued", index=True)  # queued, processing, completed, failed
+    error = Column(Text, nullable=True)
+    transcription_id = Column(Integer, ForeignKey("transcriptions.id"), nullable=True)
+    reserved_minutes = Column(Integer, nullable=False, default=0)  # quota held while the job runs
+    billing_period = Column(String(7), nullable=True)  # YYYY-MM the reservation was taken in
+    batch_id = Column(String, ForeignKey("transcription_batches.id"), nullable=True, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Relationships
+    user = relationship("User")
+    transcription = relationship("Transcription")
+
+class TranscriptionBatch(Base):
+    __tablename__ = "transcription_batches"
+    
+    id = Column(String, primary_key=True)  # uuid4 hex
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    status = Column(String, nullable=False, default="queued")  # queued, processing, completed
+    item_count = Column(Integer, nullable=False)
+    concurrency = Column(Integer, nullable=False, default=1)  # items transcribed at once, from the plan
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+    
+    id = Column(String, primary_key=True)  # uuid4 hex; becomes the job id
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    filename = Column(String, nullable=False)
+    content_type = Column(String, nullable=False)
+    file_path = Column(String, nullable=False)  # preallocated to the full size
+    size = Column(BigInteger, nullable=False)  # in bytes
+    bytes_received = Column(BigInteger, nullable=False, default=0)  # offset of the next chunk
+    status = Column(String, nullable=False, default="uploading")  # uploading, finalizing
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)  # pushed back by every chunk
 
 class APIKey(Base):
     __tablename__ = "api_keys"
@@ -38,9 +97,102 @@ class APIKey(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     name = Column(String, nullable=False)
-    key = Column(String, unique=True, index=True, nullable=False)
+    prefix = Column(String(16), unique=True, index=True, nullable=False)  # leading chars of the key
+    key_hash = Column(String(64), nullable=False)  # SHA-256 hex of the full key
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
-    user = relationship("User", back_populates="api_keys")
\ No newline at end of file
+    user = relationship("User", back_populates="api_keys")
+
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_buckets"
+    
+    key = Column(String, primary_key=True)  # scope:user_id
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)  # epoch seconds of the last refill
+
+class Lease(Base):
+    __tablename__ = "leases"
+    
+    name = Column(String, primary_key=True)  # what is held, e.g. "webhook-consumer"
+    holder = Column(String, nullable=False)  # the process holding it
+    expires_at = Column(Float, nullable=False)  # epoch seconds; free to take after this
+
+class TranscriptionStats(Base):
+    __tablename__ = "transcription_stats"
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    period = Column(String(7), nullable=False)  # YYYY-MM the transcriptions were written in
+    transcription_count = Column(Integer, nullable=False, default=0)
+    duration_seconds = Column(Float, nullable=False, default=0)  # audio length, not billed minutes
+    total_bytes = Column(BigInteger, nullable=False, default=0)  # uploaded file sizes
+    
+    __table_args__ = (
+        # One rollup row per user and month
+        UniqueConstraint("user_id", "period", name="uq_transcription_stats_user_period"),
+    )
+
+UPSERT_DIALECTS = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}
+
+def add_to_stats(connection, user_id: int, period: str, count: int, seconds: float, size: int):
+    """Add to a user's monthly rollup in the caller's transaction"""
+    table = TranscriptionStats.__table__
+    insert = UPSERT_DIALECTS.get(connection.dialect.name)
+    if insert is None:
+        changed = connection.execute(update(table).where(
+            table.c.user_id == user_id, table.c.period == period
+        ).values(
+            transcription_count=table.c.transcription_count + count,
+            duration_seconds=table.c.duration_seconds + seconds,
+            total_bytes=table.c.total_bytes + size
+        )).rowcount
+        if not changed:
+            connection.execute(table.insert().values(
+                user_id=user_id, period=period, transcription_count=count,
+                duration_seconds=seconds, total_bytes=size
+            ))
+        return
+    # Single statement, so concurrent writers can't both create the row
+    statement = insert(table).values(
+        user_id=user_id, period=period, transcription_count=count,
+        duration_seconds=seconds, total_bytes=size
+    )
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.period],
+        set_={
+            "transcription_count": table.c.transcription_count + statement.excluded.transcription_count,
+            "duration_seconds": table.c.duration_seconds + statement.excluded.duration_seconds,
+            "total_bytes": table.c.total_bytes + statement.excluded.total_bytes,
+        }
+    ))
+
+@event.listens_for(Transcription, "after_insert")
+def _count_transcription(mapper, connection, target):
+    add_to_stats(connection, target.user_id, current_period(), 1, target.duration or 0.0, target.file_size)
+
+@event.listens_for(Transcription, "after_delete")
+def _uncount_transcription(mapper, connection, target):
+    period = current_period(target.created_at) if target.created_at else current_period()
+    add_to_stats(connection, target.user_id, period, -1, -(target.duration or 0.0), -target.file_size)
+
+def insert_transcriptions(db, rows) -> list:
+    """Write many transcriptions with one multi-row INSERT and one rollup
+    upsert per user, returning their ids in the order of ``rows``. Bulk
+    inserts skip the per-row insert hook, so the rollup is updated here.
+    Runs in the caller's (sync) session and transaction."""
+    if not rows:
+        return []
+    ids = list(db.scalars(
+        insert(Transcription).returning(Transcription.id, sort_by_parameter_order=True),
+        rows
+    ))
+    totals = {}
+    for row in rows:
+        count, seconds, size = totals.get(row["user_id"], (0, 0.0, 0))
+        totals[row["user_id"]] = (count + 1, seconds + (row.get("duration") or 0.0), size + row["file_size"])
+    connection = db.connection()
+    for user_id, (count, seconds, size) in totals.items():
+        add_to_stats(connection, user_id, current_period(), count, seconds, size)
+    return ids
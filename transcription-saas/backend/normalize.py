@@ -0,0 +1,197 @@
+import os
+import tempfile
+import time
+import wave
+from typing import List, Optional
+
+import numpy as np
+from decouple import config
+
+from pipeline import is_pcm_wav, pcm_to_float, temp_prefix
+
+# Configuration
+NORMALIZE_AUDIO = config("NORMALIZE_AUDIO", default=True, cast=bool)
+NORMALIZE_SAMPLE_RATE = config("NORMALIZE_SAMPLE_RATE", default=16000, cast=int)
+TRIM_SILENCE = config("TRIM_SILENCE", default=False, cast=bool)
+TRIM_SILENCE_THRESHOLD_DB = config("TRIM_SILENCE_THRESHOLD_DB", default=-45.0, cast=float)
+# Longest run of silence held back while trimming; longer runs are kept
+TRIM_MAX_PENDING_SECONDS = config("TRIM_MAX_PENDING_SECONDS", default=30.0, cast=float)
+
+NORMALIZE_BLOCK_FRAMES = 64 * 1024
+LOWPASS_TAPS = 63
+TRIM_WINDOW_SECONDS = 0.02
+
+class NormalizeResult:
+    """Outcome of normalizing one file, for logging and cleanup"""
+
+    def __init__(self, path: str, bytes_before: int, bytes_after: int, seconds: float):
+        self.path = path
+        self.bytes_before = bytes_before
+        self.bytes_after = bytes_after
+        self.seconds = seconds
+
+def _lowpass(cutoff: float, taps: int) -> np.ndarray:
+    """Windowed-sinc low-pass filter; ``cutoff`` is a fraction of the input rate"""
+    n = np.arange(taps) - (taps - 1) / 2
+    h = np.sinc(2 * cutoff * n) * np.hamming(taps)
+    return (h / h.sum()).astype(np.float32)
+
+class _Resampler:
+    """Streaming rate converter: anti-alias filter, then linear interpolation.
+
+    State carried between blocks (filter history, last sample, next output
+    position) makes the output identical to processing the file in one go.
+    """
+
+    def __init__(self, in_rate: int, out_rate: int):
+        self.step = in_rate / out_rate
+        self.filter = _lowpass(0.45 / self.step, LOWPASS_TAPS) if out_rate < in_rate else None
+        self.history = np.zeros(LOWPASS_TAPS - 1, dtype=np.float32)
+        self.base = 0  # input index of the first sample in the current block
+        self.next_position = 0.0
+        self.last: Optional[np.float32] = None
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+        if self.step == 1:
+            return x
+        if self.filter is not None:
+            padded = np.concatenate([self.history, x])
+            self.history = padded[-(LOWPASS_TAPS - 1):]
+            x = np.convolve(padded, self.filter, mode="valid").astype(np.float32)
+
+        if self.last is None:
+            index = self.base + np.arange(len(x))
+            values = x
+        else:
+            index = self.base - 1 + np.arange(len(x) + 1)
+            values = np.concatenate([[self.last], x])
+        end = self.base + len(x) - 1
+        count = int(np.floor((end - self.next_position) / self.step)) + 1 if end >= self.next_position else 0
+        positions = self.next_position + np.arange(count) * self.step
+        out = np.interp(positions, index, values).astype(np.float32)
+
+        self.next_position += count * self.step
+        self.base += len(x)
+        self.last = x[-1]
+        return out
+
+class _SilenceTrimmer:
+    """Drops leading and trailing silence from a stream of samples.
+
+    Leading quiet windows are discarded until the first loud one. Quiet
+    audio after that is held back and only written once more speech
+    follows, so whatever is still pending at the end is trailing silence.
+    """
+
+    def __init__(self, rate: int, threshold_db: float):
+        self.window = max(1, int(TRIM_WINDOW_SECONDS * rate))
+        self.threshold = (10 ** (threshold_db / 20)) ** 2  # mean-square
+        self.max_pending = int(TRIM_MAX_PENDING_SECONDS * rate)
+        self.started = False
+        self.pending: List[np.ndarray] = []
+        self.pending_samples = 0
+        self.remainder = np.zeros(0, dtype=np.float32)
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+        x = np.concatenate([self.remainder, x])
+        usable = len(x) - len(x) % self.window
+        self.remainder = x[usable:]
+        windows = x[:usable].reshape(-1, self.window)
+        loud = np.flatnonzero(np.mean(windows * windows, axis=1) >= self.threshold)
+
+        if not self.started:
+            if not len(loud):
+                return np.zeros(0, dtype=np.float32)
+            self.started = True
+            windows = windows[loud[0]:]
+            loud = loud - loud[0]
+
+        if not len(loud):
+            self._hold(windows.ravel())
+            return self._overflow()
+        # Everything up to the last loud window is kept, along with held-back audio
+        keep = windows[:loud[-1] + 1].ravel()
+        out = np.concatenate(self.pending + [keep])
+        self.pending, self.pending_samples = [], 0
+        self._hold(windows[loud[-1] + 1:].ravel())
+        return out
+
+    def _hold(self, x: np.ndarray):
+        if len(x):
+            self.pending.append(x)
+            self.pending_samples += len(x)
+
+    def _overflow(self) -> np.ndarray:
+        # A pause this long is internal silence, not the tail; stop holding it
+        if self.pending_samples <= self.max_pending:
+            return np.zeros(0, dtype=np.float32)
+        out = np.concatenate(self.pending)
+        self.pending, self.pending_samples = [], 0
+        return out
+
+def _to_pcm16(x: np.ndarray) -> bytes:
+    return np.clip(np.round(x * 32768.0), -32768, 32767).astype('<i2').tobytes()
+
+def normalize_wav(
+    src_path: str,
+    dst_path: str,
+    sample_rate: int = NORMALIZE_SAMPLE_RATE,
+    trim_silence: bool = TRIM_SILENCE,
+) -> NormalizeResult:
+    """Downmix a PCM WAV file to mono 16-bit at ``sample_rate``, optionally
+    trimming leading and trailing silence. Streams block by block, so memory
+    use does not depend on the length of the recording. Never upsamples."""
+    started = time.perf_counter()
+    with wave.open(src_path, 'rb') as src, wave.open(dst_path, 'wb') as dst:
+        params = src.getparams()
+        out_rate = min(sample_rate, params.framerate)
+        dst.setnchannels(1)
+        dst.setsampwidth(2)
+        dst.setframerate(out_rate)
+
+        resampler = _Resampler(params.framerate, out_rate)
+        trimmer = _SilenceTrimmer(out_rate, TRIM_SILENCE_THRESHOLD_DB) if trim_silence else None
+        while True:
+            raw = src.readframes(NORMALIZE_BLOCK_FRAMES)
+            if not raw:
+                break
+            samples = pcm_to_float(raw, params.sampwidth)
+            if params.nchannels > 1:
+                samples = samples.reshape(-1, params.nchannels).mean(axis=1)
+            samples = resampler.process(samples)
+            if trimmer:
+                samples = trimmer.process(samples)
+            dst.writeframes(_to_pcm16(samples))
+
+    return NormalizeResult(
+        dst_path,
+        bytes_before=os.path.getsize(src_path),
+        bytes_after=os.path.getsize(dst_path),
+        seconds=time.perf_counter() - started,
+    )
+
+def needs_normalizing(file_path: str, sample_rate: int = NORMALIZE_SAMPLE_RATE, trim_silence: bool = TRIM_SILENCE) -> bool:
+    """True for PCM WAV files that normalizing would change"""
+    if not is_pcm_wav(file_path):
+        # Compressed containers would need a decoder; they go through as uploaded
+        return False
+    if trim_silence:
+        return True
+    with wave.open(file_path, 'rb') as src:
+        return src.getnchannels() > 1 or src.getsampwidth() != 2 or src.getframerate() > sample_rate
+
+def prepare_audio(file_path: str) -> Optional[NormalizeResult]:
+    """Normalize an upload into a sibling temp file when enabled and useful.
+
+    Returns None when the original should be sent as is; otherwise the
+    caller removes ``result.path`` once it is done with it.
+    """
+    if not NORMALIZE_AUDIO or not needs_normalizing(file_path):
+        return None
+    fd, dst_path = tempfile.mkstemp(prefix=temp_prefix("normalized"), suffix=".wav", dir=os.path.dirname(file_path) or None)
+    os.close(fd)
+    try:
+        return normalize_wav(file_path, dst_path)
+    except Exception:
+        os.remove(dst_path)
+        raise
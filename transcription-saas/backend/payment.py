@@ -1,48 +1,209 @@
-import stripe
+import asyncio
+import json
+import logging
+import random
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import httpx
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from decouple import config
-from models import User, Subscription
-from datetime import datetime, timedelta
+from cache import LRUCache
+from models import User
+from subscription_models import Subscription
+
+logger = logging.getLogger(__name__)
+
+# Stripe API configuration; point STRIPE_API_BASE at stripe-mock or another
+# local fake to exercise the client without the real API
+STRIPE_API_BASE = config("STRIPE_API_BASE", default="https://api.stripe.com")
+STRIPE_TIMEOUT = config("STRIPE_TIMEOUT", default=10.0, cast=float)  # seconds
+STRIPE_CONNECT_TIMEOUT = config("STRIPE_CONNECT_TIMEOUT", default=3.0, cast=float)  # seconds
+STRIPE_MAX_RETRIES = config("STRIPE_MAX_RETRIES", default=3, cast=int)
+STRIPE_RETRY_BACKOFF = config("STRIPE_RETRY_BACKOFF", default=0.5, cast=float)  # seconds, doubled per attempt
+STRIPE_MAX_RETRY_DELAY = config("STRIPE_MAX_RETRY_DELAY", default=8.0, cast=float)  # seconds
+STRIPE_MAX_CONNECTIONS = config("STRIPE_MAX_CONNECTIONS", default=20, cast=int)
+CUSTOMER_CACHE_MAX_ENTRIES = config("CUSTOMER_CACHE_MAX_ENTRIES", default=10000, cast=int)
+
+# Statuses worth another attempt; Stripe replays the original response for
+# a request retried with the same idempotency key
+RETRYABLE_STATUSES = {409, 429, 500, 502, 503, 504}
+
+class StripeAPIError(Exception):
+    """Raised when Stripe rejects a request or cannot be reached"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
 
-stripe.api_key = config("STRIPE_SECRET_KEY", default="")
+def _encode_form(params: Dict[str, Any], prefix: str = "") -> List[Tuple[str, str]]:
+    """Flatten nested params into Stripe's bracketed form encoding"""
+    pairs = []
+    for key, value in params.items():
+        name = f"{prefix}[{key}]" if prefix else str(key)
+        if value is None:
+            continue
+        if isinstance(value, dict):
+            pairs.extend(_encode_form(value, name))
+        elif isinstance(value, (list, tuple)):
+            pairs.extend(_encode_form(dict(enumerate(value)), name))
+        elif isinstance(value, bool):
+            pairs.append((name, "true" if value else "false"))
+        else:
+            pairs.append((name, str(value)))
+    return pairs
 
 class PaymentService:
     def __init__(self):
         self.stripe_secret_key = config("STRIPE_SECRET_KEY", default="")
         self.stripe_publishable_key = config("STRIPE_PUBLISHABLE_KEY", default="")
+        self._client: Optional[httpx.AsyncClient] = None
+        # user_id -> Stripe customer id; ids never change once assigned
+        self.customer_cache = LRUCache(max_entries=CUSTOMER_CACHE_MAX_ENTRIES)
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared connection pool, created on first use"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=STRIPE_API_BASE,
+                auth=(self.stripe_secret_key, ""),
+                timeout=httpx.Timeout(STRIPE_TIMEOUT, connect=STRIPE_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=STRIPE_MAX_CONNECTIONS,
+                    max_keepalive_connections=STRIPE_MAX_CONNECTIONS
+                ),
+            )
+        return self._client
+    
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), STRIPE_MAX_RETRY_DELAY)
+            except ValueError:
+                pass
+        delay = min(STRIPE_RETRY_BACKOFF * (2 ** attempt), STRIPE_MAX_RETRY_DELAY)
+        # Full jitter so clients retrying together spread out
+        return random.uniform(delay / 2, delay)
+    
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        idempotency_key: Optional[str] = None
+    ) -> dict:
+        """Call the Stripe API with bounded retries.
+        
+        POSTs carry an idempotency key (generated if not given) that stays
+        the same across retries, so a retried create can't run twice.
+        """
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        if method == "POST":
+            headers["Idempotency-Key"] = idempotency_key or uuid.uuid4().hex
+        form = _encode_form(params or {})
         
+        for attempt in range(STRIPE_MAX_RETRIES + 1):
+            response = None
+            try:
+                if method == "GET":
+                    response = await self.client.request(method, path, params=form, headers=headers)
+                else:
+                    response = await self.client.request(method, path, content=urlencode(form), headers=headers)
+            except httpx.TransportError as e:
+                if attempt == STRIPE_MAX_RETRIES:
+                    raise StripeAPIError(f"Could not reach Stripe: {e}")
+            else:
+                if response.status_code < 400:
+                    return response.json()
+                should_retry = response.headers.get("stripe-should-retry")
+                retryable = (
+                    should_retry == "true"
+                    or (should_retry != "false" and response.status_code in RETRYABLE_STATUSES)
+                )
+                if not retryable or attempt == STRIPE_MAX_RETRIES:
+                    try:
+                        message = response.json()["error"]["message"]
+                    except (ValueError, KeyError, TypeError):
+                        message = response.text or f"HTTP {response.status_code}"
+                    raise StripeAPIError(message, response.status_code)
+            
+            delay = self._retry_delay(attempt, response)
+            logger.warning("Retrying Stripe %s %s in %.2fs (attempt %d)", method, path, delay, attempt + 1)
+            await asyncio.sleep(delay)
+    
     async def create_customer(self, user: User) -> str:
         """Create a Stripe customer for the user"""
         try:
-            customer = stripe.Customer.create(
-                email=user.email,
-                name=user.full_name,
-                metadata={"user_id": str(user.id)}
-            )
-            return customer.id
-        except stripe.error.StripeError as e:
+            # Keyed on the user, so concurrent checkouts create one customer
+            customer = await self._request("POST", "/v1/customers", {
+                "email": user.email,
+                "name": user.full_name,
+                "metadata": {"user_id": str(user.id)}
+            }, idempotency_key=f"customer-{user.id}")
+            return customer["id"]
+        except StripeAPIError as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Failed to create customer: {str(e)}"
             )
     
+    async def get_customer_id(self, user: User, db: AsyncSession, plan_name: str) -> str:
+        """The user's Stripe customer id, creating the customer (and the
+        local subscription row) on first checkout. Cached per user."""
+        customer_id = self.customer_cache.get(user.id)
+        if customer_id:
+            return customer_id
+        
+        subscription = await db.scalar(select(Subscription).where(Subscription.user_id == user.id))
+        if subscription and subscription.stripe_customer_id:
+            customer_id = subscription.stripe_customer_id
+        else:
+            customer_id = await self.create_customer(user)
+            if not subscription:
+                subscription = Subscription(
+                    user_id=user.id,
+                    plan_name=plan_name,
+                    status="incomplete"
+                )
+                try:
+                    async with db.begin_nested():
+                        db.add(subscription)
+                except IntegrityError:
+                    # Created meanwhile, e.g. by a first upload; one row per user
+                    subscription = await db.scalar(select(Subscription).where(Subscription.user_id == user.id))
+            subscription.stripe_customer_id = customer_id
+            await db.commit()
+        
+        self.customer_cache.set(user.id, customer_id)
+        return customer_id
+    
     async def create_subscription(self, customer_id: str, price_id: str) -> dict:
         """Create a subscription for the customer"""
         try:
-            subscription = stripe.Subscription.create(
-                customer=customer_id,
-                items=[{"price": price_id}],
-                payment_behavior="default_incomplete",
-                payment_settings={"save_default_payment_method": "on_subscription"},
-                expand=["latest_invoice.payment_intent"],
-            )
+            subscription = await self._request("POST", "/v1/subscriptions", {
+                "customer": customer_id,
+                "items": [{"price": price_id}],
+                "payment_behavior": "default_incomplete",
+                "payment_settings": {"save_default_payment_method": "on_subscription"},
+                "expand": ["latest_invoice.payment_intent"],
+            })
             return {
-                "subscription_id": subscription.id,
-                "client_secret": subscription.latest_invoice.payment_intent.client_secret,
-                "status": subscription.status
+                "subscription_id": subscription["id"],
+                "client_secret": subscription["latest_invoice"]["payment_intent"]["client_secret"],
+                "status": subscription["status"]
             }
-        except stripe.error.StripeError as e:
+        except StripeAPIError as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Failed to create subscription: {str(e)}"
@@ -51,9 +212,9 @@ class PaymentService:
     async def cancel_subscription(self, subscription_id: str) -> dict:
         """Cancel a subscription"""
         try:
-            subscription = stripe.Subscription.delete(subscription_id)
-            return {"status": subscription.status}
-        except stripe.error.StripeError as e:
+            subscription = await self._request("DELETE", f"/v1/subscriptions/{subscription_id}")
+            return {"status": subscription["status"]}
+        except StripeAPIError as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Failed to cancel subscription: {str(e)}"
@@ -62,15 +223,15 @@ class PaymentService:
     async def get_subscription_status(self, subscription_id: str) -> dict:
         """Get subscription status from Stripe"""
         try:
-            subscription = stripe.Subscription.retrieve(subscription_id)
+            subscription = await self._request("GET", f"/v1/subscriptions/{subscription_id}")
             return {
-                "id": subscription.id,
-                "status": subscription.status,
-                "current_period_start": subscription.current_period_start,
-                "current_period_end": subscription.current_period_end,
-                "cancel_at_period_end": subscription.cancel_at_period_end
+                "id": subscription["id"],
+                "status": subscription["status"],
+                "current_period_start": subscription["current_period_start"],
+                "current_period_end": subscription["current_period_end"],
+                "cancel_at_period_end": subscription["cancel_at_period_end"]
             }
-        except stripe.error.StripeError as e:
+        except StripeAPIError as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Failed to get subscription: {str(e)}"
@@ -79,54 +240,55 @@ class PaymentService:
     async def create_checkout_session(self, customer_id: str, price_id: str, success_url: str, cancel_url: str) -> str:
         """Create a Stripe Checkout session"""
         try:
-            session = stripe.checkout.Session.create(
-                customer=customer_id,
-                payment_method_types=["card"],
-                line_items=[{
+            session = await self._request("POST", "/v1/checkout/sessions", {
+                "customer": customer_id,
+                "payment_method_types": ["card"],
+                "line_items": [{
                     "price": price_id,
                     "quantity": 1,
                 }],
-                mode="subscription",
-                success_url=success_url,
-                cancel_url=cancel_url,
-            )
-            return session.url
-        except stripe.error.StripeError as e:
+                "mode": "subscription",
+                "success_url": success_url,
+                "cancel_url": cancel_url,
+            })
+            return session["url"]
+        except StripeAPIError as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Failed to create checkout session: {str(e)}"
             )
     
-    async def handle_webhook(self, payload: str, sig_header: str) -> dict:
-        """Handle Stripe webhook events"""
+    def verify_webhook(self, payload: bytes, sig_header: str) -> dict:
+        """Check a webhook's signature and return the event as plain JSON"""
+        # Only needed here, and slow to import; keep it off worker startup
+        import stripe
         webhook_secret = config("STRIPE_WEBHOOK_SECRET", default="")
         
         try:
-            event = stripe.Webhook.construct_event(
-                payload, sig_header, webhook_secret
+            stripe.WebhookSignature.verify_header(
+                payload.decode("utf-8"), sig_header, webhook_secret
             )
+            return json.loads(payload)
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid payload")
         except stripe.error.SignatureVerificationError:
             raise HTTPException(status_code=400, detail="Invalid signature")
-        
-        # Handle the event
-        if event["type"] == "customer.subscription.created":
-            subscription = event["data"]["object"]
-            return {"type": "subscription_created", "subscription": subscription}
-        elif event["type"] == "customer.subscription.updated":
-            subscription = event["data"]["object"]
-            return {"type": "subscription_updated", "subscription": subscription}
-        elif event["type"] == "customer.subscription.deleted":
-            subscription = event["data"]["object"]
-            return {"type": "subscription_deleted", "subscription": subscription}
-        elif event["type"] == "invoice.payment_succeeded":
-            invoice = event["data"]["object"]
-            return {"type": "payment_succeeded", "invoice": invoice}
-        elif event["type"] == "invoice.payment_failed":
-            invoice = event["data"]["object"]
-            return {"type": "payment_failed", "invoice": invoice}
-        
-        return {"type": "unhandled", "event_type": event["type"]}
 
-payment_service = PaymentService()
\ No newline at end of file
+_service: Optional[PaymentService] = None
+
+def get_payment_service() -> PaymentService:
+    """Return the shared PaymentService, creating it on first use"""
+    global _service
+    if _service is None:
+        _service = PaymentService()
+    return _service
+
+def set_payment_service(service: Optional[PaymentService]):
+    """Replace the shared service, e.g. with a fake in tests. None resets it."""
+    global _service
+    _service = service
+
+async def close_payment_service():
+    """Close the service's connection pool if it was ever opened"""
+    if _service is not None:
+        await _service.close()
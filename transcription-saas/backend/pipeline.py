@@ -0,0 +1,326 @@
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from decouple import config
+
+from metrics import stage
+from speech import SpeechBackend, get_speech_backend
+
+# Configuration
+SEGMENT_SECONDS = config("SEGMENT_SECONDS", default=600.0, cast=float)
+SEGMENT_OVERLAP_SECONDS = config("SEGMENT_OVERLAP_SECONDS", default=2.0, cast=float)
+SILENCE_SEARCH_SECONDS = config("SILENCE_SEARCH_SECONDS", default=15.0, cast=float)
+SEGMENT_PARALLELISM = config("SEGMENT_PARALLELISM", default=4, cast=int)
+# Stay under the 25MB Whisper upload limit with room for the WAV header
+MAX_SEGMENT_BYTES = config("MAX_SEGMENT_BYTES", default=24 * 1024 * 1024, cast=int)
+# Backend calls in flight at once across all jobs and segments: per worker
+# process with the memory backend, across every worker sharing the database
+# with the database backend
+SPEECH_MAX_CONCURRENCY = config("SPEECH_MAX_CONCURRENCY", default=8, cast=int)
+SPEECH_CONCURRENCY_BACKEND = config("SPEECH_CONCURRENCY_BACKEND", default="memory")
+# A database slot held this long is taken to be abandoned (its worker died)
+# and handed out again; keep it above the longest backend call
+SPEECH_SLOT_TTL = config("SPEECH_SLOT_TTL", default=900.0, cast=float)  # seconds
+SPEECH_SLOT_POLL_INTERVAL = config("SPEECH_SLOT_POLL_INTERVAL", default=0.2, cast=float)  # seconds
+
+ENERGY_WINDOW_SECONDS = 0.02
+MAX_OVERLAP_WORDS = 40
+MIN_OVERLAP_WORDS = 2
+COPY_BLOCK_FRAMES = 256 * 1024
+
+class MemorySlots:
+    """Backend call slots counted in this process"""
+
+    def __init__(self, size: int):
+        self._semaphore = threading.BoundedSemaphore(size)
+
+    def acquire(self):
+        self._semaphore.acquire()
+
+    def release(self, slot):
+        self._semaphore.release()
+
+class DatabaseSlots:
+    """Backend call slots as rows in the leases table, so the cap holds
+    across every worker process, like the database rate limiter. A caller
+    takes any free slot, polling while all are held."""
+
+    def __init__(self, size: int, ttl: float, poll_interval: float):
+        self.names = [f"speech-slot-{i}" for i in range(size)]
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+
+    def acquire(self) -> Tuple[str, str]:
+        # Imported here so gunicorn's master, which imports this module for
+        # remove_temp_files, doesn't set up the database
+        from database import SessionLocal
+        from leases import lease_holder, take_lease
+        holder = lease_holder()
+        names = list(self.names)
+        while True:
+            random.shuffle(names)
+            db = SessionLocal()
+            try:
+                for name in names:
+                    if take_lease(db, name, holder, self.ttl):
+                        return name, holder
+            finally:
+                db.close()
+            time.sleep(self.poll_interval)
+
+    def release(self, slot: Tuple[str, str]):
+        from database import SessionLocal
+        from leases import release_lease
+        db = SessionLocal()
+        try:
+            release_lease(db, *slot)
+        finally:
+            db.close()
+
+_backend_slots = (
+    DatabaseSlots(SPEECH_MAX_CONCURRENCY, SPEECH_SLOT_TTL, SPEECH_SLOT_POLL_INTERVAL)
+    if SPEECH_CONCURRENCY_BACKEND == "database" else MemorySlots(SPEECH_MAX_CONCURRENCY)
+)
+
+# Scratch files sit next to the upload. Their names carry the creating
+# process's pid, so a worker can clear up after itself on shutdown without
+# touching files its siblings are still using
+TEMP_PREFIXES = ("segments-", "normalized-")
+
+def temp_prefix(kind: str) -> str:
+    return f"{kind}-{os.getpid()}-"
+
+def remove_temp_files(directory: str, pid: Optional[int] = None) -> int:
+    """Delete scratch files and directories in ``directory``, only those of
+    ``pid`` if given. Returns how many were removed."""
+    prefixes = tuple(f"{p}{pid}-" for p in TEMP_PREFIXES) if pid is not None else TEMP_PREFIXES
+    removed = 0
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return 0
+    for name in names:
+        if not name.startswith(prefixes):
+            continue
+        path = os.path.join(directory, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+        removed += 1
+    return removed
+
+class Segment:
+    """A slice of the source audio written to its own WAV file"""
+
+    def __init__(self, index: int, start_frame: int, end_frame: int, path: str):
+        self.index = index
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.path = path
+
+def pcm_to_float(raw: bytes, sampwidth: int) -> np.ndarray:
+    """Decode interleaved little-endian PCM into float32 samples in [-1, 1)"""
+    if sampwidth == 1:
+        return (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    if sampwidth == 2:
+        return np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768.0
+    if sampwidth == 3:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        x = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        x = np.where(x & 0x800000, x - 0x1000000, x)
+        return x.astype(np.float32) / 8388608.0
+    if sampwidth == 4:
+        return np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648.0
+    raise ValueError(f"Unsupported sample width: {sampwidth}")
+
+def is_pcm_wav(file_path: str) -> bool:
+    try:
+        with wave.open(file_path, 'rb'):
+            return True
+    except (wave.Error, EOFError):
+        return False
+
+def _energy_envelope(src: wave.Wave_read, window_frames: int) -> np.ndarray:
+    """Mean-square energy of each window, read block by block"""
+    params = src.getparams()
+    block_frames = window_frames * 512
+    energies = []
+    src.rewind()
+    while True:
+        raw = src.readframes(block_frames)
+        if not raw:
+            break
+        samples = pcm_to_float(raw, params.sampwidth)
+        usable = len(samples) - len(samples) % (window_frames * params.nchannels)
+        if usable == 0:
+            break
+        windows = samples[:usable].reshape(-1, window_frames * params.nchannels)
+        energies.append(np.mean(windows * windows, axis=1))
+    return np.concatenate(energies) if energies else np.zeros(0, dtype=np.float32)
+
+def _choose_cuts(energy: np.ndarray, window_frames: int, nframes: int,
+                 segment_frames: int, search_frames: int) -> List[int]:
+    """Pick cut points near every ``segment_frames``, snapping to the quietest
+    window in the ``search_frames`` before each target"""
+    cuts = []
+    position = 0
+    while nframes - position > segment_frames:
+        target = position + segment_frames
+        lo = max(position + segment_frames // 2, target - search_frames) // window_frames
+        hi = min(target // window_frames, len(energy))
+        if hi > lo:
+            # Latest quietest window, so segments stay as long as allowed
+            quietest = hi - 1 - int(np.argmin(energy[lo:hi][::-1]))
+            cut = quietest * window_frames + window_frames // 2
+        else:
+            cut = target
+        cuts.append(cut)
+        position = cut
+    return cuts
+
+def split_wav(
+    file_path: str,
+    out_dir: str,
+    segment_seconds: float = SEGMENT_SECONDS,
+    overlap_seconds: float = SEGMENT_OVERLAP_SECONDS,
+    search_seconds: float = SILENCE_SEARCH_SECONDS,
+) -> List[Segment]:
+    """Split a PCM WAV file into overlapping segments cut on silence.
+
+    Segments are capped at MAX_SEGMENT_BYTES whatever ``segment_seconds``
+    says. Each segment after the first starts ``overlap_seconds`` before
+    its cut so words on the boundary are heard in full by one side. Returns
+    an empty list when the file fits in a single segment.
+    """
+    with wave.open(file_path, 'rb') as src:
+        params = src.getparams()
+        rate = params.framerate
+        bytes_per_second = rate * params.sampwidth * params.nchannels
+        overlap_frames = int(overlap_seconds * rate)
+        segment_frames = int(min(segment_seconds, MAX_SEGMENT_BYTES / bytes_per_second) * rate) - overlap_frames
+        if segment_frames <= 0:
+            raise ValueError("Segment overlap is longer than the segment itself")
+        if params.nframes <= segment_frames + overlap_frames:
+            return []
+
+        window_frames = max(1, int(ENERGY_WINDOW_SECONDS * rate))
+        energy = _energy_envelope(src, window_frames)
+        cuts = _choose_cuts(energy, window_frames, params.nframes,
+                            segment_frames, int(search_seconds * rate))
+
+        bounds = [0] + cuts + [params.nframes]
+        segments = []
+        for index in range(len(bounds) - 1):
+            start = max(0, bounds[index] - overlap_frames) if index else 0
+            end = bounds[index + 1]
+            path = os.path.join(out_dir, f"segment_{index:04d}.wav")
+            src.setpos(start)
+            with wave.open(path, 'wb') as dst:
+                dst.setparams(params)
+                remaining = end - start
+                while remaining > 0:
+                    raw = src.readframes(min(COPY_BLOCK_FRAMES, remaining))
+                    if not raw:
+                        break
+                    dst.writeframes(raw)
+                    remaining -= len(raw) // (params.sampwidth * params.nchannels)
+            segments.append(Segment(index, start, end, path))
+        return segments
+
+def _call_backend(backend: SpeechBackend, path: str) -> str:
+    with stage("backend_slot_wait"):
+        slot = _backend_slots.acquire()
+    try:
+        with stage("speech_backend"):
+            return backend.transcribe(path)
+    finally:
+        _backend_slots.release(slot)
+
+# Called as on_segment(index, total, text) when a segment finishes, in
+# completion order and from the transcribing thread
+SegmentCallback = Callable[[int, int, str], None]
+
+def transcribe_segments(
+    paths: List[str],
+    backend: SpeechBackend,
+    parallelism: int = SEGMENT_PARALLELISM,
+    on_segment: Optional[SegmentCallback] = None,
+) -> List[str]:
+    """Transcribe segments concurrently, returning texts in segment order"""
+    def run(index: int, path: str) -> str:
+        text = _call_backend(backend, path)
+        if on_segment is not None:
+            on_segment(index, len(paths), text)
+        return text
+
+    with ThreadPoolExecutor(max_workers=max(1, min(parallelism, len(paths)))) as pool:
+        return list(pool.map(run, range(len(paths)), paths))
+
+def _normalize_word(word: str) -> str:
+    return re.sub(r"[^\w']", "", word.lower())
+
+def _overlap_length(previous: List[str], following: List[str]) -> int:
+    """Number of leading words of ``following`` that repeat the end of ``previous``"""
+    tail = [_normalize_word(w) for w in previous[-MAX_OVERLAP_WORDS:]]
+    head = [_normalize_word(w) for w in following[:MAX_OVERLAP_WORDS]]
+    for k in range(min(len(tail), len(head)), MIN_OVERLAP_WORDS - 1, -1):
+        if tail[-k:] == head[:k]:
+            return k
+    return 0
+
+def stitch_transcripts(texts: List[str]) -> str:
+    """Join segment transcripts in order, dropping words repeated in the overlaps"""
+    pieces: List[str] = []
+    previous_words: List[str] = []
+    for text in texts:
+        text = text.strip()
+        if not text:
+            continue
+        words = text.split()
+        k = _overlap_length(previous_words, words) if previous_words else 0
+        if k:
+            parts = text.split(None, k)
+            text = parts[k] if len(parts) > k else ""
+            words = words[k:]
+        if text:
+            pieces.append(text)
+            previous_words = (previous_words + words)[-MAX_OVERLAP_WORDS:]
+    return " ".join(pieces)
+
+def transcribe_audio_file(
+    file_path: str,
+    backend: Optional[SpeechBackend] = None,
+    parallelism: int = SEGMENT_PARALLELISM,
+    on_segment: Optional[SegmentCallback] = None,
+) -> str:
+    """Transcribe a file, fanning long PCM WAV recordings out over segments.
+
+    Other containers are sent to the backend as a single call. Long
+    recordings report each segment's text to ``on_segment`` as it lands.
+    """
+    backend = backend or get_speech_backend()
+    if not is_pcm_wav(file_path):
+        return _call_backend(backend, file_path)
+
+    work_dir = tempfile.mkdtemp(prefix=temp_prefix("segments"), dir=os.path.dirname(file_path) or None)
+    try:
+        segments = split_wav(file_path, work_dir)
+        if not segments:
+            return _call_backend(backend, file_path)
+        texts = transcribe_segments([s.path for s in segments], backend, parallelism, on_segment)
+        return stitch_transcripts(texts)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,202 @@
+import asyncio
+import threading
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+import orjson
+from decouple import config
+from sqlalchemy import select
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from database import AsyncSessionLocal
+from models import TranscriptionJob
+
+# Configuration
+EVENT_SUBSCRIBER_BUFFER = config("EVENT_SUBSCRIBER_BUFFER", default=64, cast=int)  # events per subscriber
+EVENT_MAX_SUBSCRIBERS = config("EVENT_MAX_SUBSCRIBERS", default=1000, cast=int)  # per process
+EVENT_MAX_SUBSCRIBERS_PER_JOB = config("EVENT_MAX_SUBSCRIBERS_PER_JOB", default=10, cast=int)
+# Streams end after this long and the client reconnects, so open streams
+# never hold up a graceful shutdown for long
+EVENT_STREAM_MAX_SECONDS = config("EVENT_STREAM_MAX_SECONDS", default=25.0, cast=float)
+# How often a stream re-reads the job row when no events arrive; the job may
+# be running in another server process
+EVENT_STREAM_POLL_SECONDS = config("EVENT_STREAM_POLL_SECONDS", default=5.0, cast=float)
+
+# Job states after which a stream has nothing more to say
+TERMINAL_STATES = ("completed", "failed")
+
+class TooManySubscribersError(Exception):
+    """Raised when a process or job has no room for another subscriber"""
+
+class Subscription:
+    """One client's view of a job's events, buffered up to a fixed size.
+
+    A subscriber that falls a full buffer behind is cut off (``lagged``)
+    instead of growing its buffer; it can reconnect and start again from
+    the job's current state.
+    """
+
+    def __init__(self, job_id: str, maxsize: int):
+        self.job_id = job_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.lagged = False
+
+    def offer(self, event: dict):
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.lagged = True
+            # Make room for the end-of-stream marker so the reader wakes up
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+class JobEventBroker:
+    """In-process fan-out of job progress to streaming clients.
+
+    Workers publish from their threads; events are handed to the event loop
+    and copied to every subscriber of the job. Segment texts of running jobs
+    are kept so late subscribers can catch up, and dropped when the job ends.
+    """
+
+    def __init__(self, buffer_size: int, max_subscribers: int, max_per_job: int):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self.max_per_job = max_per_job
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._segments: Dict[str, Dict[int, dict]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(s) for s in self._subscribers.values())
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def publish(self, job_id: str, event: dict):
+        """Send an event to the job's subscribers. Safe from any thread."""
+        with self._lock:
+            if event["event"] == "segment":
+                self._segments.setdefault(job_id, {})[event["index"]] = event
+            elif event["event"] in ("completed", "failed"):
+                self._segments.pop(job_id, None)
+        if self._loop is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._dispatch, job_id, event)
+        except RuntimeError:
+            pass  # loop closed during shutdown
+
+    def _dispatch(self, job_id: str, event: dict):
+        for subscription in self._subscribers.get(job_id, ()):
+            subscription.offer(event)
+
+    def segments(self, job_id: str) -> List[dict]:
+        """Segment events published so far for a running job, in order"""
+        with self._lock:
+            segments = self._segments.get(job_id, {})
+            return [segments[i] for i in sorted(segments)]
+
+    def subscribe(self, job_id: str) -> Subscription:
+        if self.subscriber_count >= self.max_subscribers:
+            raise TooManySubscribersError("Too many open event streams")
+        subscribers = self._subscribers.setdefault(job_id, set())
+        if len(subscribers) >= self.max_per_job:
+            raise TooManySubscribersError("Too many open event streams for this job")
+        subscription = Subscription(job_id, self.buffer_size)
+        subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.job_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.job_id]
+
+job_events = JobEventBroker(
+    buffer_size=EVENT_SUBSCRIBER_BUFFER,
+    max_subscribers=EVENT_MAX_SUBSCRIBERS,
+    max_per_job=EVENT_MAX_SUBSCRIBERS_PER_JOB,
+)
+
+def job_state_event(job: TranscriptionJob) -> dict:
+    event = {"event": job.status}
+    if job.status == "completed":
+        event["transcription_id"] = job.transcription_id
+    elif job.status == "failed":
+        event["error"] = job.error
+    return event
+
+def format_sse(event: dict) -> bytes:
+    return b"event: " + event["event"].encode() + b"\ndata: " + orjson.dumps(event) + b"\n\n"
+
+async def _read_job_state(job_id: str) -> Optional[dict]:
+    async with AsyncSessionLocal() as db:
+        job = await db.scalar(select(TranscriptionJob).where(TranscriptionJob.id == job_id))
+        return job_state_event(job) if job else None
+
+async def job_event_stream(job: TranscriptionJob, subscription: Subscription) -> AsyncIterator[bytes]:
+    """Server-Sent Events for one job: its current state and the segments
+    transcribed so far, then live updates until it finishes, the stream
+    times out or the subscriber falls behind. Clients reconnect after the
+    last two and resume from the current state."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + EVENT_STREAM_MAX_SECONDS
+    try:
+        yield b"retry: 2000\n\n"
+        state = job_state_event(job)
+        yield format_sse(state)
+        if state["event"] in TERMINAL_STATES:
+            return
+        for segment in job_events.segments(job.id):
+            yield format_sse(segment)
+
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), min(remaining, EVENT_STREAM_POLL_SECONDS))
+            except asyncio.TimeoutError:
+                latest = await _read_job_state(job.id)
+                if latest is None:
+                    return
+                if latest["event"] != state["event"]:
+                    state = latest
+                    yield format_sse(state)
+                    if state["event"] in TERMINAL_STATES:
+                        return
+                else:
+                    yield b": keep-alive\n\n"
+                continue
+            if event is None:
+                return  # lagged
+            yield format_sse(event)
+            if event["event"] != "segment":
+                state = event
+                if event["event"] in TERMINAL_STATES:
+                    return
+    finally:
+        job_events.unsubscribe(subscription)
+
+class JobEventResponse(StreamingResponse):
+    """job_event_stream as a response. The subscription is taken before
+    the response exists, so a full process can still answer 503; this
+    releases it however the response ends, including when the client is
+    gone before the stream's first chunk (the generator's own cleanup only
+    runs once it has started)."""
+
+    def __init__(self, job: TranscriptionJob, subscription: Subscription, **kwargs):
+        self.subscription = subscription
+        super().__init__(job_event_stream(job, subscription), media_type="text/event-stream", **kwargs)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            job_events.unsubscribe(self.subscription)
@@ -0,0 +1,147 @@
+import math
+import threading
+import time
+from typing import Dict, Tuple
+
+from decouple import config
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import case, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from auth import CurrentUser, get_api_caller
+from cache import LRUCache
+from database import AsyncSessionLocal, get_db
+from metering import DEFAULT_PLAN_NAME
+from metrics import counter
+from models import RateLimitBucket
+from subscription_models import Subscription
+
+def parse_rate_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse "plan=per_minute:burst,..." into {plan: (tokens per second, burst)}"""
+    limits = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        plan, values = item.split("=", 1)
+        per_minute, burst = values.split(":", 1)
+        limits[plan.strip()] = (float(per_minute) / 60.0, float(burst))
+    return limits
+
+# Configuration
+RATE_LIMIT_ENABLED = config("RATE_LIMIT_ENABLED", default=True, cast=bool)
+# memory: per process; database: shared by every worker using the same database
+RATE_LIMIT_BACKEND = config("RATE_LIMIT_BACKEND", default="memory")
+RATE_LIMIT_MAX_KEYS = config("RATE_LIMIT_MAX_KEYS", default=100000, cast=int)
+PLAN_CACHE_TTL = config("PLAN_CACHE_TTL", default=60, cast=float)  # seconds
+# Uploads per minute and burst size for each plan
+TRANSCRIBE_RATE_LIMITS = parse_rate_limits(config(
+    "TRANSCRIBE_RATE_LIMITS",
+    default="starter=6:3,professional=60:20,enterprise=300:60"
+))
+# Batch uploads per minute and burst size; each carries up to BATCH_MAX_FILES files
+BATCH_RATE_LIMITS = parse_rate_limits(config(
+    "BATCH_RATE_LIMITS",
+    default="starter=1:1,professional=6:2,enterprise=30:5"
+))
+
+rate_limit_rejections_total = counter(
+    "rate_limit_rejections_total", "Requests rejected by the rate limiter", ("scope", "plan")
+)
+
+class MemoryRateLimiter:
+    """Token buckets held in this process.
+
+    Buckets live in an LRU cache; one evicted for space simply starts
+    over full, which only errs towards letting a request through.
+    """
+
+    def __init__(self, max_keys: int):
+        self._buckets = LRUCache(max_entries=max_keys)
+        self._lock = threading.Lock()
+
+    async def acquire(self, key: str, rate: float, burst: float) -> float:
+        """Take one token. Returns 0 when allowed, else seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if tokens >= 1:
+                self._buckets.set(key, (tokens - 1, now))
+                return 0.0
+            self._buckets.set(key, (tokens, now))
+            return (1 - tokens) / rate
+
+class DatabaseRateLimiter:
+    """Token buckets in the rate_limit_buckets table, so every worker
+    process sees the same limits. Refill and take happen in one
+    conditional UPDATE, like quota reservations."""
+
+    async def acquire(self, key: str, rate: float, burst: float) -> float:
+        now = time.time()
+        refilled = RateLimitBucket.tokens + (now - RateLimitBucket.updated_at) * rate
+        refilled = case((refilled > burst, burst), else_=refilled)
+        take = update(RateLimitBucket).where(
+            RateLimitBucket.key == key,
+            refilled >= 1
+        ).values(tokens=refilled - 1, updated_at=now).execution_options(synchronize_session=False)
+
+        async with AsyncSessionLocal() as db:
+            if (await db.execute(take)).rowcount:
+                await db.commit()
+                return 0.0
+            bucket = await db.get(RateLimitBucket, key)
+            if bucket is None:
+                db.add(RateLimitBucket(key=key, tokens=burst - 1, updated_at=now))
+                try:
+                    await db.commit()
+                    return 0.0
+                except IntegrityError:
+                    # Another worker created it first; go through the normal path
+                    await db.rollback()
+                    return await self.acquire(key, rate, burst)
+            tokens = min(burst, bucket.tokens + (now - bucket.updated_at) * rate)
+            await db.rollback()
+            return max(0.0, (1 - tokens) / rate)
+
+rate_limiter = DatabaseRateLimiter() if RATE_LIMIT_BACKEND == "database" else MemoryRateLimiter(RATE_LIMIT_MAX_KEYS)
+
+# user_id -> plan name, so limiting costs no query on most requests
+plan_cache = LRUCache(max_entries=RATE_LIMIT_MAX_KEYS, ttl=PLAN_CACHE_TTL)
+
+async def plan_for_user(db: AsyncSession, user_id: int) -> str:
+    plan = plan_cache.get(user_id)
+    if plan is None:
+        plan = await db.scalar(select(Subscription.plan_name).where(Subscription.user_id == user_id))
+        plan = plan or DEFAULT_PLAN_NAME
+        plan_cache.set(user_id, plan)
+    return plan
+
+def rate_limited(scope: str, limits: Dict[str, Tuple[float, float]]):
+    """Dependency factory: resolve the caller and take a token from their
+    bucket for ``scope``, answering 429 with Retry-After when it is empty.
+
+    Buckets are per user, so requests made with any of a user's API keys
+    share the same limit. Runs before the endpoint reads the request body.
+    """
+    async def dependency(
+        user: CurrentUser = Depends(get_api_caller),
+        db: AsyncSession = Depends(get_db)
+    ) -> CurrentUser:
+        if not RATE_LIMIT_ENABLED:
+            return user
+        plan = await plan_for_user(db, user.id)
+        rate, burst = limits.get(plan) or limits[DEFAULT_PLAN_NAME]
+        retry_after = await rate_limiter.acquire(f"{scope}:{user.id}", rate, burst)
+        if retry_after:
+            rate_limit_rejections_total.inc(scope=scope, plan=plan)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
+        return user
+    return dependency
+
+transcribe_rate_limit = rate_limited("transcribe", TRANSCRIBE_RATE_LIMITS)
+batch_rate_limit = rate_limited("batch", BATCH_RATE_LIMITS)
@@ -0,0 +1,243 @@
+import asyncio
+import base64
+import binascii
+import fcntl
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from decouple import config
+from fastapi import HTTPException, Request, status
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from database import AsyncSessionLocal
+from models import TranscriptionJob, UploadSession
+from uploads import UPLOAD_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+# An upload with no new chunk for this long is deleted with its partial file
+RESUMABLE_UPLOAD_TTL = config("RESUMABLE_UPLOAD_TTL", default=86400.0, cast=float)  # seconds
+RESUMABLE_MAX_CHUNK_SIZE = config("RESUMABLE_MAX_CHUNK_SIZE", default=8 * 1024 * 1024, cast=int)  # bytes per PATCH
+RESUMABLE_SWEEP_INTERVAL = config("RESUMABLE_SWEEP_INTERVAL", default=600.0, cast=float)  # seconds
+
+# Upload session states
+UPLOAD_UPLOADING = "uploading"
+UPLOAD_FINALIZING = "finalizing"
+
+def upload_expiry(now: Optional[datetime] = None) -> datetime:
+    return (now or datetime.utcnow()) + timedelta(seconds=RESUMABLE_UPLOAD_TTL)
+
+def preallocate(path: str, size: int):
+    """Create ``path`` with ``size`` bytes reserved on disk, so running out
+    of space fails the create instead of a chunk halfway through"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            os.ftruncate(fd, size)
+    except BaseException:
+        os.close(fd)
+        os.remove(path)
+        raise
+    os.close(fd)
+
+def parse_checksum(header: Optional[str]) -> Optional[bytes]:
+    """``Upload-Checksum: sha256 <base64 digest>`` to the raw digest"""
+    if not header:
+        return None
+    algorithm, _, value = header.strip().partition(" ")
+    if algorithm.lower() != "sha256":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Upload-Checksum must use sha256"
+        )
+    try:
+        digest = base64.b64decode(value.strip(), validate=True)
+    except binascii.Error:
+        digest = b""
+    if len(digest) != hashlib.sha256().digest_size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Malformed Upload-Checksum"
+        )
+    return digest
+
+def _pwrite_all(fd: int, data: bytes, position: int):
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, position)
+        view = view[written:]
+        position += written
+
+def _check_offset(upload_status: str, bytes_received: int, offset: int):
+    if upload_status != UPLOAD_UPLOADING:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Upload is being finalized"
+        )
+    if offset != bytes_received:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload-Offset must be {bytes_received}",
+            headers={"Upload-Offset": str(bytes_received)}
+        )
+
+async def append_chunk(
+    db: AsyncSession,
+    request: Request,
+    upload: UploadSession,
+    offset: int,
+    checksum: Optional[bytes] = None,
+) -> UploadSession:
+    """Write the request body into the upload's file at ``offset`` and move
+    the offset past it.
+
+    The body is written in place as it arrives, never held whole in memory.
+    The file is locked for the duration, so a second request for the same
+    upload gets 409 instead of interleaving, and the offset is checked
+    again under the lock before anything is written. A chunk only counts once it
+    is complete, matches ``checksum`` when one is given, and is on disk;
+    anything less leaves the offset where it was and the client resends
+    from there.
+    """
+    _check_offset(upload.status, upload.bytes_received, offset)
+
+    limit = min(RESUMABLE_MAX_CHUNK_SIZE, upload.size - offset)
+    fd = os.open(upload.file_path, os.O_WRONLY)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Another chunk is being written to this upload"
+            )
+        # The check above may predate a chunk or finalize that finished
+        # while this request waited; look again now nothing else can write.
+        # Committing ends the read transaction the upload was loaded in, so
+        # the query sees their changes.
+        await db.commit()
+        current = (await db.execute(
+            select(UploadSession.status, UploadSession.bytes_received)
+            .where(UploadSession.id == upload.id)
+        )).one_or_none()
+        if current is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Upload not found"
+            )
+        _check_offset(current.status, current.bytes_received, offset)
+
+        digest = hashlib.sha256()
+        buffer = bytearray()
+        position = offset
+        received = 0
+        async for data in request.stream():
+            received += len(data)
+            if received > limit:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"Chunk must be at most {limit} bytes"
+                )
+            digest.update(data)
+            buffer += data
+            if len(buffer) >= UPLOAD_CHUNK_SIZE:
+                await run_in_threadpool(_pwrite_all, fd, bytes(buffer), position)
+                position += len(buffer)
+                buffer.clear()
+        if buffer:
+            await run_in_threadpool(_pwrite_all, fd, bytes(buffer), position)
+
+        if checksum is not None and digest.digest() != checksum:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Chunk checksum mismatch",
+                headers={"Upload-Offset": str(offset)}
+            )
+        # The offset recorded below must never run ahead of the bytes that
+        # would survive a crash
+        await run_in_threadpool(os.fdatasync, fd)
+
+        expires_at = upload_expiry()
+        moved = await db.execute(update(UploadSession).where(
+            UploadSession.id == upload.id,
+            UploadSession.status == UPLOAD_UPLOADING,
+            UploadSession.bytes_received == offset
+        ).values(
+            bytes_received=offset + received,
+            expires_at=expires_at
+        ).execution_options(synchronize_session=False))
+        if not moved.rowcount:
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Upload changed while the chunk was sent; query its offset and resume"
+            )
+        await db.commit()
+    finally:
+        os.close(fd)  # releases the lock
+
+    upload.bytes_received = offset + received
+    upload.expires_at = expires_at
+    return upload
+
+def hash_file(path: str) -> str:
+    """SHA-256 hex of a file, read a chunk at a time. Blocking."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                return digest.hexdigest()
+            digest.update(chunk)
+
+def remove_upload_file(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+async def expire_uploads(now: Optional[datetime] = None) -> int:
+    """Delete sessions past their expiry with their files. A session left
+    finalizing may already have handed its file to a job (same id); then
+    only the row goes. Returns the number of sessions removed."""
+    now = now or datetime.utcnow()
+    async with AsyncSessionLocal() as db:
+        expired = (await db.execute(
+            select(UploadSession.id, UploadSession.status, UploadSession.file_path)
+            .where(UploadSession.expires_at < now)
+        )).all()
+        removed, orphaned = 0, []
+        for upload_id, upload_status, file_path in expired:
+            # Conditional, so a chunk that just extended the session wins
+            deleted = await db.execute(delete(UploadSession).where(
+                UploadSession.id == upload_id,
+                UploadSession.expires_at < now
+            ))
+            if not deleted.rowcount:
+                continue
+            removed += 1
+            if upload_status == UPLOAD_UPLOADING or not await db.scalar(
+                select(TranscriptionJob.id).where(TranscriptionJob.id == upload_id)
+            ):
+                orphaned.append(file_path)
+        await db.commit()
+    for file_path in orphaned:
+        await run_in_threadpool(remove_upload_file, file_path)
+    return removed
+
+async def run_upload_sweeper():
+    """Background task: expire abandoned uploads every RESUMABLE_SWEEP_INTERVAL"""
+    while True:
+        try:
+            removed = await expire_uploads()
+            if removed:
+                logger.info("Expired %d abandoned uploads", removed)
+        except Exception:
+            logger.exception("Upload sweep failed")
+        await asyncio.sleep(RESUMABLE_SWEEP_INTERVAL)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional, Union
 
 class UserCreate(BaseModel):
     email: EmailStr
@@ -34,6 +34,37 @@ class TranscriptionResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class TranscriptionSummary(BaseModel):
+    id: int
+    filename: str
+    text_preview: str
+    file_size: int
+    duration: Optional[float]
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class TranscriptionPage(BaseModel):
+    items: List[Union[TranscriptionResponse, TranscriptionSummary]]
+    next_cursor: Optional[str] = None
+
+class TranscriptionSearchHit(BaseModel):
+    id: int
+    filename: str
+    snippet: str  # HTML-escaped, matches wrapped in <mark>
+    file_size: int
+    duration: Optional[float]
+    created_at: datetime
+    rank: float
+    
+    class Config:
+        from_attributes = True
+
+class TranscriptionSearchPage(BaseModel):
+    items: List[TranscriptionSearchHit]
+    next_offset: Optional[int] = None
+
 class APIKeyCreate(BaseModel):
     name: str
 
@@ -57,9 +88,81 @@ class SubscriptionResponse(BaseModel):
     current_period_start: Optional[datetime]
     current_period_end: Optional[datetime]
     cancel_at_period_end: bool
-    monthly_transcription_limit: int
+    monthly_transcription_limit: Optional[int]  # None means unlimited
     monthly_transcription_used: int
     created_at: datetime
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class UsagePeriodResponse(BaseModel):
+    period: str  # YYYY-MM
+    minutes_used: float
+    transcription_count: int
+    
+    class Config:
+        from_attributes = True
+
+class StatsPeriod(BaseModel):
+    period: str  # YYYY-MM
+    transcription_count: int
+    minutes: float  # audio length; billed minutes are under /usage
+    total_bytes: int
+
+class StatsResponse(BaseModel):
+    transcription_count: int
+    minutes: float
+    total_bytes: int
+    this_month: StatsPeriod
+    months: List[StatsPeriod]  # newest first
+
+class JobResponse(BaseModel):
+    id: str
+    status: str
+    filename: str
+    file_size: int
+    duration: Optional[float] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    transcription: Optional[TranscriptionResponse] = None
+    
+    class Config:
+        from_attributes = True
+
+class UploadCreate(BaseModel):
+    filename: str
+    size: int  # total bytes of the file to be sent
+    content_type: str
+
+class UploadSessionResponse(BaseModel):
+    id: str
+    filename: str
+    size: int
+    offset: int  # bytes received so far; the next chunk starts here
+    status: str  # uploading, finalizing
+    expires_at: datetime  # unless another chunk arrives first
+
+class BatchItem(BaseModel):
+    id: str  # job id; GET /jobs/{id} has the full transcription
+    status: str
+    filename: str
+    file_size: int
+    duration: Optional[float] = None
+    error: Optional[str] = None
+    transcription_id: Optional[int] = None
+    
+    class Config:
+        from_attributes = True
+
+class BatchResponse(BaseModel):
+    id: str
+    status: str
+    item_count: int
+    completed: int
+    failed: int
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    items: List[BatchItem]  # by filename
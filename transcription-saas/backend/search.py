@@ -0,0 +1,205 @@
+import html
+import re
+from typing import List
+
+from sqlalchemy import select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Transcription
+
+# Markers the database puts around matches; swapped for <mark> tags after
+# the snippet has been HTML-escaped
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+SNIPPET_WORDS = 24
+
+# Long transcripts may be stored compressed (see compression.py), so the
+# index reads them through transcript_text(), which every connection
+# registers on connect
+SQLITE_CONTENT_VIEW = "transcriptions_fts_content"
+
+# The owner is indexed too, as one token per user ("u42"), so a search
+# only walks that user's entries instead of matching across all users and
+# filtering afterwards. Its bm25 weight is zero.
+SQLITE_OWNER_COLUMN = "owner"
+
+SQLITE_SEARCH_DDL = [
+    f"""
+    CREATE VIEW IF NOT EXISTS {SQLITE_CONTENT_VIEW} AS
+    SELECT id, transcript_text(transcription_text) AS transcription_text, filename,
+           'u' || user_id AS {SQLITE_OWNER_COLUMN}
+    FROM transcriptions
+    """,
+    # External-content index over transcriptions; stores only the index,
+    # the text itself stays in the transcriptions table
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS transcriptions_fts USING fts5(
+        transcription_text, filename, {SQLITE_OWNER_COLUMN},
+        content='{SQLITE_CONTENT_VIEW}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    # Triggers keep the index current as rows are written
+    f"""
+    CREATE TRIGGER IF NOT EXISTS transcriptions_fts_insert AFTER INSERT ON transcriptions BEGIN
+        INSERT INTO transcriptions_fts(rowid, transcription_text, filename, {SQLITE_OWNER_COLUMN})
+        VALUES (new.id, transcript_text(new.transcription_text), new.filename, 'u' || new.user_id);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS transcriptions_fts_delete AFTER DELETE ON transcriptions BEGIN
+        INSERT INTO transcriptions_fts(transcriptions_fts, rowid, transcription_text, filename, {SQLITE_OWNER_COLUMN})
+        VALUES ('delete', old.id, transcript_text(old.transcription_text), old.filename, 'u' || old.user_id);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS transcriptions_fts_update AFTER UPDATE ON transcriptions BEGIN
+        INSERT INTO transcriptions_fts(transcriptions_fts, rowid, transcription_text, filename, {SQLITE_OWNER_COLUMN})
+        VALUES ('delete', old.id, transcript_text(old.transcription_text), old.filename, 'u' || old.user_id);
+        INSERT INTO transcriptions_fts(rowid, transcription_text, filename, {SQLITE_OWNER_COLUMN})
+        VALUES (new.id, transcript_text(new.transcription_text), new.filename, 'u' || new.user_id);
+    END
+    """,
+]
+
+# Objects from before the index read through the content view, or before
+# it indexed the owner
+SQLITE_LEGACY_DDL = [
+    "DROP TRIGGER IF EXISTS transcriptions_fts_insert",
+    "DROP TRIGGER IF EXISTS transcriptions_fts_delete",
+    "DROP TRIGGER IF EXISTS transcriptions_fts_update",
+    "DROP TABLE IF EXISTS transcriptions_fts",
+    f"DROP VIEW IF EXISTS {SQLITE_CONTENT_VIEW}",
+]
+
+POSTGRES_SEARCH_DDL = [
+    """
+    CREATE INDEX IF NOT EXISTS ix_transcriptions_fts ON transcriptions
+    USING gin (to_tsvector('english', transcription_text))
+    """,
+]
+
+# Raw queries return SQLite timestamps as text; typing the column converts
+# them as the ORM would, since hits are serialized without validation
+HIT_COLUMN_TYPES = {"created_at": Transcription.created_at.type}
+
+class SearchHit:
+    def __init__(self, id, filename, snippet, file_size, duration, created_at, rank):
+        self.id = id
+        self.filename = filename
+        self.snippet = snippet
+        self.file_size = file_size
+        self.duration = duration
+        self.created_at = created_at
+        self.rank = rank
+
+def ensure_search_index(conn: Connection):
+    """Create the full-text index and its triggers if they are missing.
+    Run from a migration, inside its transaction."""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        existing = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'transcriptions_fts'"
+        )).scalar()
+        if existing and (SQLITE_CONTENT_VIEW not in existing or SQLITE_OWNER_COLUMN not in existing):
+            # An older shape of the index; recreate it
+            for statement in SQLITE_LEGACY_DDL:
+                conn.execute(text(statement))
+            existing = None
+        for statement in SQLITE_SEARCH_DDL:
+            conn.execute(text(statement))
+        if not existing:
+            # Index rows written before the index existed
+            conn.execute(text("INSERT INTO transcriptions_fts(transcriptions_fts) VALUES ('rebuild')"))
+    elif dialect == "postgresql":
+        for statement in POSTGRES_SEARCH_DDL:
+            conn.execute(text(statement))
+
+def _terms(query: str) -> List[str]:
+    return re.findall(r"\w+", query.lower())
+
+def _render_snippet(raw: str) -> str:
+    """HTML-escape a snippet and turn the match markers into <mark> tags"""
+    escaped = html.escape(raw or "")
+    return escaped.replace(MATCH_START, "<mark>").replace(MATCH_END, "</mark>")
+
+async def _sqlite_search(db: AsyncSession, user_id: int, terms: List[str], limit: int, offset: int):
+    # Quote every term so user input can't inject FTS5 syntax; the last
+    # term is a prefix match to support search-as-you-type. Terms only
+    # match the text columns, and only this user's entries are searched.
+    match = " ".join(f'"{t}"' for t in terms[:-1])
+    match = f'{match} "{terms[-1]}"*'.strip()
+    match = f'{SQLITE_OWNER_COLUMN}:"u{int(user_id)}" AND {{transcription_text filename}}: ({match})'
+    result = await db.execute(text(f"""
+        SELECT t.id, t.filename, t.file_size, t.duration, t.created_at,
+               snippet(transcriptions_fts, 0, :start, :end, '…', {SNIPPET_WORDS}) AS snippet,
+               -bm25(transcriptions_fts, 1.0, 0.5, 0.0) AS rank
+        FROM transcriptions_fts
+        JOIN transcriptions t ON t.id = transcriptions_fts.rowid
+        WHERE transcriptions_fts MATCH :match AND t.user_id = :user_id
+        ORDER BY bm25(transcriptions_fts, 1.0, 0.5, 0.0)
+        LIMIT :limit OFFSET :offset
+    """).columns(**HIT_COLUMN_TYPES), {
+        "start": MATCH_START, "end": MATCH_END, "match": match,
+        "user_id": user_id, "limit": limit, "offset": offset,
+    })
+    return result.all()
+
+async def _postgres_search(db: AsyncSession, user_id: int, terms: List[str], limit: int, offset: int):
+    result = await db.execute(text(f"""
+        SELECT t.id, t.filename, t.file_size, t.duration, t.created_at,
+               ts_headline('english', t.transcription_text, q,
+                           'StartSel=' || :start || ', StopSel=' || :end || ', MaxWords={SNIPPET_WORDS}, MinWords=8') AS snippet,
+               ts_rank(to_tsvector('english', t.transcription_text), q) AS rank
+        FROM transcriptions t, plainto_tsquery('english', :query) q
+        WHERE t.user_id = :user_id AND to_tsvector('english', t.transcription_text) @@ q
+        ORDER BY rank DESC, t.id DESC
+        LIMIT :limit OFFSET :offset
+    """).columns(**HIT_COLUMN_TYPES), {
+        "start": MATCH_START, "end": MATCH_END, "query": " ".join(terms),
+        "user_id": user_id, "limit": limit, "offset": offset,
+    })
+    return result.all()
+
+async def _fallback_search(db: AsyncSession, user_id: int, terms: List[str], limit: int, offset: int):
+    """Unindexed LIKE scan for engines without a supported full-text index"""
+    query = select(Transcription).where(Transcription.user_id == user_id)
+    for term in terms:
+        query = query.where(Transcription.transcription_text.ilike(f"%{term}%"))
+    result = await db.execute(
+        query.order_by(Transcription.created_at.desc(), Transcription.id.desc()).limit(limit).offset(offset)
+    )
+    rows = result.scalars().all()
+
+    hits = []
+    pattern = re.compile("|".join(re.escape(t) for t in terms), re.IGNORECASE)
+    for row in rows:
+        words = row.transcription_text.split()
+        first = next((i for i, w in enumerate(words) if pattern.search(w)), 0)
+        window = " ".join(words[max(0, first - SNIPPET_WORDS // 2):first + SNIPPET_WORDS // 2])
+        snippet = pattern.sub(lambda m: f"{MATCH_START}{m.group(0)}{MATCH_END}", window)
+        hits.append((row.id, row.filename, row.file_size, row.duration, row.created_at, snippet, 0.0))
+    return hits
+
+async def search_transcriptions(db: AsyncSession, user_id: int, query: str, limit: int, offset: int) -> List[SearchHit]:
+    """Ranked full-text search over one user's transcriptions"""
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    dialect = db.bind.dialect.name
+    if dialect == "sqlite":
+        rows = await _sqlite_search(db, user_id, terms, limit, offset)
+    elif dialect == "postgresql":
+        rows = await _postgres_search(db, user_id, terms, limit, offset)
+    else:
+        rows = await _fallback_search(db, user_id, terms, limit, offset)
+
+    return [
+        SearchHit(
+            id=r[0], filename=r[1], file_size=r[2], duration=r[3], created_at=r[4],
+            snippet=_render_snippet(r[5]), rank=float(r[6] or 0.0)
+        )
+        for r in rows
+    ]
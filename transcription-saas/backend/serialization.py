@@ -0,0 +1,35 @@
+from typing import Any, Type, TypeVar
+
+import orjson
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+Schema = TypeVar("Schema", bound=BaseModel)
+
+def trusted(schema: Type[Schema], obj: Any, **values) -> Schema:
+    """Build ``schema`` from an object's attributes without validating.
+
+    Only for data we produced ourselves (ORM rows, query results) whose
+    columns already have the schema's types. ``values`` override or add
+    fields, e.g. nested models built with ``trusted`` as well.
+    """
+    for name in schema.model_fields:
+        if name not in values:
+            values[name] = getattr(obj, name)
+    return schema.model_construct(**values)
+
+def _default(obj: Any):
+    if isinstance(obj, BaseModel):
+        return obj.__dict__
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+class TrustedResponse(ORJSONResponse):
+    """Writes models built with ``trusted`` straight to JSON.
+
+    Returning a Response makes FastAPI skip its own pass over the result
+    (validating against ``response_model`` and ``jsonable_encoder``); the
+    route's ``response_model`` still documents the shape in OpenAPI.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
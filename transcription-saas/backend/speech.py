@@ -0,0 +1,82 @@
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional
+
+from decouple import config
+
+# Configuration
+SPEECH_BACKEND = config("SPEECH_BACKEND", default="openai")
+WHISPER_MODEL = config("WHISPER_MODEL", default="whisper-1")
+STUB_TRANSCRIPT = config("STUB_TRANSCRIPT", default="This is a stub transcription.")
+
+class SpeechBackend(ABC):
+    """Turns one audio file into text. Implementations may block; callers run
+    them on worker threads."""
+
+    name = "base"
+
+    @abstractmethod
+    def transcribe(self, file_path: str) -> str:
+        """Text of the audio in ``file_path``"""
+
+class OpenAIWhisperBackend(SpeechBackend):
+    """OpenAI Whisper API backend"""
+
+    name = "openai"
+
+    def __init__(self, api_key: Optional[str] = None, model: str = WHISPER_MODEL):
+        self.api_key = api_key if api_key is not None else config("OPENAI_API_KEY", default="")
+        self.model = model
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=self.api_key)
+        return self._client
+
+    def transcribe(self, file_path: str) -> str:
+        with open(file_path, 'rb') as audio_file:
+            transcript = self.client.audio.transcriptions.create(model=self.model, file=audio_file)
+        return transcript.text
+
+class StubSpeechBackend(SpeechBackend):
+    """Local backend that never leaves the process, for development and tests.
+
+    By default every file transcribes to STUB_TRANSCRIPT; pass ``text_for``
+    to derive the text from the file instead.
+    """
+
+    name = "stub"
+
+    def __init__(self, text_for: Optional[Callable[[str], str]] = None):
+        self.text_for = text_for
+
+    def transcribe(self, file_path: str) -> str:
+        if self.text_for is not None:
+            return self.text_for(file_path)
+        return STUB_TRANSCRIPT
+
+SPEECH_BACKENDS: Dict[str, Callable[[], SpeechBackend]] = {
+    "openai": OpenAIWhisperBackend,
+    "stub": StubSpeechBackend,
+}
+
+_backend: Optional[SpeechBackend] = None
+
+def register_speech_backend(name: str, factory: Callable[[], SpeechBackend]):
+    SPEECH_BACKENDS[name] = factory
+
+def get_speech_backend() -> SpeechBackend:
+    """Return the configured backend, creating it on first use"""
+    global _backend
+    if _backend is None:
+        if SPEECH_BACKEND not in SPEECH_BACKENDS:
+            raise ValueError(f"Unknown speech backend: {SPEECH_BACKEND}")
+        _backend = SPEECH_BACKENDS[SPEECH_BACKEND]()
+    return _backend
+
+def set_speech_backend(backend: Optional[SpeechBackend]):
+    """Replace the active backend, e.g. with a stub in tests. None resets it."""
+    global _backend
+    _backend = backend
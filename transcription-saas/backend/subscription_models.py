@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Float
-from sqlalchemy.relationship import relationship
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Float, Text, UniqueConstraint, Index
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
 
@@ -21,9 +21,19 @@ class Subscription(Base):
     # Usage limits
     monthly_transcription_limit = Column(Integer, default=60)  # minutes
     monthly_transcription_used = Column(Integer, default=0)  # minutes
+    usage_period = Column(String(7), nullable=True)  # YYYY-MM the used counter belongs to
+    
+    # Creation time (epoch seconds) of the last Stripe event applied, so
+    # late deliveries of older events are ignored
+    stripe_event_created = Column(Integer, nullable=True)
     
     # Relationships
     user = relationship("User", back_populates="subscription")
+    
+    __table_args__ = (
+        # One row per user; the quota UPDATEs expect to hit exactly one
+        UniqueConstraint("user_id", name="uq_subscriptions_user_id"),
+    )
 
 class Usage(Base):
     __tablename__ = "usage"
@@ -36,4 +46,37 @@ class Usage(Base):
     
     # Relationships
     user = relationship("User")
-    transcription = relationship("Transcription")
\ No newline at end of file
+    transcription = relationship("Transcription")
+
+class UsagePeriod(Base):
+    __tablename__ = "usage_periods"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    period = Column(String(7), nullable=False)  # YYYY-MM
+    minutes_used = Column(Float, nullable=False, default=0)
+    transcription_count = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        # One rollup row per user and billing period
+        UniqueConstraint("user_id", "period", name="uq_usage_periods_user_period"),
+    )
+
+class WebhookEvent(Base):
+    __tablename__ = "webhook_events"
+    
+    id = Column(String, primary_key=True)  # Stripe event id; duplicates are dropped
+    type = Column(String, nullable=False)
+    object_id = Column(String, nullable=True)  # Stripe subscription the event is about
+    payload = Column(Text, nullable=False)  # JSON of event.data.object
+    stripe_created = Column(Integer, nullable=False)  # epoch seconds
+    status = Column(String, nullable=False, default="pending")  # pending, processed, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+    
+    __table_args__ = (
+        # The consumer drains pending events oldest first
+        Index("ix_webhook_events_status_created", "status", "stripe_created"),
+    )
@@ -0,0 +1,67 @@
+import struct
+
+import pytest
+
+from audio_probe import AudioProbeError, probe_audio
+
+def ogg_page(granule: int, sequence: int, packet: bytes) -> bytes:
+    # CRC is left at zero; the probe does not check it
+    return (
+        b"OggS" + bytes([0, 0]) + struct.pack("<qII", granule, 1, sequence) + b"\0\0\0\0"
+        + bytes([1, len(packet)]) + packet
+    )
+
+def opus_file(seconds: float) -> bytes:
+    head = b"OpusHead" + bytes([1, 1]) + struct.pack("<HI", 312, 48000) + b"\0\0\0"
+    return ogg_page(0, 0, head) + ogg_page(312 + int(seconds * 48000), 1, b"\0" * 16)
+
+def mp4_box(box_type: bytes, body: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(body), box_type) + body
+
+def m4a_file(seconds: float, sample_rate: int = 44100) -> bytes:
+    time_header = b"\0\0\0\0" + struct.pack(">IIII", 0, 0, sample_rate, int(seconds * sample_rate))
+    sample_entry = (
+        struct.pack(">I4s", 36, b"mp4a") + b"\0" * 16
+        + struct.pack(">HH", 2, 16) + b"\0" * 4 + struct.pack(">I", sample_rate << 16)
+    )
+    stbl = mp4_box(b"stbl", mp4_box(b"stsd", b"\0\0\0\0" + struct.pack(">I", 1) + sample_entry))
+    mdia = mp4_box(b"mdia", (
+        mp4_box(b"mdhd", time_header)
+        + mp4_box(b"hdlr", b"\0" * 8 + b"soun" + b"\0" * 12)
+        + mp4_box(b"minf", stbl)
+    ))
+    moov = mp4_box(b"moov", mp4_box(b"mvhd", time_header) + mp4_box(b"trak", mdia))
+    return mp4_box(b"ftyp", b"M4A \0\0\0\0") + moov
+
+@pytest.mark.parametrize("make, format", [(opus_file, "ogg/opus"), (m4a_file, "mp4")])
+def test_probe_reads_duration(tmp_path, make, format):
+    path = tmp_path / "audio"
+    path.write_bytes(make(3.0))
+    info = probe_audio(str(path))
+    assert info.format == format
+    assert info.duration == pytest.approx(3.0)
+    assert info.channels in (1, 2)
+
+def test_truncated_ogg_is_rejected(tmp_path):
+    data = opus_file(3.0)
+    path = tmp_path / "audio.ogg"
+    # Cut anywhere before the final granule position; past it the length is
+    # still known and the file is accepted
+    for length in range(data.rfind(b"OggS") + 14):
+        path.write_bytes(data[:length])
+        with pytest.raises(AudioProbeError):
+            probe_audio(str(path))
+
+def test_truncated_m4a_is_rejected(tmp_path):
+    data = m4a_file(3.0)
+    path = tmp_path / "audio.m4a"
+    for length in range(len(data)):
+        path.write_bytes(data[:length])
+        with pytest.raises(AudioProbeError):
+            probe_audio(str(path))
+
+def test_empty_time_header_is_rejected(tmp_path):
+    path = tmp_path / "audio.m4a"
+    path.write_bytes(mp4_box(b"ftyp", b"M4A \0\0\0\0") + mp4_box(b"moov", mp4_box(b"mvhd", b"")))
+    with pytest.raises(AudioProbeError):
+        probe_audio(str(path))
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from auth import (
+    PasswordHasher, api_key_cache, api_key_prefix, generate_api_key, hash_api_key,
+    refresh_api_key_cache, resolve_api_key, unknown_api_key_cache
+)
+from database import Base
+from models import APIKey, User
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.mark.anyio
+async def test_cancelled_request_keeps_its_hash_counted():
+    hasher = PasswordHasher(workers=1, max_pending=1)
+    release = threading.Event()
+    try:
+        waiting = asyncio.ensure_future(hasher._run(release.wait))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+
+        # The thread is still busy with the abandoned hash
+        assert hasher.pending == 1
+        with pytest.raises(HTTPException) as error:
+            await hasher._run(lambda: True)
+        assert error.value.status_code == 503
+
+        release.set()
+        for _ in range(100):
+            if not hasher.pending:
+                break
+            await asyncio.sleep(0.01)
+        assert hasher.pending == 0
+        assert await hasher._run(lambda: True) is True
+    finally:
+        release.set()
+        hasher.shutdown()
+
+@pytest.fixture
+async def db(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/auth.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    api_key_cache.clear()
+    unknown_api_key_cache.clear()
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        session.add(User(id=1, email="client@example.com", hashed_password="x", is_active=True))
+        await session.commit()
+        yield session
+    api_key_cache.clear()
+    unknown_api_key_cache.clear()
+    await engine.dispose()
+
+async def add_key(db: AsyncSession) -> str:
+    key = generate_api_key()
+    db.add(APIKey(user_id=1, name="ci", prefix=api_key_prefix(key), key_hash=hash_api_key(key), is_active=True))
+    await db.commit()
+    return key
+
+@pytest.mark.anyio
+async def test_unknown_keys_do_not_evict_valid_ones(db, monkeypatch):
+    key = await add_key(db)
+    assert (await resolve_api_key(key, db)).id == 1
+    for _ in range(unknown_api_key_cache.max_entries + 10):
+        with pytest.raises(HTTPException):
+            await resolve_api_key(generate_api_key(), db)
+    assert api_key_prefix(key) in api_key_cache.keys()
+
+    # Repeats of a bad key are answered from the unknown cache
+    bad = generate_api_key()
+    with pytest.raises(HTTPException):
+        await resolve_api_key(bad, db)
+
+    async def no_query(*args, **kwargs):
+        raise AssertionError("queried the database")
+
+    monkeypatch.setattr(db, "execute", no_query)
+    with pytest.raises(HTTPException):
+        await resolve_api_key(bad, db)
+    assert (await resolve_api_key(key, db)).id == 1
+
+@pytest.mark.anyio
+async def test_new_key_is_not_shadowed_by_an_unknown_entry(db):
+    key = generate_api_key()
+    with pytest.raises(HTTPException):
+        await resolve_api_key(key, db)
+    db.add(APIKey(user_id=1, name="ci", prefix=api_key_prefix(key), key_hash=hash_api_key(key), is_active=True))
+    await db.commit()
+    assert (await resolve_api_key(key, db)).id == 1
+
+@pytest.mark.anyio
+async def test_refresh_rereads_only_cached_keys(db):
+    used, unused = await add_key(db), await add_key(db)
+    await resolve_api_key(used, db)
+    assert await refresh_api_key_cache(db) == 1
+    assert api_key_cache.keys() == [api_key_prefix(used)]
+
+    # Revoked elsewhere: no ORM event in this process, only the refresh
+    await db.execute(update(APIKey).values(is_active=False).execution_options(synchronize_session=False))
+    await db.commit()
+    assert await refresh_api_key_cache(db) == 0
+    assert api_key_cache.keys() == []
+    with pytest.raises(HTTPException):
+        await resolve_api_key(used, db)
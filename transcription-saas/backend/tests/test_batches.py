@@ -0,0 +1,186 @@
+import zipfile
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import batches
+import main
+import uploads
+from audio_probe import AudioInfo, AudioProbeError
+from auth import CurrentUser
+from database import Base
+from jobs import JOB_COMPLETED, JOB_FAILED, JOB_PROCESSING, JOB_QUEUED
+from metering import current_period, new_default_subscription
+from models import TranscriptionBatch, TranscriptionJob, User
+from subscription_models import Subscription, Usage
+from uploads import SavedUpload, extract_archive
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+def url(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_DIR", str(tmp_path))
+    url = f"{tmp_path}/batches.db"
+    engine = create_engine(f"sqlite:///{url}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert().values(id=1, email="batcher@example.com", hashed_password="x"))
+    monkeypatch.setattr(batches, "SessionLocal", sessionmaker(bind=engine))
+    yield url
+    engine.dispose()
+
+def audio_file(tmp_path, name: str) -> SavedUpload:
+    path = tmp_path / f"{name}.wav"
+    path.write_bytes(name.encode())
+    return SavedUpload(name, f"{name}.wav", "audio/wav", str(path), path.stat().st_size, f"hash-{name}-{path}")
+
+def add_batch(session, tmp_path, names, status=JOB_QUEUED, started_at=None, used=None):
+    session.add(TranscriptionBatch(
+        id="b1", user_id=1, status=status, item_count=len(names), concurrency=2, started_at=started_at
+    ))
+    for name in names:
+        upload = audio_file(tmp_path, name)
+        session.add(TranscriptionJob(
+            id=name, user_id=1, batch_id="b1", filename=upload.filename, file_path=upload.file_path,
+            file_size=upload.file_size, duration=30.0, status=JOB_QUEUED, reserved_minutes=1,
+            billing_period=current_period()
+        ))
+    subscription = new_default_subscription(1)
+    subscription.monthly_transcription_used = len(names) if used is None else used
+    session.add(subscription)
+    session.commit()
+
+def fake_transcribe(calls):
+    def transcribe(job_id, file_path):
+        calls.append(job_id)
+        if job_id.startswith("bad"):
+            raise RuntimeError("backend refused")
+        return f"text of {job_id}"
+    return transcribe
+
+def test_batch_items_finish_on_their_own(url, tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(batches, "transcribe_job_audio", fake_transcribe(calls))
+    monkeypatch.setattr(batches, "BATCH_WRITE_SIZE", 2)
+    with batches.SessionLocal() as session:
+        add_batch(session, tmp_path, ["one", "bad", "two"])
+
+    batches.run_transcription_batch("b1")
+
+    with batches.SessionLocal() as session:
+        assert session.get(TranscriptionBatch, "b1").status == JOB_COMPLETED
+        jobs = {job.id: job for job in session.scalars(select(TranscriptionJob))}
+        assert jobs["one"].status == jobs["two"].status == JOB_COMPLETED
+        assert jobs["one"].transcription.transcription_text == "text of one"
+        assert jobs["bad"].status == JOB_FAILED
+        assert "backend refused" in jobs["bad"].error
+        # The failed item's minute is given back; the others are billed
+        assert session.scalar(select(Subscription.monthly_transcription_used)) == 2
+        assert session.scalar(select(func.count()).select_from(Usage)) == 2
+        assert not any((tmp_path / f"{name}.wav").exists() for name in jobs)
+    assert sorted(calls) == ["bad", "one", "two"]
+
+def test_resumed_batch_keeps_finished_items(url, tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(batches, "transcribe_job_audio", fake_transcribe(calls))
+    stale = datetime.utcnow() - timedelta(seconds=batches.JOB_STALE_AFTER + 60)
+    with batches.SessionLocal() as session:
+        add_batch(session, tmp_path, ["done", "left"], status=JOB_PROCESSING, started_at=stale)
+        session.get(TranscriptionJob, "done").status = JOB_COMPLETED
+        session.commit()
+
+    assert batches.recover_batches(10, True) == ["b1"]
+    batches.run_transcription_batch("b1")
+
+    assert calls == ["left"]
+    with batches.SessionLocal() as session:
+        assert session.get(TranscriptionJob, "left").status == JOB_COMPLETED
+        assert session.get(TranscriptionBatch, "b1").status == JOB_COMPLETED
+
+def test_running_batch_is_not_claimed_twice(url, tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(batches, "transcribe_job_audio", fake_transcribe(calls))
+    with batches.SessionLocal() as session:
+        add_batch(session, tmp_path, ["one"], status=JOB_PROCESSING, started_at=datetime.utcnow())
+
+    assert batches.recover_batches(10, True) == []
+    batches.run_transcription_batch("b1")
+    assert calls == []
+
+@pytest.fixture
+async def db(url):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{url}")
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        yield session
+    await engine.dispose()
+
+USER = CurrentUser(1, "batcher@example.com", None, True)
+
+@pytest.mark.anyio
+async def test_queued_batch_reserves_once_and_fails_unreadable_items(db, tmp_path, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(main.batch_queue, "submit", submitted.append)
+    files = [audio_file(tmp_path, "good"), audio_file(tmp_path, "corrupt")]
+    probes = [AudioInfo("wav", 90.0, 16000, 1), AudioProbeError("not audio")]
+
+    await main._queue_batch(db, USER, files, probes)
+
+    batch = await db.scalar(select(TranscriptionBatch))
+    assert submitted == [batch.id]
+    jobs = {job.id: job for job in await db.scalars(select(TranscriptionJob))}
+    assert jobs["good"].status == JOB_QUEUED and jobs["good"].reserved_minutes == 2
+    assert jobs["corrupt"].status == JOB_FAILED
+    assert not (tmp_path / "corrupt.wav").exists()
+    assert await db.scalar(select(Subscription.monthly_transcription_used)) == 2
+
+@pytest.mark.anyio
+async def test_batch_over_the_quota_is_refused_whole(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(main.batch_queue, "submit", lambda batch_id: pytest.fail("queued"))
+    files = [audio_file(tmp_path, f"long{i}") for i in range(2)]
+    # 40 minutes each against the 60-minute starter plan
+    probes = [AudioInfo("wav", 40 * 60.0, 16000, 1) for _ in files]
+
+    with pytest.raises(HTTPException) as refused:
+        await main._queue_batch(db, USER, files, probes)
+    assert refused.value.status_code == 402
+    assert await db.scalar(select(func.count()).select_from(TranscriptionJob)) == 0
+    assert await db.scalar(select(func.count()).select_from(TranscriptionBatch)) == 0
+
+def zip_of(tmp_path, members) -> SavedUpload:
+    path = tmp_path / "batch.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return SavedUpload("archive", "batch.zip", "application/zip", str(path), path.stat().st_size, "")
+
+def test_archive_yields_its_audio_members(url, tmp_path):
+    archive = zip_of(tmp_path, {"calls/a.wav": b"aaa", "notes.txt": b"skip", "b.mp3": b"bb"})
+    extracted = extract_archive(archive, max_files=10)
+    assert sorted(upload.filename for upload in extracted) == ["a.wav", "b.mp3"]
+    assert all(open(upload.file_path, "rb").read() in (b"aaa", b"bb") for upload in extracted)
+    assert not (tmp_path / "batch.zip").exists()
+
+def test_archive_limits_are_enforced(url, tmp_path):
+    archive = zip_of(tmp_path, {f"{i}.wav": b"x" for i in range(3)})
+    with pytest.raises(HTTPException) as refused:
+        extract_archive(archive, max_files=2)
+    assert refused.value.status_code == 400
+
+    archive = zip_of(tmp_path, {"big.wav": b"x" * 100})
+    with pytest.raises(HTTPException) as refused:
+        extract_archive(archive, max_files=10, max_size=10)
+    assert refused.value.status_code == 413
+
+    path = tmp_path / "broken.zip"
+    path.write_bytes(b"not a zip")
+    with pytest.raises(HTTPException) as refused:
+        extract_archive(SavedUpload("x", "broken.zip", "application/zip", str(path), 9, ""), max_files=10)
+    assert refused.value.status_code == 400
+    # Nothing is left behind
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["batches.db"]
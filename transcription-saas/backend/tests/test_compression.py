@@ -0,0 +1,19 @@
+from sqlalchemy.dialects import sqlite
+
+from compression import TRANSCRIPT_COMPRESSION_MIN_BYTES, ZLIB_HEADER, CompressedText, decompress_text
+
+def stored(text: str):
+    return CompressedText().process_bind_param(text, sqlite.dialect())
+
+def test_threshold_counts_encoded_bytes():
+    # Two bytes per character in UTF-8: over the threshold in bytes only
+    text = "é" * (TRANSCRIPT_COMPRESSION_MIN_BYTES // 2 + 1)
+    assert len(text) < TRANSCRIPT_COMPRESSION_MIN_BYTES
+    value = stored(text)
+    assert value.startswith(ZLIB_HEADER)
+    assert decompress_text(value) == text
+
+def test_short_text_is_stored_as_is():
+    text = "a" * (TRANSCRIPT_COMPRESSION_MIN_BYTES - 1)
+    assert stored(text) == text
+    assert decompress_text(stored(text + "a")) == text + "a"
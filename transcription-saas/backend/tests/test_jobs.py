@@ -0,0 +1,62 @@
+import asyncio
+import threading
+
+import pytest
+
+from jobs import JobQueue
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+class Recorder:
+    def __init__(self, stale=()):
+        self.stale = list(stale)
+        self.started = []
+        self.ran = []
+        self.release = threading.Event()
+
+    def recover(self, limit, stale_only):
+        # A job's claim makes it fresh again, as run_transcription_job does
+        stale = [job_id for job_id in self.stale if job_id not in self.started]
+        return stale[:limit] if stale_only else []
+
+    def handle(self, job_id):
+        self.started.append(job_id)
+        self.release.wait(5)
+        self.ran.append(job_id)
+
+@pytest.mark.anyio
+async def test_sweep_queues_stale_jobs_once():
+    recorder = Recorder(stale=["a", "b"])
+    queue = JobQueue(recorder.handle, concurrency=1, maxsize=10, recover=recorder.recover)
+    await queue.start()
+    try:
+        assert await queue.sweep() == 2
+        # Queued or running here already: not queued a second time
+        assert await queue.sweep() == 0
+        recorder.release.set()
+        await asyncio.wait_for(queue._queue.join(), 5)
+        assert sorted(recorder.ran) == ["a", "b"]
+    finally:
+        await queue.stop()
+
+@pytest.mark.anyio
+async def test_sweep_takes_no_more_than_the_queue_holds():
+    recorder = Recorder(stale=["a", "b", "c"])
+    queue = JobQueue(recorder.handle, concurrency=1, maxsize=2, recover=recorder.recover)
+    await queue.start()
+    try:
+        assert await queue.sweep() == 2
+        recorder.release.set()
+        await asyncio.wait_for(queue._queue.join(), 5)
+    finally:
+        await queue.stop()
+
+@pytest.mark.anyio
+async def test_stopped_queue_does_not_sweep():
+    recorder = Recorder(stale=["a"])
+    queue = JobQueue(recorder.handle, concurrency=1, maxsize=10, recover=recorder.recover)
+    await queue.start()
+    await queue.stop()
+    assert await queue.sweep() == 0
@@ -0,0 +1,37 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from leases import release_lease, take_lease
+from models import Lease
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[Lease.__table__])
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+def test_lease_is_held_by_one_holder_at_a_time(db):
+    assert take_lease(db, "consumer", "a", ttl=30)
+    assert not take_lease(db, "consumer", "b", ttl=30)
+    # The holder renews it
+    assert take_lease(db, "consumer", "a", ttl=30)
+    assert db.get(Lease, "consumer").holder == "a"
+
+def test_expired_lease_can_be_taken_over(db):
+    assert take_lease(db, "consumer", "a", ttl=0.01)
+    time.sleep(0.02)
+    assert take_lease(db, "consumer", "b", ttl=30)
+    assert not take_lease(db, "consumer", "a", ttl=30)
+
+def test_released_lease_is_free_at_once(db):
+    assert take_lease(db, "consumer", "a", ttl=30)
+    release_lease(db, "consumer", "b")  # not the holder: no effect
+    assert not take_lease(db, "consumer", "b", ttl=30)
+    release_lease(db, "consumer", "a")
+    assert take_lease(db, "consumer", "b", ttl=30)
@@ -0,0 +1,97 @@
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from database import Base
+from metering import (
+    DEFAULT_MONTHLY_LIMIT, create_default_subscription, new_default_subscription,
+    release_usage, reserve_minutes, settle_usage
+)
+from models import User
+from subscription_models import Subscription
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def db(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/metering.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        session.add(User(id=1, email="payer@example.com", hashed_password="x"))
+        await session.commit()
+        yield session
+    await engine.dispose()
+
+async def counter(db: AsyncSession):
+    subscription = await db.scalar(select(Subscription).where(Subscription.user_id == 1))
+    await db.refresh(subscription)
+    return subscription.monthly_transcription_used, subscription.usage_period
+
+@pytest.mark.anyio
+async def test_first_reservation_creates_the_default_plan(db):
+    assert await reserve_minutes(db, 1, 10, "2026-10")
+    await db.commit()
+    assert await counter(db) == (10, "2026-10")
+
+@pytest.mark.anyio
+async def test_reservation_stops_at_the_plan_limit(db):
+    assert await reserve_minutes(db, 1, DEFAULT_MONTHLY_LIMIT - 1, "2026-10")
+    assert await reserve_minutes(db, 1, 1, "2026-10")
+    assert not await reserve_minutes(db, 1, 1, "2026-10")
+    await db.commit()
+    assert await counter(db) == (DEFAULT_MONTHLY_LIMIT, "2026-10")
+    # A new month starts from zero
+    assert await reserve_minutes(db, 1, 5, "2026-11")
+    await db.commit()
+    assert await counter(db) == (5, "2026-11")
+
+@pytest.mark.anyio
+async def test_default_plan_insert_tolerates_a_concurrent_one(db, monkeypatch):
+    # Another request inserted the default row after this one looked for it
+    db.add(new_default_subscription(1))
+    await db.commit()
+    real_scalar = db.scalar
+
+    async def scalar_missing_once(statement, *args, **kwargs):
+        monkeypatch.setattr(db, "scalar", real_scalar)
+        return None
+
+    monkeypatch.setattr(db, "scalar", scalar_missing_once)
+    assert await create_default_subscription(db, 1) is None
+    # Only the savepoint was rolled back; the transaction goes on
+    assert await reserve_minutes(db, 1, 3, "2026-10")
+    await db.commit()
+    assert await db.scalar(select(func.count()).select_from(Subscription)) == 1
+    assert await counter(db) == (3, "2026-10")
+
+@pytest.mark.anyio
+async def test_one_subscription_row_per_user(db):
+    db.add(new_default_subscription(1))
+    await db.commit()
+    db.add(new_default_subscription(1))
+    with pytest.raises(IntegrityError):
+        await db.commit()
+
+@pytest.mark.anyio
+async def test_old_reservations_leave_a_new_month_alone(db):
+    assert await reserve_minutes(db, 1, 10, "2026-09")
+    assert await reserve_minutes(db, 1, 10, "2026-09")
+    await db.commit()
+    # The month turns; the first upload of October resets the counter
+    assert await reserve_minutes(db, 1, 4, "2026-10")
+    await db.commit()
+
+    # September's jobs finish or fail after the boundary
+    await release_usage(db, 1, 10, "2026-09")
+    await db.run_sync(settle_usage, 1, 1, 10, 3, "2026-09")
+    await db.commit()
+    assert await counter(db) == (4, "2026-10")
+
+    # October's own reservation is still corrected
+    await release_usage(db, 1, 4, "2026-10")
+    await db.commit()
+    assert await counter(db) == (0, "2026-10")
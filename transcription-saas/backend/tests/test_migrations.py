@@ -0,0 +1,163 @@
+import hashlib
+import os
+import subprocess
+import sys
+
+import sqlalchemy as sa
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def baseline_metadata() -> sa.MetaData:
+    """The tables the original main.py created with create_all"""
+    metadata = sa.MetaData()
+    sa.Table(
+        "users", metadata,
+        sa.Column("id", sa.Integer, primary_key=True, index=True),
+        sa.Column("email", sa.String, unique=True, index=True, nullable=False),
+        sa.Column("hashed_password", sa.String, nullable=False),
+        sa.Column("full_name", sa.String),
+        sa.Column("is_active", sa.Boolean),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    sa.Table(
+        "transcriptions", metadata,
+        sa.Column("id", sa.Integer, primary_key=True, index=True),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("filename", sa.String, nullable=False),
+        sa.Column("transcription_text", sa.Text, nullable=False),
+        sa.Column("file_size", sa.Integer, nullable=False),
+        sa.Column("duration", sa.Float),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    sa.Table(
+        "api_keys", metadata,
+        sa.Column("id", sa.Integer, primary_key=True, index=True),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("name", sa.String, nullable=False),
+        sa.Column("key", sa.String, unique=True, index=True, nullable=False),
+        sa.Column("is_active", sa.Boolean),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    sa.Table(
+        "subscriptions", metadata,
+        sa.Column("id", sa.Integer, primary_key=True, index=True),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("stripe_customer_id", sa.String),
+        sa.Column("stripe_subscription_id", sa.String),
+        sa.Column("plan_name", sa.String, nullable=False),
+        sa.Column("status", sa.String, nullable=False),
+        sa.Column("current_period_start", sa.DateTime(timezone=True)),
+        sa.Column("current_period_end", sa.DateTime(timezone=True)),
+        sa.Column("cancel_at_period_end", sa.Boolean),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("monthly_transcription_limit", sa.Integer),
+        sa.Column("monthly_transcription_used", sa.Integer),
+    )
+    sa.Table(
+        "usage", metadata,
+        sa.Column("id", sa.Integer, primary_key=True, index=True),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("transcription_id", sa.Integer, sa.ForeignKey("transcriptions.id"), nullable=False),
+        sa.Column("duration_minutes", sa.Float, nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    return metadata
+
+def migrate(url: str):
+    env = dict(os.environ, DATABASE_URL=url)
+    result = subprocess.run(
+        [sys.executable, "migrate.py"], cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+
+def schema(engine) -> dict:
+    inspector = sa.inspect(engine)
+    return {
+        table: (
+            {column["name"] for column in inspector.get_columns(table)},
+            {index["name"] for index in inspector.get_indexes(table)},
+        )
+        for table in inspector.get_table_names()
+        if not table.startswith("transcriptions_fts")
+    }
+
+def test_fresh_database_upgrades_to_head(tmp_path):
+    url = f"sqlite:///{tmp_path}/fresh.db"
+    migrate(url)
+    tables = set(sa.inspect(sa.create_engine(url)).get_table_names())
+    assert {"users", "transcription_jobs", "api_keys", "usage_periods", "webhook_events", "leases"} <= tables
+
+def test_baseline_database_upgrades_to_the_same_schema(tmp_path):
+    fresh_url = f"sqlite:///{tmp_path}/fresh.db"
+    migrate(fresh_url)
+
+    url = f"sqlite:///{tmp_path}/baseline.db"
+    engine = sa.create_engine(url)
+    metadata = baseline_metadata()
+    metadata.create_all(engine)
+    key = "tsk_0123456789abcdef0123456789abcdef"
+    with engine.begin() as conn:
+        conn.execute(metadata.tables["users"].insert().values(id=1, email="old@example.com", hashed_password="x"))
+        conn.execute(metadata.tables["transcriptions"].insert().values(
+            user_id=1, filename="old.wav", transcription_text="kept", file_size=10
+        ))
+        conn.execute(metadata.tables["api_keys"].insert().values(user_id=1, name="ci", key=key, is_active=True))
+        conn.execute(metadata.tables["subscriptions"].insert().values(
+            user_id=1, plan_name="starter", status="active",
+            monthly_transcription_limit=60, monthly_transcription_used=12
+        ))
+        # A second default row from two concurrent first uploads
+        conn.execute(metadata.tables["subscriptions"].insert().values(
+            user_id=1, plan_name="starter", status="active",
+            monthly_transcription_limit=60, monthly_transcription_used=3
+        ))
+
+    migrate(url)
+
+    assert schema(engine) == schema(sa.create_engine(fresh_url))
+    with engine.connect() as conn:
+        row = conn.execute(sa.text("SELECT prefix, key_hash FROM api_keys")).one()
+        assert row.prefix == key[:16]
+        assert row.key_hash == hashlib.sha256(key.encode()).hexdigest()
+        assert conn.execute(sa.text("SELECT transcription_text FROM transcriptions")).scalar() == "kept"
+        # The existing transcription is searchable and counted
+        assert conn.execute(sa.text(
+            "SELECT rowid FROM transcriptions_fts WHERE transcriptions_fts MATCH 'kept'"
+        )).scalar() == 1
+        assert conn.execute(sa.text("SELECT transcription_count FROM transcription_stats")).scalar() == 1
+        # Duplicate subscriptions are merged, keeping the higher usage
+        assert conn.execute(sa.text("SELECT monthly_transcription_used FROM subscriptions")).all() == [(12,)]
+
+def test_database_from_a_later_create_all_upgrades(tmp_path):
+    """A database last started by a version that had transcription_jobs,
+    but without the columns added to it afterwards"""
+    url = f"sqlite:///{tmp_path}/later.db"
+    engine = sa.create_engine(url)
+    metadata = baseline_metadata()
+    sa.Table(
+        "transcription_jobs", metadata,
+        sa.Column("id", sa.String, primary_key=True, index=True),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False, index=True),
+        sa.Column("filename", sa.String, nullable=False),
+        sa.Column("file_path", sa.String, nullable=False),
+        sa.Column("file_size", sa.Integer, nullable=False),
+        sa.Column("status", sa.String, nullable=False, index=True),
+        sa.Column("error", sa.Text),
+        sa.Column("transcription_id", sa.Integer, sa.ForeignKey("transcriptions.id")),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("started_at", sa.DateTime(timezone=True)),
+        sa.Column("finished_at", sa.DateTime(timezone=True)),
+    )
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(metadata.tables["users"].insert().values(id=1, email="old@example.com", hashed_password="x"))
+        conn.execute(metadata.tables["transcription_jobs"].insert().values(
+            id="job1", user_id=1, filename="a.wav", file_path="/tmp/a.wav", file_size=1, status="completed"
+        ))
+
+    migrate(url)
+
+    with engine.connect() as conn:
+        job = conn.execute(sa.text("SELECT reserved_minutes, batch_id FROM transcription_jobs")).one()
+        assert job.reserved_minutes == 0 and job.batch_id is None
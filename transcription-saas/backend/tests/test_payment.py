@@ -0,0 +1,122 @@
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+import payment
+from database import Base
+from models import User
+from payment import PaymentService, StripeAPIError
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(payment, "STRIPE_RETRY_BACKOFF", 0.0)
+    monkeypatch.setattr(payment, "STRIPE_MAX_RETRIES", 3)
+
+class FakeStripe:
+    """An httpx transport answering from a queue of canned responses and
+    recording every request it is sent"""
+
+    def __init__(self, *responses: httpx.Response):
+        self.responses = list(responses)
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if not self.responses:
+            raise AssertionError(f"unexpected request {request.method} {request.url.path}")
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+def service_for(stripe: FakeStripe) -> PaymentService:
+    service = PaymentService()
+    service._client = httpx.AsyncClient(base_url="https://stripe.test", transport=httpx.MockTransport(stripe))
+    return service
+
+def stripe_error(status_code: int, message: str = "boom", **headers) -> httpx.Response:
+    return httpx.Response(status_code, json={"error": {"message": message}}, headers=headers)
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("status_code", [429, 500, 503])
+async def test_retryable_status_is_retried_with_the_same_idempotency_key(status_code):
+    stripe = FakeStripe(stripe_error(status_code), stripe_error(status_code), httpx.Response(200, json={"id": "cs_1"}))
+    result = await service_for(stripe)._request("POST", "/v1/checkout/sessions", {"customer": "cus_1"})
+
+    assert result == {"id": "cs_1"}
+    assert len(stripe.requests) == 3
+    keys = {request.headers["Idempotency-Key"] for request in stripe.requests}
+    assert len(keys) == 1
+    assert all(parse_qs(request.content.decode()) == {"customer": ["cus_1"]} for request in stripe.requests)
+
+@pytest.mark.anyio
+async def test_client_error_is_not_retried():
+    stripe = FakeStripe(stripe_error(400, "No such price"))
+    with pytest.raises(StripeAPIError) as error:
+        await service_for(stripe)._request("POST", "/v1/subscriptions", {"customer": "cus_1"})
+
+    assert error.value.status_code == 400
+    assert str(error.value) == "No such price"
+    assert len(stripe.requests) == 1
+
+@pytest.mark.anyio
+async def test_stripe_should_retry_header_overrides_status():
+    stripe = FakeStripe(stripe_error(500, **{"Stripe-Should-Retry": "false"}))
+    with pytest.raises(StripeAPIError):
+        await service_for(stripe)._request("POST", "/v1/customers")
+    assert len(stripe.requests) == 1
+
+@pytest.mark.anyio
+async def test_retries_are_bounded():
+    stripe = FakeStripe(*(stripe_error(503) for _ in range(4)))
+    with pytest.raises(StripeAPIError) as error:
+        await service_for(stripe)._request("GET", "/v1/subscriptions/sub_1")
+    assert error.value.status_code == 503
+    assert len(stripe.requests) == 4
+
+@pytest.mark.anyio
+async def test_timeout_is_retried_then_reported():
+    timeout = httpx.ReadTimeout("timed out")
+    stripe = FakeStripe(timeout, httpx.Response(200, json={"id": "sub_1", "status": "canceled"}))
+    assert await service_for(stripe).cancel_subscription("sub_1") == {"status": "canceled"}
+
+    stripe = FakeStripe(*(httpx.ConnectTimeout("timed out") for _ in range(4)))
+    with pytest.raises(HTTPException) as error:
+        await service_for(stripe).cancel_subscription("sub_1")
+    assert error.value.status_code == 400
+    assert "Could not reach Stripe" in error.value.detail
+
+@pytest.fixture
+async def db():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        yield session
+    await engine.dispose()
+
+@pytest.mark.anyio
+async def test_customer_is_created_once_and_then_served_from_cache(db):
+    user = User(email="buyer@example.com", hashed_password="x", full_name="Buyer")
+    db.add(user)
+    await db.commit()
+
+    stripe = FakeStripe(httpx.Response(200, json={"id": "cus_1"}))
+    service = service_for(stripe)
+    assert await service.get_customer_id(user, db, "professional") == "cus_1"
+    assert [request.url.path for request in stripe.requests] == ["/v1/customers"]
+    assert stripe.requests[0].headers["Idempotency-Key"] == f"customer-{user.id}"
+
+    statements = []
+    event.listen(db.bind.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    assert await service.get_customer_id(user, db, "professional") == "cus_1"
+    assert len(stripe.requests) == 1
+    assert statements == []
@@ -0,0 +1,39 @@
+import pytest
+
+from models import TranscriptionJob
+from progress import JobEventResponse, job_events
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+SCOPE = {"type": "http", "method": "GET", "path": "/jobs/j1/events", "headers": []}
+
+def job() -> TranscriptionJob:
+    return TranscriptionJob(id="j1", user_id=1, status="queued")
+
+async def disconnected():
+    return {"type": "http.disconnect"}
+
+@pytest.mark.anyio
+async def test_subscription_is_released_when_the_client_left_before_the_stream():
+    response = JobEventResponse(job(), job_events.subscribe("j1"))
+    assert job_events.subscriber_count == 1
+
+    async def send(message):
+        raise OSError("connection reset")
+
+    with pytest.raises(OSError):
+        await response(SCOPE, disconnected, send)
+    assert job_events.subscriber_count == 0
+
+@pytest.mark.anyio
+async def test_subscription_is_released_when_the_client_disconnects():
+    response = JobEventResponse(job(), job_events.subscribe("j1"))
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    await response(SCOPE, disconnected, send)
+    assert job_events.subscriber_count == 0
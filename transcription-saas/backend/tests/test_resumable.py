@@ -0,0 +1,142 @@
+import asyncio
+import base64
+import hashlib
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from database import Base
+from models import UploadSession, User
+from resumable import UPLOAD_FINALIZING, append_chunk, parse_checksum, preallocate
+
+SIZE = 12
+
+class Body:
+    """Stands in for a Request: yields the chunk, optionally pausing
+    half-way until ``resume`` is set"""
+
+    def __init__(self, data: bytes, resume: asyncio.Event = None):
+        self.data = data
+        self.resume = resume
+        self.started = asyncio.Event()
+
+    async def stream(self):
+        half = len(self.data) // 2
+        yield self.data[:half]
+        self.started.set()
+        if self.resume:
+            await self.resume.wait()
+        yield self.data[half:]
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/uploads.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    file_path = str(tmp_path / "upload.wav")
+    preallocate(file_path, SIZE)
+    async with AsyncSession(engine) as db:
+        db.add(User(id=1, email="uploader@example.com", hashed_password="x"))
+        db.add(UploadSession(
+            id="u1", user_id=1, filename="a.wav", content_type="audio/wav", file_path=file_path,
+            size=SIZE, bytes_received=0, status="uploading",
+            expires_at=datetime.utcnow() + timedelta(hours=1)
+        ))
+        await db.commit()
+    yield engine
+    await engine.dispose()
+
+def session(engine) -> AsyncSession:
+    return AsyncSession(engine, expire_on_commit=False)
+
+async def load(db: AsyncSession) -> UploadSession:
+    return await db.get(UploadSession, "u1", populate_existing=True)
+
+def contents(upload: UploadSession) -> bytes:
+    with open(upload.file_path, "rb") as f:
+        return f.read()
+
+@pytest.mark.anyio
+async def test_chunks_are_written_at_the_offset(engine):
+    async with session(engine) as db:
+        upload = await append_chunk(db, Body(b"abcdef"), await load(db), 0)
+        assert upload.bytes_received == 6
+        upload = await append_chunk(db, Body(b"ghijkl"), await load(db), 6)
+        assert (await load(db)).bytes_received == SIZE
+        assert contents(upload) == b"abcdefghijkl"
+
+@pytest.mark.anyio
+async def test_wrong_offset_is_refused_with_the_current_one(engine):
+    async with session(engine) as db:
+        await append_chunk(db, Body(b"abcdef"), await load(db), 0)
+        with pytest.raises(HTTPException) as refused:
+            await append_chunk(db, Body(b"xxxxxx"), await load(db), 0)
+        assert refused.value.status_code == 409
+        assert refused.value.headers["Upload-Offset"] == "6"
+        assert contents(await load(db)) == b"abcdef" + bytes(6)
+
+@pytest.mark.anyio
+async def test_stale_chunk_does_not_overwrite_a_newer_one(engine):
+    # Both requests load the upload at offset 0; the second one only gets
+    # the file lock after the first has committed
+    async with session(engine) as first, session(engine) as second:
+        stale = await load(second)
+        await append_chunk(first, Body(b"abcdef"), await load(first), 0)
+        with pytest.raises(HTTPException) as refused:
+            await append_chunk(second, Body(b"xxxxxx"), stale, 0)
+        assert refused.value.status_code == 409
+        assert refused.value.headers["Upload-Offset"] == "6"
+        assert contents(stale) == b"abcdef" + bytes(6)
+        assert (await load(first)).bytes_received == 6
+
+@pytest.mark.anyio
+async def test_concurrent_chunk_is_refused_while_one_is_written(engine):
+    resume = asyncio.Event()
+    body = Body(b"abcdef", resume)
+    async with session(engine) as first, session(engine) as second:
+        writing = asyncio.ensure_future(append_chunk(first, body, await load(first), 0))
+        await body.started.wait()
+        with pytest.raises(HTTPException) as refused:
+            await append_chunk(second, Body(b"xxxxxx"), await load(second), 0)
+        assert refused.value.status_code == 409
+        resume.set()
+        upload = await writing
+        assert upload.bytes_received == 6
+        assert contents(upload) == b"abcdef" + bytes(6)
+
+@pytest.mark.anyio
+async def test_chunk_for_an_upload_finalized_meanwhile_is_refused(engine):
+    async with session(engine) as first, session(engine) as second:
+        stale = await load(second)
+        await first.execute(update(UploadSession).values(status=UPLOAD_FINALIZING))
+        await first.commit()
+        with pytest.raises(HTTPException) as refused:
+            await append_chunk(second, Body(b"abcdef"), stale, 0)
+        assert refused.value.status_code == 409
+        assert contents(stale) == bytes(SIZE)
+
+@pytest.mark.anyio
+async def test_checksum_mismatch_keeps_the_offset(engine):
+    async with session(engine) as db:
+        good = parse_checksum("sha256 " + base64.b64encode(hashlib.sha256(b"abcdef").digest()).decode())
+        with pytest.raises(HTTPException) as refused:
+            await append_chunk(db, Body(b"abcdeX"), await load(db), 0, good)
+        assert refused.value.status_code == 400
+        assert (await load(db)).bytes_received == 0
+        upload = await append_chunk(db, Body(b"abcdef"), await load(db), 0, good)
+        assert upload.bytes_received == 6
+
+@pytest.mark.anyio
+async def test_chunk_past_the_end_is_refused(engine):
+    async with session(engine) as db:
+        with pytest.raises(HTTPException) as refused:
+            await append_chunk(db, Body(b"x" * (SIZE + 1)), await load(db), 0)
+        assert refused.value.status_code == 413
+        assert (await load(db)).bytes_received == 0
@@ -0,0 +1,106 @@
+import re
+from datetime import datetime
+
+import orjson
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from compression import register_sqlite_functions
+from database import Base
+from models import Transcription, User
+from schemas import TranscriptionSearchHit, TranscriptionSummary
+from search import ensure_search_index, search_transcriptions
+from serialization import TrustedResponse, trusted
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def db(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/search.db")
+    event.listen(engine.sync_engine, "connect", lambda conn, _: register_sqlite_functions(conn))
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(ensure_search_index)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        yield session
+    await engine.dispose()
+
+@pytest.mark.anyio
+async def test_search_hits_use_the_api_timestamp_format(db):
+    user = User(email="reader@example.com", hashed_password="x")
+    db.add(user)
+    await db.flush()
+    transcription = Transcription(
+        user_id=user.id, filename="standup.wav", file_size=1024, duration=3.0,
+        transcription_text="the quarterly roadmap was discussed at length"
+    )
+    db.add(transcription)
+    await db.commit()
+    await db.refresh(transcription)
+
+    hits = await search_transcriptions(db, user.id, "roadmap", limit=10, offset=0)
+    assert [hit.id for hit in hits] == [transcription.id]
+    assert isinstance(hits[0].created_at, datetime)
+    assert "<mark>roadmap</mark>" in hits[0].snippet
+
+    # Same representation as the listing endpoints
+    rendered = orjson.loads(TrustedResponse(trusted(TranscriptionSearchHit, hits[0])).body)
+    listed = orjson.loads(TrustedResponse(trusted(TranscriptionSummary, transcription, text_preview="")).body)
+    assert re.fullmatch(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d", rendered["created_at"])
+    assert rendered["created_at"] == listed["created_at"]
+
+async def add_transcriptions(db, texts_by_user):
+    ids = {}
+    for email, texts in texts_by_user.items():
+        user = User(email=email, hashed_password="x")
+        db.add(user)
+        await db.flush()
+        ids[email] = user.id
+        for i, body in enumerate(texts):
+            db.add(Transcription(
+                user_id=user.id, filename=f"clip{i}.wav", file_size=1, transcription_text=body
+            ))
+    await db.commit()
+    return ids
+
+@pytest.mark.anyio
+async def test_search_only_sees_the_callers_transcriptions(db):
+    users = await add_transcriptions(db, {
+        "a@example.com": ["budget review notes"],
+        "b@example.com": ["budget planning", "budget forecast"],
+    })
+    hits = await search_transcriptions(db, users["a@example.com"], "budget", limit=10, offset=0)
+    assert [hit.snippet for hit in hits] == ["<mark>budget</mark> review notes"]
+    hits = await search_transcriptions(db, users["b@example.com"], "budget", limit=10, offset=0)
+    assert len(hits) == 2
+
+    # The owner token is not searchable text
+    owner = f"u{users['a@example.com']}"
+    assert await search_transcriptions(db, users["a@example.com"], owner, limit=10, offset=0) == []
+
+@pytest.mark.anyio
+async def test_index_without_the_owner_is_rebuilt(db):
+    users = await add_transcriptions(db, {"a@example.com": ["kept from before"]})
+    # The index as 0002 first built it
+    for statement in [
+        "DROP TRIGGER transcriptions_fts_insert",
+        "DROP TRIGGER transcriptions_fts_delete",
+        "DROP TRIGGER transcriptions_fts_update",
+        "DROP TABLE transcriptions_fts",
+        "DROP VIEW transcriptions_fts_content",
+        """CREATE VIEW transcriptions_fts_content AS
+           SELECT id, transcript_text(transcription_text) AS transcription_text, filename FROM transcriptions""",
+        """CREATE VIRTUAL TABLE transcriptions_fts USING fts5(
+           transcription_text, filename, content='transcriptions_fts_content', content_rowid='id')""",
+        "INSERT INTO transcriptions_fts(transcriptions_fts) VALUES ('rebuild')",
+    ]:
+        await db.execute(text(statement))
+    await db.commit()
+
+    await (await db.connection()).run_sync(ensure_search_index)
+    await db.commit()
+    hits = await search_transcriptions(db, users["a@example.com"], "kept", limit=10, offset=0)
+    assert len(hits) == 1
@@ -0,0 +1,10 @@
+import pytest
+
+from speech import SpeechBackend
+
+def test_backend_without_transcribe_fails_on_creation():
+    class Incomplete(SpeechBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,354 @@
+import hashlib
+import mimetypes
+import os
+import time
+import uuid
+import zipfile
+from collections import deque
+from typing import Any, Deque, List, Optional, Tuple
+
+import aiofiles
+from decouple import config
+from fastapi import HTTPException, Request, status
+from multipart.multipart import MultipartParser, parse_options_header
+
+from metrics import transcribe_stage_seconds
+
+# Configuration
+UPLOAD_DIR = config("UPLOAD_DIR", default="/tmp/uploads")
+MAX_UPLOAD_SIZE = config("MAX_UPLOAD_SIZE", default=25 * 1024 * 1024, cast=int)  # bytes
+UPLOAD_CHUNK_SIZE = config("UPLOAD_CHUNK_SIZE", default=1024 * 1024, cast=int)  # bytes
+MAX_ARCHIVE_SIZE = config("MAX_ARCHIVE_SIZE", default=500 * 1024 * 1024, cast=int)  # bytes, zip batches
+
+ARCHIVE_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed")
+
+# Slack for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+# OpenAPI description of the multipart body, since the handlers read the
+# request stream themselves instead of declaring an UploadFile parameter
+AUDIO_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+BATCH_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "files": {"type": "array", "items": {"type": "string", "format": "binary"}},
+                        "archive": {"type": "string", "format": "binary", "description": "zip of audio files"},
+                    },
+                }
+            }
+        },
+    }
+}
+
+def _too_large(max_size: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File must be smaller than {max_size // (1024 * 1024)}MB"
+    )
+
+class SavedUpload:
+    """An uploaded file that has been streamed into UPLOAD_DIR"""
+
+    def __init__(self, file_id: str, filename: str, content_type: str, file_path: str,
+                 file_size: int, content_hash: str):
+        self.file_id = file_id
+        self.filename = filename
+        self.content_type = content_type
+        self.file_path = file_path
+        self.file_size = file_size
+        self.content_hash = content_hash  # SHA-256 hex of the file bytes
+
+    @property
+    def is_archive(self) -> bool:
+        return self.content_type in ARCHIVE_CONTENT_TYPES
+
+    def discard(self):
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
+
+def new_upload_path(filename: str) -> Tuple[str, str]:
+    """Pick a fresh id and path in UPLOAD_DIR, keeping the client's extension"""
+    file_id = uuid.uuid4().hex
+    # Only the extension of the last path component, and only a plain one;
+    # client names must never steer the path
+    file_extension = os.path.splitext(os.path.basename(filename))[1][1:]
+    if not (file_extension.isascii() and file_extension.isalnum()):
+        file_extension = 'wav'
+    return file_id, f"{UPLOAD_DIR}/{file_id}.{file_extension}"
+
+def check_content_length(request: Request, max_size: int = MAX_UPLOAD_SIZE):
+    """Reject bodies that announce themselves as too large before reading them"""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_size + MULTIPART_OVERHEAD:
+        raise _too_large(max_size)
+
+class _PartWriter:
+    """Buffers one file part into fixed-size chunks and writes them to disk,
+    hashing the bytes on the way through"""
+
+    def __init__(self, filename: str, content_type: str, max_size: int, chunk_size: int):
+        self.file_id, self.file_path = new_upload_path(filename)
+        self.filename = filename
+        self.content_type = content_type
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._buffer = bytearray()
+        self._file = None
+        self.write_seconds = 0.0
+
+    async def open(self):
+        self._file = await aiofiles.open(self.file_path, 'wb')
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise _too_large(self.max_size)
+        self._hash.update(data)
+        self._buffer += data
+        if len(self._buffer) >= self.chunk_size:
+            await self._flush()
+
+    async def _flush(self):
+        if self._buffer:
+            started = time.perf_counter()
+            await self._file.write(bytes(self._buffer))
+            self.write_seconds += time.perf_counter() - started
+            self._buffer.clear()
+
+    async def close(self) -> SavedUpload:
+        await self._flush()
+        await self._file.close()
+        transcribe_stage_seconds.observe(self.write_seconds, stage="disk_write")
+        return SavedUpload(self.file_id, self.filename, self.content_type, self.file_path,
+                           self.size, self._hash.hexdigest())
+
+    async def abort(self):
+        if self._file is not None:
+            await self._file.close()
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
+
+async def receive_audio_uploads(
+    request: Request,
+    field_name: str = "file",
+    max_files: int = 1,
+    max_size: int = MAX_UPLOAD_SIZE,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+    archive_field: Optional[str] = None,
+    max_archive_size: int = MAX_ARCHIVE_SIZE,
+) -> List[SavedUpload]:
+    """Stream the audio parts of a multipart request straight into UPLOAD_DIR.
+
+    The body is parsed incrementally as it arrives, so memory per request is
+    bounded by ``chunk_size`` whatever the file size. Content type and size
+    limits are checked as soon as the part headers and bytes come in, and
+    the request is rejected without reading the rest of the body. With an
+    ``archive_field``, zip parts under that name are saved as they are and
+    counted as one file; see ``extract_archive``.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Request must be multipart/form-data"
+        )
+    check_content_length(request, max(max_size * max_files, max_archive_size if archive_field else 0))
+
+    # The parser callbacks are synchronous, so they only record events and
+    # the async writes happen between chunks of the request stream
+    events: Deque[Tuple[str, Any]] = deque()
+    header_field = bytearray()
+    header_value = bytearray()
+    headers = {}
+
+    def on_part_begin():
+        headers.clear()
+
+    def on_part_data(data: bytes, start: int, end: int):
+        events.append(("data", data[start:end]))
+
+    def on_part_end():
+        events.append(("end", None))
+
+    def on_header_field(data: bytes, start: int, end: int):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data: bytes, start: int, end: int):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        events.append(("headers", dict(headers)))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+    })
+
+    uploads: List[SavedUpload] = []
+    writer: Optional[_PartWriter] = None
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            while events:
+                event, payload = events.popleft()
+                if event == "headers":
+                    writer = await _start_part(
+                        payload, field_name, max_size, chunk_size, archive_field, max_archive_size
+                    )
+                    if writer is not None and len(uploads) >= max_files:
+                        await writer.abort()
+                        writer = None
+                        raise HTTPException(
+                            status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"At most {max_files} file(s) may be uploaded per request"
+                        )
+                elif event == "data" and writer is not None:
+                    await writer.write(payload)
+                elif event == "end" and writer is not None:
+                    uploads.append(await writer.close())
+                    writer = None
+        parser.finalize()
+    except BaseException:
+        if writer is not None:
+            await writer.abort()
+        for upload in uploads:
+            upload.discard()
+        raise
+
+    if not uploads:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Missing file field '{field_name}'"
+        )
+    return uploads
+
+async def _start_part(headers: dict, field_name: str, max_size: int, chunk_size: int,
+                      archive_field: Optional[str] = None, max_archive_size: int = MAX_ARCHIVE_SIZE) -> Optional[_PartWriter]:
+    _, disposition = parse_options_header(headers.get(b"content-disposition", b""))
+    name = disposition.get(b"name", b"").decode("latin-1")
+    filename = disposition.get(b"filename")
+    content_type = headers.get(b"content-type", b"").decode("latin-1")
+    if archive_field and name == archive_field and filename is not None:
+        if content_type not in ARCHIVE_CONTENT_TYPES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Archive must be a zip file"
+            )
+        writer = _PartWriter(filename.decode("utf-8", "replace"), content_type, max_archive_size, chunk_size)
+        await writer.open()
+        return writer
+    if name != field_name or filename is None:
+        # Not the audio field; its bytes are parsed and dropped
+        return None
+
+    if not content_type.startswith('audio/'):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File must be an audio file"
+        )
+
+    writer = _PartWriter(filename.decode("utf-8", "replace"), content_type, max_size, chunk_size)
+    await writer.open()
+    return writer
+
+def extract_archive(
+    archive: SavedUpload,
+    max_files: int,
+    max_size: int = MAX_UPLOAD_SIZE,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> List[SavedUpload]:
+    """Unpack the audio members of a saved zip into UPLOAD_DIR and delete
+    the archive. Blocking; run it in a thread.
+
+    Members are decompressed a chunk at a time, so memory stays bounded by
+    ``chunk_size``, and the size limit is enforced on the bytes actually
+    written rather than on the sizes the archive claims. Members whose name
+    doesn't look like audio are skipped; the names are only kept for
+    display, never used as paths.
+    """
+    uploads: List[SavedUpload] = []
+    try:
+        with zipfile.ZipFile(archive.file_path) as zf:
+            for member in zf.infolist():
+                filename = os.path.basename(member.filename)
+                content_type = mimetypes.guess_type(filename)[0] or ""
+                if member.is_dir() or not content_type.startswith("audio/"):
+                    continue
+                if len(uploads) >= max_files:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"At most {max_files} file(s) may be uploaded per request"
+                    )
+                if member.file_size > max_size:
+                    raise _too_large(max_size)
+                uploads.append(_extract_member(zf, member, filename, content_type, max_size, chunk_size))
+    except zipfile.BadZipFile:
+        for upload in uploads:
+            upload.discard()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Archive is not a valid zip file"
+        )
+    except BaseException:
+        for upload in uploads:
+            upload.discard()
+        raise
+    finally:
+        archive.discard()
+    return uploads
+
+def _extract_member(zf: zipfile.ZipFile, member: zipfile.ZipInfo, filename: str, content_type: str,
+                    max_size: int, chunk_size: int) -> SavedUpload:
+    file_id, file_path = new_upload_path(filename)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with zf.open(member) as source, open(file_path, "wb") as target:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise _too_large(max_size)
+                digest.update(chunk)
+                target.write(chunk)
+    except BaseException:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    return SavedUpload(file_id, filename, content_type, file_path, size, digest.hexdigest())
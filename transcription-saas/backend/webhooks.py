@@ -0,0 +1,247 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from decouple import config
+from sqlalchemy import or_, select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from leases import lease_holder, release_lease, take_lease
+from metering import DEFAULT_PLAN_NAME, PLAN_LIMITS
+from subscription_models import Subscription, WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+WEBHOOK_BATCH_SIZE = config("WEBHOOK_BATCH_SIZE", default=100, cast=int)
+WEBHOOK_POLL_INTERVAL = config("WEBHOOK_POLL_INTERVAL", default=5.0, cast=float)  # seconds
+WEBHOOK_MAX_ATTEMPTS = config("WEBHOOK_MAX_ATTEMPTS", default=5, cast=int)
+# Only the worker process holding the consumer lease drains the inbox; it
+# renews the lease before every batch, and another worker takes over once
+# it has gone unrenewed this long. Keep well above WEBHOOK_POLL_INTERVAL.
+WEBHOOK_LEASE_TTL = config("WEBHOOK_LEASE_TTL", default=30.0, cast=float)  # seconds
+# Price id -> plan name, e.g. "price_123:professional,price_456:enterprise";
+# prices can also carry the plan in their metadata or lookup key
+STRIPE_PRICE_PLANS = dict(
+    item.split(":", 1)
+    for item in config("STRIPE_PRICE_PLANS", default="").split(",")
+    if ":" in item
+)
+
+# Inbox states
+EVENT_PENDING = "pending"
+EVENT_PROCESSED = "processed"
+EVENT_FAILED = "failed"
+
+SUBSCRIPTION_EVENTS = {
+    "customer.subscription.created",
+    "customer.subscription.updated",
+    "customer.subscription.deleted",
+}
+
+def _object_id(event) -> Optional[str]:
+    """Stripe subscription an event belongs to; events are applied in order per subscription"""
+    obj = event["data"]["object"]
+    if event["type"] in SUBSCRIPTION_EVENTS:
+        return obj.get("id")
+    return obj.get("subscription")
+
+async def record_webhook_event(db: AsyncSession, event) -> bool:
+    """Persist a verified event to the inbox. Returns False for an event
+    id that was already received (Stripe redelivers on timeouts)."""
+    db.add(WebhookEvent(
+        id=event["id"],
+        type=event["type"],
+        object_id=_object_id(event),
+        payload=json.dumps(event["data"]["object"]),
+        stripe_created=event["created"],
+        status=EVENT_PENDING
+    ))
+    try:
+        await db.commit()
+        return True
+    except IntegrityError:
+        await db.rollback()
+        return False
+
+def _timestamp(value) -> Optional[datetime]:
+    return datetime.fromtimestamp(value, tz=timezone.utc) if value else None
+
+def plan_for_subscription(obj: dict) -> Optional[str]:
+    """Plan name for a Stripe subscription object, from its first price"""
+    items = (obj.get("items") or {}).get("data") or []
+    if not items:
+        return None
+    price = items[0].get("price") or {}
+    for candidate in (
+        STRIPE_PRICE_PLANS.get(price.get("id")),
+        (price.get("metadata") or {}).get("plan"),
+        price.get("lookup_key"),
+    ):
+        if candidate in PLAN_LIMITS:
+            return candidate
+    return None
+
+async def _find_subscription(db: AsyncSession, obj: dict) -> Optional[Subscription]:
+    return await db.scalar(select(Subscription).where(or_(
+        Subscription.stripe_subscription_id == obj["id"],
+        Subscription.stripe_customer_id == obj.get("customer")
+    )).order_by((Subscription.stripe_subscription_id == obj["id"]).desc()).limit(1))
+
+async def apply_webhook_event(db: AsyncSession, event: WebhookEvent):
+    """Apply one inbox event to the local Subscription; runs in the caller's transaction"""
+    if event.type not in SUBSCRIPTION_EVENTS:
+        # Invoice events are recorded only; the subscription events that
+        # accompany them carry the resulting status
+        return
+
+    obj = json.loads(event.payload)
+    subscription = await _find_subscription(db, obj)
+    if subscription is None:
+        logger.warning("Webhook %s: no local subscription for %s", event.id, obj.get("id"))
+        return
+    if subscription.stripe_event_created and subscription.stripe_event_created > event.stripe_created:
+        # A newer event was already applied
+        return
+
+    subscription.stripe_subscription_id = obj["id"]
+    subscription.stripe_event_created = event.stripe_created
+    if event.type == "customer.subscription.deleted":
+        subscription.status = "canceled"
+        subscription.plan_name = DEFAULT_PLAN_NAME
+        subscription.monthly_transcription_limit = PLAN_LIMITS[DEFAULT_PLAN_NAME]
+        return
+
+    subscription.status = obj.get("status", subscription.status)
+    subscription.current_period_start = _timestamp(obj.get("current_period_start"))
+    subscription.current_period_end = _timestamp(obj.get("current_period_end"))
+    subscription.cancel_at_period_end = bool(obj.get("cancel_at_period_end"))
+    plan = plan_for_subscription(obj)
+    if plan:
+        subscription.plan_name = plan
+        subscription.monthly_transcription_limit = PLAN_LIMITS[plan]
+
+class WebhookConsumer:
+    """Drains the webhook inbox in batches on a background task.
+
+    Events are grouped by subscription and applied oldest first. When an
+    event fails, the later events for the same subscription are left
+    pending so they can't overtake it. Each batch is committed once.
+
+    Every worker process starts a consumer, but only the one holding the
+    ``webhook-consumer`` lease drains the inbox; two draining at once could
+    apply an event twice or out of order. The others keep polling for the
+    lease and take over if its holder goes away.
+    """
+
+    LEASE_NAME = "webhook-consumer"
+
+    def __init__(self, batch_size: int, poll_interval: float, max_attempts: int, lease_ttl: float):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lease_ttl = lease_ttl
+        self.holder = lease_holder()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            # Let another worker take over without waiting out the lease
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.run_sync(release_lease, self.LEASE_NAME, self.holder)
+            except Exception:
+                logger.exception("Could not release the webhook consumer lease")
+
+    def notify(self):
+        """Wake the consumer after new events were recorded"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                # Keep draining while full batches go through cleanly
+                while await self.hold_lease() and await self.process_batch() == self.batch_size:
+                    pass
+            except OperationalError as e:
+                logger.warning("Webhook batch rolled back, will retry: %s", e)
+            except Exception:
+                logger.exception("Webhook consumer failed")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def hold_lease(self) -> bool:
+        """Take or renew the consumer lease; False if another worker has it"""
+        async with AsyncSessionLocal() as db:
+            return await db.run_sync(take_lease, self.LEASE_NAME, self.holder, self.lease_ttl)
+
+    async def process_batch(self) -> int:
+        """Apply up to ``batch_size`` pending events; returns how many were
+        settled (processed or given up on). Deferred events wait for the
+        next poll."""
+        async with AsyncSessionLocal() as db:
+            result = await db.scalars(
+                select(WebhookEvent)
+                .where(WebhookEvent.status == EVENT_PENDING)
+                .order_by(WebhookEvent.stripe_created, WebhookEvent.received_at)
+                .limit(self.batch_size)
+            )
+            events = result.all()
+            if not events:
+                return 0
+
+            groups: Dict[Optional[str], List[WebhookEvent]] = OrderedDict()
+            for event in events:
+                groups.setdefault(event.object_id, []).append(event)
+
+            now = datetime.utcnow()
+            settled = 0
+            for group in groups.values():
+                for event in group:
+                    try:
+                        async with db.begin_nested():
+                            await apply_webhook_event(db, event)
+                    except OperationalError:
+                        # Database trouble (locks, lost connection) isn't the
+                        # event's fault; drop the batch and retry it whole
+                        raise
+                    except Exception as e:
+                        event.attempts += 1
+                        event.error = str(e)
+                        if event.attempts >= self.max_attempts:
+                            event.status = EVENT_FAILED
+                            event.processed_at = now
+                            settled += 1
+                            logger.exception("Webhook %s failed permanently", event.id)
+                            continue
+                        logger.warning("Webhook %s failed, will retry: %s", event.id, e)
+                        break  # keep the rest of this subscription's events in order
+                    event.status = EVENT_PROCESSED
+                    event.processed_at = now
+                    settled += 1
+            await db.commit()
+            return settled
+
+webhook_consumer = WebhookConsumer(
+    batch_size=WEBHOOK_BATCH_SIZE,
+    poll_interval=WEBHOOK_POLL_INTERVAL,
+    max_attempts=WEBHOOK_MAX_ATTEMPTS,
+    lease_ttl=WEBHOOK_LEASE_TTL,
+)
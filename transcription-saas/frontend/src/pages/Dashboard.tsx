@@ -14,19 +14,16 @@ const Dashboard: React.FC = () => {
   useEffect(() => {
     const fetchData = async () => {
       try {
-        const transcriptions = await transcriptionService.getTranscriptions(0, 5);
+        const [{ items: transcriptions }, summary] = await Promise.all([
+          transcriptionService.getTranscriptions(5),
+          transcriptionService.getStats(),
+        ]);
         setRecentTranscriptions(transcriptions);
-        
-        // Calculate stats
-        const totalTranscriptions = transcriptions.length;
-        const totalMinutes = transcriptions.reduce((acc, t) => acc + (t.duration || 0), 0);
-        const thisMonth = transcriptions.filter(t => {
-          const date = new Date(t.created_at);
-          const now = new Date();
-          return date.getMonth() === now.getMonth() && date.getFullYear() === now.getFullYear();
-        }).length;
-
-        setStats({ totalTranscriptions, totalMinutes, thisMonth });
+        setStats({
+          totalTranscriptions: summary.transcription_count,
+          totalMinutes: summary.minutes,
+          thisMonth: summary.this_month.transcription_count,
+        });
       } catch (error) {
         console.error('Failed to fetch dashboard data:', error);
       } finally {
@@ -102,7 +99,7 @@ const Dashboard: React.FC = () => {
             </div>
             <div className="ml-4">
               <p className="text-sm font-medium text-gray-600">Total Minutes</p>
-              <p className="text-2xl font-bold text-gray-900">{Math.round(stats.totalMinutes / 60)}</p>
+              <p className="text-2xl font-bold text-gray-900">{Math.round(stats.totalMinutes)}</p>
             </div>
           </div>
         </div>
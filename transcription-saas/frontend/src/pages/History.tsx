@@ -1,17 +1,20 @@
 import React, { useState, useEffect } from 'react';
-import { transcriptionService, Transcription } from '../services/transcriptionService';
+import { transcriptionService, Transcription, TranscriptionSearchHit } from '../services/transcriptionService';
+
+const SEARCH_DEBOUNCE_MS = 300;
 
 const History: React.FC = () => {
   const [transcriptions, setTranscriptions] = useState<Transcription[]>([]);
   const [loading, setLoading] = useState(true);
   const [selectedTranscription, setSelectedTranscription] = useState<Transcription | null>(null);
   const [searchTerm, setSearchTerm] = useState('');
+  const [searchHits, setSearchHits] = useState<TranscriptionSearchHit[] | null>(null);
 
   useEffect(() => {
     const fetchTranscriptions = async () => {
       try {
-        const data = await transcriptionService.getTranscriptions();
-        setTranscriptions(data);
+        const page = await transcriptionService.getTranscriptions();
+        setTranscriptions(page.items);
       } catch (error) {
         console.error('Failed to fetch transcriptions:', error);
       } finally {
@@ -22,10 +25,40 @@ const History: React.FC = () => {
     fetchTranscriptions();
   }, []);
 
-  const filteredTranscriptions = transcriptions.filter(t =>
-    t.filename.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    t.transcription_text.toLowerCase().includes(searchTerm.toLowerCase())
-  );
+  // Search runs on the server across the whole history, not just the loaded page
+  useEffect(() => {
+    const query = searchTerm.trim();
+    if (!query) {
+      setSearchHits(null);
+      return;
+    }
+
+    const timer = setTimeout(async () => {
+      try {
+        const page = await transcriptionService.searchTranscriptions(query);
+        setSearchHits(page.items);
+      } catch (error) {
+        console.error('Failed to search transcriptions:', error);
+      }
+    }, SEARCH_DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
+  const snippets = new Map((searchHits || []).map(hit => [hit.id, hit.snippet]));
+
+  const filteredTranscriptions: Transcription[] = searchHits
+    ? searchHits.map(hit => ({ ...hit, transcription_text: '' }))
+    : transcriptions;
+
+  // Search hits only carry a snippet, so fetch the full text when needed
+  const loadFull = async (transcription: Transcription) =>
+    snippets.has(transcription.id)
+      ? transcriptionService.getTranscription(transcription.id)
+      : transcription;
+
+  const selectTranscription = async (transcription: Transcription) => {
+    setSelectedTranscription(await loadFull(transcription));
+  };
 
   const formatFileSize = (bytes: number) => {
     if (bytes === 0) return '0 Bytes';
@@ -128,17 +161,24 @@ const History: React.FC = () => {
                     ? 'ring-2 ring-blue-500 bg-blue-50'
                     : 'hover:bg-gray-50'
                 }`}
-                onClick={() => setSelectedTranscription(transcription)}
+                onClick={() => selectTranscription(transcription)}
               >
                 <div className="flex items-start justify-between">
                   <div className="flex-1">
                     <h3 className="text-lg font-medium text-gray-900 mb-2">
                       {transcription.filename}
                     </h3>
-                    <p className="text-sm text-gray-600 mb-3 line-clamp-2">
-                      {transcription.transcription_text.substring(0, 150)}
-                      {transcription.transcription_text.length > 150 && '...'}
-                    </p>
+                    {snippets.has(transcription.id) ? (
+                      <p
+                        className="text-sm text-gray-600 mb-3 line-clamp-2"
+                        dangerouslySetInnerHTML={{ __html: snippets.get(transcription.id) as string }}
+                      />
+                    ) : (
+                      <p className="text-sm text-gray-600 mb-3 line-clamp-2">
+                        {transcription.transcription_text.substring(0, 150)}
+                        {transcription.transcription_text.length > 150 && '...'}
+                      </p>
+                    )}
                     <div className="flex items-center space-x-4 text-xs text-gray-500">
                       <span>{formatFileSize(transcription.file_size)}</span>
                       <span>{formatDuration(transcription.duration || 0)}</span>
@@ -147,9 +187,9 @@ const History: React.FC = () => {
                   </div>
                   <div className="flex space-x-2 ml-4">
                     <button
-                      onClick={(e) => {
+                      onClick={async (e) => {
                         e.stopPropagation();
-                        copyToClipboard(transcription.transcription_text);
+                        copyToClipboard((await loadFull(transcription)).transcription_text);
                       }}
                       className="p-2 text-gray-400 hover:text-gray-600"
                       title="Copy to clipboard"
@@ -159,9 +199,9 @@ const History: React.FC = () => {
                       </svg>
                     </button>
                     <button
-                      onClick={(e) => {
+                      onClick={async (e) => {
                         e.stopPropagation();
-                        downloadTranscription(transcription);
+                        downloadTranscription(await loadFull(transcription));
                       }}
                       className="p-2 text-gray-400 hover:text-gray-600"
                       title="Download"
@@ -1,6 +1,6 @@
 import React, { useState, useCallback } from 'react';
 import { useDropzone } from 'react-dropzone';
-import { transcriptionService } from '../services/transcriptionService';
+import { transcriptionService, JobEvent } from '../services/transcriptionService';
 
 const Transcribe: React.FC = () => {
   const [file, setFile] = useState<File | null>(null);
@@ -8,6 +8,9 @@ const Transcribe: React.FC = () => {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
   const [success, setSuccess] = useState(false);
+  const [jobStatus, setJobStatus] = useState('');
+  const [segments, setSegments] = useState<string[]>([]);
+  const [segmentTotal, setSegmentTotal] = useState(0);
 
   const onDrop = useCallback((acceptedFiles: File[]) => {
     const selectedFile = acceptedFiles[0];
@@ -47,9 +50,25 @@ const Transcribe: React.FC = () => {
 
     setLoading(true);
     setError('');
+    setJobStatus('queued');
+    setSegments([]);
+    setSegmentTotal(0);
+
+    const handleEvent = (event: JobEvent) => {
+      if (event.event === 'segment') {
+        setSegmentTotal(event.total || 0);
+        setSegments((previous) => {
+          const next = [...previous];
+          next[event.index || 0] = event.text || '';
+          return next;
+        });
+      } else {
+        setJobStatus(event.event);
+      }
+    };
 
     try {
-      const result = await transcriptionService.transcribeAudio(file);
+      const result = await transcriptionService.transcribeAudio(file, handleEvent);
       setTranscription(result.transcription_text);
       setSuccess(true);
     } catch (err: any) {
@@ -171,13 +190,22 @@ const Transcribe: React.FC = () => {
               <div className="bg-blue-50 border border-blue-200 rounded-lg p-4">
                 <div className="flex items-center">
                   <div className="animate-spin rounded-full h-6 w-6 border-b-2 border-blue-600 mr-3"></div>
-                  <p className="text-blue-800 font-medium">Transcribing your audio file...</p>
+                  <p className="text-blue-800 font-medium">
+                    {jobStatus === 'queued' ? 'Waiting for a worker...' : 'Transcribing your audio file...'}
+                    {segmentTotal > 0 && ` (${segments.filter((s) => s !== undefined).length} of ${segmentTotal} parts)`}
+                  </p>
                 </div>
                 <div className="mt-2">
                   <div className="bg-blue-200 rounded-full h-2">
-                    <div className="bg-blue-600 h-2 rounded-full animate-pulse" style={{ width: '60%' }}></div>
+                    <div
+                      className="bg-blue-600 h-2 rounded-full animate-pulse"
+                      style={{ width: segmentTotal > 0 ? `${(100 * segments.filter((s) => s !== undefined).length) / segmentTotal}%` : '60%' }}
+                    ></div>
                   </div>
                 </div>
+                {segments.length > 0 && (
+                  <p className="mt-3 text-sm text-gray-700 whitespace-pre-wrap">{segments.filter((s) => s !== undefined).join(' ')}</p>
+                )}
               </div>
             </div>
           )}
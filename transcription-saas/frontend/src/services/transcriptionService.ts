@@ -1,4 +1,4 @@
-import api from './authService';
+import api, { API_BASE_URL } from './authService';
 
 export interface Transcription {
   id: number;
@@ -9,6 +9,73 @@ export interface Transcription {
   created_at: string;
 }
 
+export interface TranscriptionPage {
+  items: Transcription[];
+  next_cursor?: string | null;
+}
+
+export interface TranscriptionSearchHit {
+  id: number;
+  filename: string;
+  snippet: string; // HTML-escaped, matches wrapped in <mark>
+  file_size: number;
+  duration?: number;
+  created_at: string;
+  rank: number;
+}
+
+export interface TranscriptionSearchPage {
+  items: TranscriptionSearchHit[];
+  next_offset?: number | null;
+}
+
+export interface TranscriptionJob {
+  id: string;
+  status: 'queued' | 'processing' | 'completed' | 'failed';
+  filename: string;
+  file_size: number;
+  error?: string;
+  created_at: string;
+  started_at?: string;
+  finished_at?: string;
+  transcription?: Transcription;
+}
+
+export interface StatsPeriod {
+  period: string; // YYYY-MM
+  transcription_count: number;
+  minutes: number;
+  total_bytes: number;
+}
+
+export interface Stats {
+  transcription_count: number;
+  minutes: number;
+  total_bytes: number;
+  this_month: StatsPeriod;
+  months: StatsPeriod[];
+}
+
+// Sent on /jobs/{id}/events; 'segment' carries one finished segment's text
+export interface JobEvent {
+  event: 'queued' | 'processing' | 'segment' | 'completed' | 'failed';
+  index?: number;
+  total?: number;
+  text?: string;
+  transcription_id?: number;
+  error?: string;
+}
+
+// A resumable upload; chunks are sent at `offset` until it reaches `size`
+export interface UploadSession {
+  id: string;
+  filename: string;
+  size: number;
+  offset: number;
+  status: 'uploading' | 'finalizing';
+  expires_at: string;
+}
+
 export interface APIKey {
   id: number;
   name: string;
@@ -16,8 +83,35 @@ export interface APIKey {
   created_at: string;
 }
 
+const JOB_POLL_INTERVAL_MS = 2000;
+
+// Files above this size go through /uploads in chunks, so a dropped
+// connection only costs the chunk in flight
+const RESUMABLE_THRESHOLD_BYTES = 8 * 1024 * 1024;
+const UPLOAD_CHUNK_BYTES = 4 * 1024 * 1024;
+const UPLOAD_MAX_RETRIES = 5;
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Upload-Checksum value for a chunk; crypto.subtle only exists on HTTPS
+// and localhost, elsewhere chunks go without one
+const chunkChecksum = async (chunk: Blob): Promise<string | undefined> => {
+  if (!window.crypto || !window.crypto.subtle) {
+    return undefined;
+  }
+  const digest = new Uint8Array(await window.crypto.subtle.digest('SHA-256', await chunk.arrayBuffer()));
+  let binary = '';
+  for (let i = 0; i < digest.length; i++) {
+    binary += String.fromCharCode(digest[i]);
+  }
+  return `sha256 ${btoa(binary)}`;
+};
+
 export const transcriptionService = {
-  async transcribeAudio(file: File): Promise<Transcription> {
+  async submitTranscription(file: File): Promise<TranscriptionJob> {
+    if (file.size > RESUMABLE_THRESHOLD_BYTES) {
+      return this.uploadResumable(file);
+    }
     const formData = new FormData();
     formData.append('file', file);
     
@@ -29,8 +123,127 @@ export const transcriptionService = {
     return response.data;
   },
 
-  async getTranscriptions(skip = 0, limit = 100): Promise<Transcription[]> {
-    const response = await api.get(`/transcriptions?skip=${skip}&limit=${limit}`);
+  async uploadResumable(file: File): Promise<TranscriptionJob> {
+    const created = await api.post('/uploads', {
+      filename: file.name,
+      size: file.size,
+      content_type: file.type,
+    });
+    let upload: UploadSession = created.data;
+    let failures = 0;
+    while (upload.offset < upload.size) {
+      const chunk = file.slice(upload.offset, upload.offset + UPLOAD_CHUNK_BYTES);
+      try {
+        const checksum = await chunkChecksum(chunk);
+        const response = await api.patch(`/uploads/${upload.id}`, chunk, {
+          headers: {
+            'Content-Type': 'application/offset+octet-stream',
+            'Upload-Offset': String(upload.offset),
+            ...(checksum ? { 'Upload-Checksum': checksum } : {}),
+          },
+        });
+        upload = response.data;
+        failures = 0;
+      } catch (error) {
+        failures += 1;
+        if (failures > UPLOAD_MAX_RETRIES) {
+          throw error;
+        }
+        await sleep(1000 * 2 ** failures);
+        // Carry on from what the server has; the failed chunk may have landed
+        try {
+          upload = (await api.get(`/uploads/${upload.id}`)).data;
+        } catch {
+          // Still offline; the next attempt checks again
+        }
+      }
+    }
+    const response = await api.post(`/uploads/${upload.id}/finalize`);
+    return response.data;
+  },
+
+  async getJob(jobId: string): Promise<TranscriptionJob> {
+    const response = await api.get(`/jobs/${jobId}`);
+    return response.data;
+  },
+
+  // Reads one connection of the job's event stream until the server ends
+  // it. EventSource can't send the Authorization header, hence fetch.
+  async streamJobEvents(jobId: string, onEvent: (event: JobEvent) => void): Promise<void> {
+    const token = localStorage.getItem('token');
+    const response = await fetch(`${API_BASE_URL}/jobs/${jobId}/events`, {
+      headers: token ? { Authorization: `Bearer ${token}` } : {},
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`Event stream failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) {
+        return;
+      }
+      buffer += decoder.decode(value, { stream: true });
+      let end = buffer.indexOf('\n\n');
+      while (end !== -1) {
+        const data = buffer
+          .slice(0, end)
+          .split('\n')
+          .filter((line) => line.startsWith('data: '))
+          .map((line) => line.slice(6))
+          .join('\n');
+        buffer = buffer.slice(end + 2);
+        if (data) {
+          onEvent(JSON.parse(data));
+        }
+        end = buffer.indexOf('\n\n');
+      }
+    }
+  },
+
+  async transcribeAudio(file: File, onEvent?: (event: JobEvent) => void): Promise<Transcription> {
+    let job = await this.submitTranscription(file);
+    while (job.status === 'queued' || job.status === 'processing') {
+      try {
+        // Returns when the job ends or the server closes the stream
+        await this.streamJobEvents(job.id, onEvent || (() => {}));
+      } catch {
+        // No streaming (old proxy, too many streams): poll instead
+        await sleep(JOB_POLL_INTERVAL_MS);
+      }
+      job = await this.getJob(job.id);
+    }
+    if (job.status === 'failed' || !job.transcription) {
+      throw { response: { data: { detail: job.error || 'Transcription failed' } } };
+    }
+    return job.transcription;
+  },
+
+  async getTranscriptions(limit = 100, cursor?: string): Promise<TranscriptionPage> {
+    const params = new URLSearchParams({ limit: String(limit) });
+    if (cursor) {
+      params.set('cursor', cursor);
+    }
+    const response = await api.get(`/transcriptions?${params.toString()}`);
+    return response.data;
+  },
+
+  async searchTranscriptions(q: string, limit = 20, offset = 0): Promise<TranscriptionSearchPage> {
+    const params = new URLSearchParams({ q, limit: String(limit), offset: String(offset) });
+    const response = await api.get(`/transcriptions/search?${params.toString()}`);
+    return response.data;
+  },
+
+  async getStats(): Promise<Stats> {
+    const response = await api.get('/stats');
+    return response.data;
+  },
+
+  async getTranscription(id: number): Promise<Transcription> {
+    const response = await api.get(`/transcriptions/${id}`);
     return response.data;
   },
 